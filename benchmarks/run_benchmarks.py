@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+Воспроизводимые бенчмарки на синтетических данных (без GPU и без скачивания весов)
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import contextlib
+import importlib
+import io
+import json
+import multiprocessing
+import platform
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from benchmarks.synthetic_data import SCALES, generate_dataset, random_weights_model
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(BENCHMARKS_DIR, 'baseline.json')
+DEFAULT_OUTPUT = os.path.join(BENCHMARKS_DIR, 'latest.json')
+# Абсолютные изменения меньше этого считаются шумом (на порядок ниже самых быстрых замеров)
+NOISE_FLOOR = {'s': 0.0005}
+# Быстрые замеры повторяются, пока не наберется столько секунд, и усредняются по вызовам
+MIN_MEASURE_S = 0.2
+# Параметры прогона, без совпадения которых сравнение с базой не имеет смысла
+COMPARED_SETTINGS = ('scale', 'imgsz', 'batch_size', 'repeat', 'threads')
+# Отличия, о которых только предупреждаем: потоки torch уже зафиксированы параметром threads
+WARNED_SETTINGS = ('cpu_count', 'machine')
+DEFAULT_SETTINGS = {'scale': 'small', 'imgsz': 320, 'batch_size': 8, 'repeat': 3, 'threads': None}
+
+def _quiet(fn, *args, **kwargs):
+    """Вызов без вывода в stdout, чтобы отчеты функций проекта не смешивались с таблицей"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        return fn(*args, **kwargs)
+
+def _timed(fn, repeat=3, setup=None, min_time=0.0):
+    """Лучшее время одного вызова из repeat замеров (устойчивее медианы к фоновой нагрузке);
+    setup выполняется перед каждым вызовом вне замера. С min_time замер повторяет вызов,
+    пока суммарное время не достигнет min_time (как timeit.autorange), - иначе
+    миллисекундные вызовы тонут в шуме таймера и планировщика"""
+    times = []
+    for _ in range(repeat):
+        elapsed, calls = 0.0, 0
+        while calls == 0 or elapsed < min_time:
+            if setup is not None:
+                setup()
+            start = time.perf_counter()
+            fn()
+            elapsed += time.perf_counter() - start
+            calls += 1
+        times.append(elapsed / calls)
+    return min(times)
+
+def _result(value, unit, higher_is_better=False):
+    return {'value': round(value, 6), 'unit': unit, 'higher_is_better': higher_is_better}
+
+def bench_label_parsing(root, repeat):
+    """analyze_current_balance: холодный (без индекса разметки) и теплый (индекс актуален) запуск"""
+    from utils.data_balancer import DataBalancer
+    from utils.label_index import index_path_for
+
+    balancer = DataBalancer(root)
+
+    def drop_indexes():
+        for split in ('train', 'val', 'test'):
+            path = index_path_for(os.path.join(root, 'labels', split))
+            if os.path.exists(path):
+                os.remove(path)
+
+    cold = _timed(lambda: _quiet(balancer.analyze_current_balance), repeat, setup=drop_indexes,
+                  min_time=MIN_MEASURE_S)
+    warm = _timed(lambda: _quiet(balancer.analyze_current_balance), repeat, min_time=MIN_MEASURE_S)
+    return {'label_parsing_cold_s': _result(cold, 's'), 'label_parsing_warm_s': _result(warm, 's')}
+
+def bench_dataset_quality(root, repeat):
+    from utils.data_balancer import check_dataset_quality
+
+    elapsed = _timed(lambda: _quiet(check_dataset_quality, root), repeat, min_time=MIN_MEASURE_S)
+    return {'dataset_quality_s': _result(elapsed, 's')}
+
+def bench_inference(root, model_path, workdir, imgsz, batch_size, repeat):
+    """predict_image по одному снимку против predict_batch поштучно и батчами, снимков/с"""
+    ChestXRayDetector = importlib.import_module('scripts.04_predict').ChestXRayDetector
+
+    detector = ChestXRayDetector(model_path, imgsz=imgsz)
+    # predict_image сохраняет размеченные снимки - направляем их в рабочую папку бенчмарка
+    detector.model.overrides.update(project=os.path.join(workdir, 'runs'), name='predict', exist_ok=True)
+    images_dir = os.path.join(root, 'images', 'val')
+    images = sorted(os.path.join(images_dir, f) for f in os.listdir(images_dir))
+    _quiet(detector.predict_image, images[0])  # прогрев модели
+
+    results = {}
+    elapsed = _timed(lambda: [_quiet(detector.predict_image, p) for p in images], repeat)
+    results['predict_image_ips'] = _result(len(images) / elapsed, 'img/s', True)
+    for size in (1, batch_size):
+        output_dir = os.path.join(workdir, f"predictions_b{size}")
+        elapsed = _timed(lambda: _quiet(detector.predict_batch, images_dir, output_dir, batch_size=size), repeat)
+        results[f"predict_batch_b{size}_ips"] = _result(len(images) / elapsed, 'img/s', True)
+    return results
+
+def bench_training(data_yaml, model_path, imgsz, batch, threads, probe_batches):
+    """Время шага обучения (forward + backward + шаг оптимизатора) в отдельном процессе"""
+    from utils.training_utils import probe_training_throughput
+
+    train_args = {'imgsz': imgsz, 'device': 'cpu', 'project': os.path.join(os.path.dirname(data_yaml), 'runs')}
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as pool:
+        ips, peak_rss = pool.submit(probe_training_throughput, model_path, data_yaml, train_args, batch, 0,
+                                    threads, probe_batches).result()
+    return {
+        'train_step_s': _result(batch / ips if ips else float('inf'), 's'),
+        'train_ips': _result(ips, 'img/s', True),
+        'train_peak_rss_gb': _result(peak_rss, 'GB'),
+    }
+
+def run_benchmarks(scale='small', imgsz=320, batch_size=8, repeat=3, threads=None, only=None,
+                   workdir=None, seed=0):
+    """Все бенчмарки на синтетическом датасете: {'meta': ..., 'results': {имя: {'value', 'unit', ...}}}"""
+    import torch
+
+    spec = SCALES[scale]
+    workdir = workdir or os.path.join(tempfile.gettempdir(), 'chestxray_benchmarks')
+    root = os.path.join(workdir, f"data_{scale}")
+    threads = threads or os.cpu_count() or 1
+    torch.set_num_threads(threads)
+
+    print(f"🧪 Синтетический датасет {scale}: {spec}")
+    start = time.perf_counter()
+    data_yaml = generate_dataset(root, spec['train'], spec['val'], spec['test'], spec['size'], seed)
+    model_path = random_weights_model(os.path.join(workdir, 'yolov8n_random.pt'), seed=seed)
+    print(f"   готово за {time.perf_counter() - start:.1f} с")
+
+    suites = {
+        'label_parsing': lambda: bench_label_parsing(root, repeat),
+        'dataset_quality': lambda: bench_dataset_quality(root, repeat),
+        'inference': lambda: bench_inference(root, model_path, workdir, imgsz, batch_size, repeat),
+        'training': lambda: bench_training(data_yaml, model_path, imgsz, batch_size, threads, probe_batches=6),
+    }
+    results = {}
+    for name, suite in suites.items():
+        if only and name not in only:
+            continue
+        print(f"⏱️ {name}...")
+        results.update(suite())
+
+    import ultralytics
+    meta = {
+        'scale': scale, 'imgsz': imgsz, 'batch_size': batch_size, 'repeat': repeat, 'threads': threads,
+        'seed': seed, 'dataset': spec, 'python': platform.python_version(), 'torch': torch.__version__,
+        'ultralytics': ultralytics.__version__, 'cpu_count': os.cpu_count(), 'machine': platform.machine(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+    return {'meta': meta, 'results': results}
+
+def compare_with_baseline(report, baseline, threshold=0.2):
+    """Сравнение с базовыми замерами: [(имя, текущее, базовое, изменение, статус)].
+
+    Регрессия - ухудшение больше чем на threshold (доля) в сторону, обратную
+    higher_is_better; изменения в пределах NOISE_FLOOR единиц замера не учитываются.
+    """
+    rows = []
+    for name, current in report['results'].items():
+        base = baseline.get('results', {}).get(name)
+        if base is None or not base['value']:
+            rows.append((name, current['value'], None, None, 'new'))
+            continue
+        change = current['value'] / base['value'] - 1
+        worse = -change if current['higher_is_better'] else change
+        if abs(current['value'] - base['value']) < NOISE_FLOOR.get(current['unit'], 0):
+            worse = 0.0
+        status = 'regression' if worse > threshold else 'improved' if worse < -threshold else 'ok'
+        rows.append((name, current['value'], base['value'], change, status))
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline CPU benchmarks on synthetic data with baseline comparison')
+    # Не заданные явно параметры берутся из базы, чтобы прогон по умолчанию был с ней сравним
+    parser.add_argument('--scale', type=str, choices=sorted(SCALES),
+                        help='Synthetic dataset size (default: from baseline, else small)')
+    parser.add_argument('--imgsz', type=int, help='Inference/training image size (default: from baseline, else 320)')
+    parser.add_argument('--batch-size', type=int,
+                        help='Batch for predict_batch and training step (default: from baseline, else 8)')
+    parser.add_argument('--repeat', type=int,
+                        help='Runs per measurement, best is reported (default: from baseline, else 3)')
+    parser.add_argument('--threads', type=int, help='Torch threads (default: from baseline, else all CPUs)')
+    parser.add_argument('--only', type=str, nargs='+',
+                        choices=['label_parsing', 'dataset_quality', 'inference', 'training'], help='Subset to run')
+    parser.add_argument('--workdir', type=str, help='Where synthetic data and the model are kept between runs')
+    parser.add_argument('--output', type=str, default=DEFAULT_OUTPUT, help='Results JSON')
+    parser.add_argument('--baseline', type=str, default=DEFAULT_BASELINE, help='Baseline JSON to compare against')
+    parser.add_argument('--threshold', type=float, default=0.2, help='Allowed relative slowdown before failing')
+    parser.add_argument('--update-baseline', action='store_true', help='Write results as the new baseline')
+    parser.add_argument('--clean', action='store_true', help='Regenerate synthetic data and model')
+    args = parser.parse_args()
+
+    if args.clean and args.workdir and os.path.exists(args.workdir):
+        shutil.rmtree(args.workdir)
+    elif args.clean:
+        shutil.rmtree(os.path.join(tempfile.gettempdir(), 'chestxray_benchmarks'), ignore_errors=True)
+
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+    settings = {}
+    for key, default in DEFAULT_SETTINGS.items():
+        value = getattr(args, key)
+        if value is None and baseline is not None and not args.update_baseline:
+            value = baseline['meta'].get(key)
+        settings[key] = default if value is None else value
+    if baseline is not None and not args.update_baseline:
+        print("⚙️ Параметры прогона: " + ', '.join(f"{k}={v}" for k, v in settings.items()))
+
+    report = run_benchmarks(settings['scale'], settings['imgsz'], settings['batch_size'], settings['repeat'],
+                            settings['threads'], args.only, args.workdir)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"💾 Результаты: {args.output}")
+
+    if args.update_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"📌 Базовые замеры обновлены: {args.baseline}")
+        return
+
+    if baseline is None:
+        print("⚠️ Базовых замеров нет - запустите с --update-baseline")
+        return
+    differing = [f"{k}: {baseline['meta'].get(k)} -> {report['meta'][k]}" for k in COMPARED_SETTINGS
+                 if baseline['meta'].get(k) != report['meta'][k]]
+    if differing:
+        print(f"⚠️ Базовые замеры сняты с другими параметрами ({'; '.join(differing)}) - сравнение пропущено")
+        return
+    host = [f"{k}: {baseline['meta'].get(k)} -> {report['meta'][k]}" for k in WARNED_SETTINGS
+            if baseline['meta'].get(k) != report['meta'][k]]
+    if host:
+        print(f"⚠️ База снята на другой машине ({'; '.join(host)}) - сравниваем при тех же потоках torch")
+
+    rows = compare_with_baseline(report, baseline, args.threshold)
+    print(f"\n📊 СРАВНЕНИЕ С БАЗОЙ (порог {args.threshold:.0%}):")
+    icons = {'ok': '✅', 'improved': '🚀', 'regression': '❌', 'new': '🆕'}
+    for name, value, base, change, status in rows:
+        base_text = f"{base:.4g}" if base is not None else '-'
+        change_text = f"{change:+.1%}" if change is not None else ''
+        print(f"   {icons[status]} {name:<24} {value:>10.4g} (база {base_text}) {change_text}")
+    regressions = [row[0] for row in rows if row[-1] == 'regression']
+    if regressions:
+        print(f"❌ Регрессии: {', '.join(regressions)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
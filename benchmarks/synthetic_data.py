@@ -0,0 +1,102 @@
+
+import os
+import cv2
+import numpy as np
+import torch
+import yaml
+
+CLASS_NAMES = {0: 'clavicle_fracture', 1: 'foreign_body_bronchus', 2: 'normal'}
+# Доли классов примерно как в реальном датасете: норма преобладает
+CLASS_PROBS = (0.3, 0.15, 0.55)
+
+# Масштабы синтетического датасета: снимков в train/val/test и размер снимка
+SCALES = {
+    'small': {'train': 64, 'val': 16, 'test': 16, 'size': 512},
+    'medium': {'train': 400, 'val': 100, 'test': 100, 'size': 1024},
+    'large': {'train': 2000, 'val': 400, 'test': 400, 'size': 1024},
+}
+
+def synthetic_radiograph(rng, size):
+    """Снимок, похожий на рентген грудной клетки: торс, темные легкие, ребра, позвоночник и шум"""
+    yy, xx = np.mgrid[0:size, 0:size].astype(np.float32) / size
+    image = 0.15 + 0.1 * yy
+    torso = ((xx - 0.5) / 0.42) ** 2 + ((yy - 0.55) / 0.5) ** 2 < 1
+    image = image + 0.35 * torso
+    for cx in (0.32 + rng.uniform(-0.02, 0.02), 0.68 + rng.uniform(-0.02, 0.02)):
+        lung = ((xx - cx) / 0.15) ** 2 + ((yy - 0.5) / 0.3) ** 2 < 1
+        image = image - 0.25 * lung
+    ribs = 0.5 + 0.5 * np.sin((yy * 14 + 3 * (xx - 0.5) ** 2) * 2 * np.pi + rng.uniform(0, np.pi))
+    image = image + 0.08 * ribs * torso
+    image = image + 0.3 * (np.abs(xx - 0.5) < 0.03) * torso
+    image = cv2.GaussianBlur(image, (0, 0), size / 256)
+    image = image + rng.normal(0, 0.03, image.shape).astype(np.float32)
+    return np.clip(image * 255, 0, 255).astype(np.uint8)
+
+def _draw_finding(rng, image, class_id):
+    """Находка класса на снимке и ее рамка YOLO (cx, cy, w, h в долях)"""
+    size = image.shape[0]
+    if class_id == 0:
+        # Ключица с разрывом: яркая линия в верхней части
+        side = rng.choice([0.3, 0.7])
+        x0, x1 = int((side - 0.12) * size), int((side + 0.12) * size)
+        y = int(rng.uniform(0.18, 0.25) * size)
+        gap = int(rng.uniform(0.4, 0.6) * (x1 - x0)) + x0
+        cv2.line(image, (x0, y), (gap - size // 100, y + size // 60), 230, max(2, size // 80))
+        cv2.line(image, (gap + size // 100, y + size // 50), (x1, y), 230, max(2, size // 80))
+        return (side, (y + size // 100) / size, 0.26, 0.08)
+    if class_id == 1:
+        # Инородное тело: небольшой яркий объект в проекции легкого
+        cx, cy = rng.uniform(0.3, 0.7), rng.uniform(0.35, 0.6)
+        r = int(rng.uniform(0.015, 0.03) * size)
+        cv2.circle(image, (int(cx * size), int(cy * size)), r, 250, -1)
+        return (cx, cy, 2.4 * r / size, 2.4 * r / size)
+    return (0.5, 0.5, 0.7, 0.65)
+
+def generate_dataset(root, train=64, val=16, test=16, size=512, seed=0):
+    """Синтетический датасет YOLO (images/, labels/, data.yaml) в структуре проекта.
+
+    Снимки генерируются детерминированно по seed; существующий датасет с тем же
+    описанием (dataset.yaml с параметрами) не пересоздается.
+    """
+    spec = {'train': train, 'val': val, 'test': test, 'size': size, 'seed': seed}
+    spec_path = os.path.join(root, 'dataset.yaml')
+    if os.path.exists(spec_path):
+        with open(spec_path, 'r') as f:
+            if yaml.safe_load(f) == spec:
+                return os.path.join(root, 'data.yaml')
+
+    rng = np.random.default_rng(seed)
+    for split, count in (('train', train), ('val', val), ('test', test)):
+        images_dir = os.path.join(root, 'images', split)
+        labels_dir = os.path.join(root, 'labels', split)
+        os.makedirs(images_dir, exist_ok=True)
+        os.makedirs(labels_dir, exist_ok=True)
+        for i in range(count):
+            image = synthetic_radiograph(rng, size)
+            class_id = int(rng.choice(len(CLASS_PROBS), p=CLASS_PROBS))
+            box = _draw_finding(rng, image, class_id)
+            name = f"synthetic_{split}_{i:05d}"
+            cv2.imwrite(os.path.join(images_dir, name + '.png'), image)
+            with open(os.path.join(labels_dir, name + '.txt'), 'w') as f:
+                f.write(f"{class_id} {box[0]:.6f} {box[1]:.6f} {box[2]:.6f} {box[3]:.6f}\n")
+
+    data_yaml = os.path.join(root, 'data.yaml')
+    with open(data_yaml, 'w') as f:
+        yaml.dump({'path': os.path.abspath(root), 'train': 'images/train', 'val': 'images/val',
+                   'test': 'images/test', 'nc': len(CLASS_NAMES), 'names': list(CLASS_NAMES.values())},
+                  f, default_flow_style=False, sort_keys=False)
+    with open(spec_path, 'w') as f:
+        yaml.dump(spec, f)
+    return data_yaml
+
+def random_weights_model(path, model_yaml='yolov8n.yaml', seed=0):
+    """Модель YOLO со случайными весами из yaml-описания - без скачивания весов"""
+    from ultralytics.nn.tasks import DetectionModel
+
+    if not os.path.exists(path):
+        torch.manual_seed(seed)
+        model = DetectionModel(model_yaml, nc=len(CLASS_NAMES), verbose=False)
+        model.names = dict(CLASS_NAMES)
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        torch.save({'model': model, 'train_args': {}}, path)
+    return path
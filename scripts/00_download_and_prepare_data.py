@@ -3,12 +3,32 @@
 Скачивание и подготовка данных из NIH ChestX-ray датасета
 """
 
+import sys
 import os
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+import argparse
 import pandas as pd
-import requests
-import zipfile
-from tqdm import tqdm
 import numpy as np
+from utils.download_utils import make_session, download_file, download_files, extract_from_archives
+from utils.split_utils import SPLIT_NAMES, stratified_group_split
+from utils.metadata_store import MetadataStore
+
+# Архивы снимков NIH ChestX-ray14 (batch_download_zips.py из официального релиза)
+NIH_IMAGE_URLS = [
+    "https://nihcc.box.com/shared/static/vfk49d74nhbxq3nqjg0900w5nvkorp5c.gz",
+    "https://nihcc.box.com/shared/static/i28rlmbvmfjbl8p2n3ril0pptcmcu9d1.gz",
+    "https://nihcc.box.com/shared/static/f1t00wrtdk94satdfb9olcolqx20z2jp.gz",
+    "https://nihcc.box.com/shared/static/0aowwzs5lhjrceb3qp67ahp0rd1l1etg.gz",
+    "https://nihcc.box.com/shared/static/v5e3goj22zr6h8tzualxfsqlqaygfbsn.gz",
+    "https://nihcc.box.com/shared/static/asi7ikud9jwnkrnkj99jnpfkjdes7l6l.gz",
+    "https://nihcc.box.com/shared/static/jn1b4mw4n6lnh74ovmcjb8y48h8xj07n.gz",
+    "https://nihcc.box.com/shared/static/tvpxmn7qyrgl0w8wfh9kqfjskv6nmm1j.gz",
+    "https://nihcc.box.com/shared/static/upyy3ml7qdumlgk2rfcvlb9k6gvqq2pj.gz",
+    "https://nihcc.box.com/shared/static/l6nilvfa9cg3s28tqv1qc1olm3gnz54p.gz",
+    "https://nihcc.box.com/shared/static/hhq8fkdgvcari67vfhs7ppg2w6ni4jze.gz",
+    "https://nihcc.box.com/shared/static/ioqwiy20ihqwyr8pf4c24eazhh281pbu.gz",
+]
 
 class NIHDataPreparer:
     def __init__(self, data_dir="./data"):
@@ -17,50 +37,35 @@ class NIHDataPreparer:
         self.labels_dir = os.path.join(data_dir, "labels")
         os.makedirs(self.images_dir, exist_ok=True)
         os.makedirs(self.labels_dir, exist_ok=True)
+        self.session = make_session()
     
-    def download_nih_dataset(self):
-        """Скачивание NIH ChestX-ray датасета"""
+    def download_nih_dataset(self, urls=None, workers=4, manifest_path=None, session=None):
+        """Скачивание NIH ChestX-ray датасета (12 архивов параллельно, с докачкой)
+
+        urls - {имя файла: url}, по умолчанию архивы NIH; manifest_path - контрольные
+        суммы в формате sha256sum (по умолчанию data/nih_checksums.sha256).
+        """
         print("📥 Скачиваем NIH ChestX-ray датасет...")
         
-        # URLs для скачивания (пример - нужно актуальные)
-        nih_urls = [
-            "https://nihcc.box.com/shared/static/vfk49d74nhbxq3nqjg0900w5nvkorp5c.gz",
-            # Добавьте остальные части датасета
-        ]
-        
-        for i, url in enumerate(nih_urls):
-            filename = f"images_{i+1:02d}.gz"
-            filepath = os.path.join(self.images_dir, filename)
-            
-            if not os.path.exists(filepath):
-                print(f"Скачиваем {filename}...")
-                # Реализация скачивания с прогресс-баром
-                self._download_file(url, filepath)
+        urls = urls or {f"images_{i + 1:02d}.tar.gz": url for i, url in enumerate(NIH_IMAGE_URLS)}
+        manifest_path = manifest_path or os.path.join(self.data_dir, 'nih_checksums.sha256')
+        session = session or self.session
+        return download_files(urls, self.images_dir, workers=workers, manifest_path=manifest_path, session=session)
     
-    def _download_file(self, url, filepath):
-        """Вспомогательная функция для скачивания с прогресс-баром"""
-        response = requests.get(url, stream=True)
-        total_size = int(response.headers.get('content-length', 0))
-        
-        with open(filepath, 'wb') as file, tqdm(
-            desc=os.path.basename(filepath),
-            total=total_size,
-            unit='iB',
-            unit_scale=True,
-            unit_divisor=1024,
-        ) as bar:
-            for data in response.iter_content(chunk_size=1024):
-                size = file.write(data)
-                bar.update(size)
+    def _download_file(self, url, filepath, expected_sha256=None):
+        """Вспомогательная функция для скачивания с прогресс-баром и докачкой"""
+        return download_file(self.session, url, filepath, expected_sha256)
     
     def load_and_filter_metadata(self, csv_path):
         """Загрузка и фильтрация метаданных"""
         print("📊 Загружаем и фильтруем метаданные...")
         
-        df = pd.read_csv(csv_path)
+        # CSV разбирается один раз, дальше читается колоночный кэш (пересобирается при изменении CSV)
+        self.metadata = MetadataStore(csv_path)
+        df = self.metadata.df
         
         # Фильтруем нормальные снимки
-        normal_images = df[df['Finding Labels'] == 'No Finding']
+        normal_images = self.metadata.query(no_finding=True)
         
         print(f"📈 Статистика датасета NIH:")
         print(f"   Всего снимков: {len(df)}")
@@ -96,6 +101,41 @@ class NIHDataPreparer:
         
         return selected_normal, selected_clavicle, selected_foreign_body
     
+    def extract_selected_images(self, selected, train_ratio=0.7, val_ratio=0.15, urls=None, workers=4,
+                                session=None, seed=42):
+        """Потоковое извлечение только отобранных снимков прямо в структуру сплитов YOLO.
+
+        selected - датафреймы по классам (результат create_balanced_dataset) со столбцом
+        'Image Index'. Снимки распределяются по сплитам со стратификацией по классу и
+        группировкой по Patient ID, затем вынимаются из архивов NIH во время скачивания -
+        архивы целиком на диск не пишутся.
+        """
+        frames = [frame for frame in selected if len(frame)]
+        if not frames:
+            print("⚠️ Нет отобранных снимков для извлечения")
+            return None
+        
+        selection = pd.concat(frames, ignore_index=True)
+        presence = np.zeros((len(selection), len(frames)), bool)
+        presence[np.arange(len(selection)), np.repeat(np.arange(len(frames)), [len(f) for f in frames])] = True
+        groups = selection['Patient ID'].to_numpy() if 'Patient ID' in selection else None
+        ratios = (train_ratio, val_ratio, 1 - train_ratio - val_ratio)
+        selection['split'] = np.array(SPLIT_NAMES)[stratified_group_split(presence, groups, ratios, seed)]
+        
+        self.prepare_yolo_structure(train_ratio, val_ratio)
+        wanted = {
+            name: os.path.join(self.images_dir, split, name)
+            for name, split in zip(selection['Image Index'], selection['split'])
+        }
+        urls = urls or NIH_IMAGE_URLS
+        print(f"📦 Извлекаем {len(wanted)} снимков из {len(urls)} архивов")
+        extract_from_archives(urls, wanted, workers=workers, session=session or self.session)
+        
+        selection_path = os.path.join(self.data_dir, 'selection.csv')
+        selection[['Image Index', 'split']].to_csv(selection_path, index=False)
+        print(f"📋 Отбор по сплитам: {selection_path}")
+        return selection
+    
     def prepare_yolo_structure(self, train_ratio=0.7, val_ratio=0.15):
         """Подготовка структуры папок в YOLO формате"""
         
@@ -113,10 +153,19 @@ class NIHDataPreparer:
         return splits
 
 def main():
+    parser = argparse.ArgumentParser(description='Download and prepare NIH ChestX-ray data')
+    parser.add_argument('--download', action='store_true', help='Download the 12 NIH image archives')
+    parser.add_argument('--workers', type=int, default=4, help='Concurrent downloads')
+    parser.add_argument('--checksums', type=str, help='sha256sum-style manifest (default: data/nih_checksums.sha256)')
+    parser.add_argument('--extract', action='store_true',
+                        help='Stream-extract only the selected images into data/images/<split> while downloading')
+    args = parser.parse_args()
+    
     preparer = NIHDataPreparer()
     
     # 1. Скачиваем датасет (если нужно)
-    # preparer.download_nih_dataset()
+    if args.download:
+        preparer.download_nih_dataset(workers=args.workers, manifest_path=args.checksums)
     
     # 2. Загружаем метаданные
     try:
@@ -132,7 +181,13 @@ def main():
         # )
         
         # 5. Подготавливаем структуру
-        preparer.prepare_yolo_structure()
+        if args.extract:
+            # Без своих данных с патологиями извлекаем только отобранные нормальные снимки
+            no_pathologies = df.iloc[0:0]
+            selected = preparer.create_balanced_dataset(normal_images, no_pathologies, no_pathologies)
+            preparer.extract_selected_images(selected, workers=args.workers)
+        else:
+            preparer.prepare_yolo_structure()
         
         print("🎉 Подготовка данных завершена!")
         
@@ -7,16 +7,24 @@ import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 
+import argparse
 from utils.data_utils import check_dataset_balance, analyze_imbalance_ratio, setup_dataset_structure
 from utils.data_balancer import DataBalancer, check_dataset_quality
 from utils.imbalance_utils import ImbalanceHandler
+from utils.label_index import load_label_index
 
 def main():
+    parser = argparse.ArgumentParser(description='Analyze class balance and dataset integrity')
+    parser.add_argument('--data-dir', type=str, default='./data', help='Dataset root with images/ and labels/')
+    parser.add_argument('--config', type=str, default='configs/clavicle_config.yaml',
+                        help='Config used to write data.yaml')
+    args = parser.parse_args()
+    
     print("🔍 РАСШИРЕННЫЙ АНАЛИЗ ДАННЫХ")
     print("=" * 50)
     
     # 1. Инициализация балансера
-    balancer = DataBalancer('./data')
+    balancer = DataBalancer(args.data_dir)
     
     # 2. Анализ текущего баланса
     current_counts = balancer.analyze_current_balance()
@@ -25,21 +33,18 @@ def main():
     balancer.recommend_actions(current_counts)
     
     # 4. Проверка качества датасета
-    is_quality_ok = check_dataset_quality('./data')
+    is_quality_ok = check_dataset_quality(args.data_dir)
     
     # 5. Традиционный анализ баланса (если есть данные)
-    labels_path = './data/labels/train'
+    labels_path = os.path.join(args.data_dir, 'labels', 'train')
     if os.path.exists(labels_path):
-        label_files = [f for f in os.listdir(labels_path) if f.endswith('.txt')]
-        if label_files:
-            sample_label_file = os.path.join(labels_path, label_files[0])
-            
-            handler = ImbalanceHandler(sample_label_file)
+        if load_label_index(labels_path).class_counts().sum() > 0:
+            # Весь train-сплит через индекс разметки, а не один файл
+            handler = ImbalanceHandler(labels_path)
             strategy = handler.get_imbalance_strategy()
             weights = handler.calculate_class_weights()
             
-            print(f"
-🎯 СТРАТЕГИЯ ДЛЯ ДИСБАЛАНСА: {strategy}")
+            print(f"\n🎯 СТРАТЕГИЯ ДЛЯ ДИСБАЛАНСА: {strategy}")
             print(f"⚖️ ВЕСА КЛАССОВ: {weights}")
     
     # 6. Создание data.yaml с оптимальными настройками
@@ -54,20 +59,17 @@ def main():
     else:
         strategy = "moderate_imbalance"
     
-    create_data_yaml('configs/clavicle_config.yaml', strategy)
+    create_data_yaml(args.config, strategy)
     
-    print(f"
-📋 ИТОГОВАЯ СТРАТЕГИЯ: {strategy}")
+    print(f"\n📋 ИТОГОВАЯ СТРАТЕГИЯ: {strategy}")
     
     if not is_quality_ok:
-        print("
-💡 РЕКОМЕНДАЦИИ:")
+        print("\n💡 РЕКОМЕНДАЦИИ:")
         print("   1. Исправьте проблемы с соответствием изображений и разметки")
         print("   2. Добавьте данные согласно рекомендованным количествам")
         print("   3. Запустите анализ снова")
     
-    print("
-✅ Анализ данных завершен!")
+    print("\n✅ Анализ данных завершен!")
 
 if __name__ == "__main__":
     main()
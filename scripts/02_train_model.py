@@ -9,12 +9,30 @@ import os
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 
 import argparse
+import torch
 from ultralytics import YOLO
-from utils.training_utils import check_system_resources, get_optimal_config, monitor_training_progress
-from utils.imbalance_utils import ImbalanceHandler
+from utils.training_utils import (check_system_resources, get_optimal_config, monitor_training_progress,
+                                  load_training_config, autotune_training)
+from utils.imbalance_utils import ImbalanceHandler, train_split_paths
+from utils.augmentation_utils import attach_minority_augmentation
+from utils.image_cache import attach_image_cache
 
-def train_model(config_path=None, use_lightweight=False):
-    """Основная функция обучения"""
+def train_model(config_path=None, use_lightweight=False, oversample=False, epoch_length=None, seed=0,
+                augment_minority=False, image_cache=False, autotune=False, data_path='./data/data.yaml',
+                prometheus_path=None):
+    """Основная функция обучения
+
+    Модель и все гиперпараметры берутся из выбранного конфига. autotune=True - перед
+    обучением короткими замерами подбираются batch, workers и потоки torch, результат
+    сохраняется производным конфигом (*_autotuned.yaml), по которому и идет обучение.
+
+    oversample=True - миноритарные классы подаются чаще через взвешенный список снимков
+    (без копирования файлов); epoch_length и seed задают длину и воспроизводимость списка.
+    augment_minority=True - снимки с миноритарными классами аугментируются в памяти
+    во время обучения вместо записи аугментаций на диск.
+    image_cache=True - снимки декодируются один раз в memory-mapped кэш (data/cache)
+    и воркеры даталоадера читают их оттуда без повторного декодирования.
+    """
     
     print("🚀 ЗАПУСК ОБУЧЕНИЯ МОДЕЛИ")
     print("=" * 50)
@@ -29,37 +47,53 @@ def train_model(config_path=None, use_lightweight=False):
         else:
             config_path = get_optimal_config(ram_gb, has_gpu)
     
+    if autotune:
+        print("🎛️ Автотюнинг пропускной способности...")
+        config_path = autotune_training(config_path, data_path, ram_gb, has_gpu)
+    
     print(f"📁 Используется конфиг: {config_path}")
+    model_name, train_args, threads = load_training_config(config_path, has_gpu)
+    if threads:
+        torch.set_num_threads(threads)
     
-    # 3. Анализ дисбаланса
+    # 3. Анализ дисбаланса (по train из выбранного data.yaml)
+    minority_classes = []
+    handler = None
     try:
-        handler = ImbalanceHandler('./data/labels/train/sample.txt')
+        images_dir, image_paths, labels_dir = train_split_paths(data_path)
+        handler = ImbalanceHandler(labels_dir)
         strategy = handler.get_imbalance_strategy()
         print(f"🎯 Стратегия для дисбаланса: {strategy}")
-    except:
+        minority_classes = [c for c, w in handler.calculate_class_weights().items() if w > 1]
+    except Exception:
+        # Явно запрошенный oversampling без анализа невозможен - ошибка не скрывается
+        if oversample:
+            raise
         print("⚠️ Не удалось проанализировать дисбаланс, используем стандартное обучение")
+    if oversample:
+        image_list = handler.apply_oversampling(images_dir, labels_dir, epoch_length=epoch_length, seed=seed,
+                                                image_paths=image_paths,
+                                                output_path=os.path.join(os.path.dirname(data_path),
+                                                                         'train_oversampled.txt'))
+        data_path = handler.create_oversampled_data_yaml(data_path, image_list)
     
     # 4. Загрузка модели
     print("🧠 Загружаем модель YOLO...")
-    model = YOLO('yolov8s.pt')
+    model = YOLO(model_name)
+    if augment_minority and minority_classes:
+        attach_minority_augmentation(model, minority_classes)
+    if image_cache:
+        attach_image_cache(model)
+    telemetry = monitor_training_progress(model, prometheus_path=prometheus_path)
     
     # 5. Обучение
-    print("🎯 Начинаем обучение...")
-    results = model.train(
-        data='./data/data.yaml',
-        epochs=50,
-        imgsz=640,
-        batch=16,
-        workers=4,
-        device=0,
-        patience=10,
-        save=True,
-        exist_ok=True,
-        verbose=True,
-        # YOLO автоматически использует focal loss для детекции!
-    )
+    print(f"🎯 Начинаем обучение: {model_name}, {train_args}")
+    train_args.setdefault('exist_ok', True)
+    results = model.train(data=data_path, **train_args)
+    # YOLO автоматически использует focal loss для детекции!
     
     print("✅ Обучение завершено!")
+    print(f"📈 Телеметрия: {telemetry.jsonl_path}, {telemetry.prometheus_path}")
     print(f"📊 Лучшая модель сохранена в: {model.ckpt_path}")
     
     return results, model
@@ -68,15 +102,28 @@ def main():
     parser = argparse.ArgumentParser(description='Train chest X-ray detection model')
     parser.add_argument('--config', type=str, help='Path to config file')
     parser.add_argument('--lightweight', action='store_true', help='Use lightweight config')
+    parser.add_argument('--oversample', action='store_true', help='Class-balanced image list instead of copying files')
+    parser.add_argument('--epoch-length', type=int, help='Images per epoch in --oversample mode (at least the number of train images)')
+    parser.add_argument('--seed', type=int, default=0, help='Seed for --oversample sampling')
+    parser.add_argument('--augment-minority', action='store_true',
+                        help='Augment minority-class samples in memory during training')
+    parser.add_argument('--autotune', action='store_true',
+                        help='Probe batch/workers/threads for best images/sec and train with the derived config')
+    parser.add_argument('--data', type=str, default='./data/data.yaml', help='Dataset yaml (e.g. a k-fold variant)')
+    parser.add_argument('--prometheus-textfile', type=str,
+                        help='Prometheus textfile for per-epoch telemetry (default: telemetry.prom in the run dir)')
+    parser.add_argument('--image-cache', action='store_true',
+                        help='Decode images once into a memory-mapped cache under data/cache')
     
     args = parser.parse_args()
     
     try:
-        results, model = train_model(args.config, args.lightweight)
+        results, model = train_model(args.config, args.lightweight, args.oversample, args.epoch_length, args.seed,
+                                     args.augment_minority, args.image_cache, args.autotune, args.data,
+                                     args.prometheus_textfile)
         
         # Сохраняем информацию о тренировке
-        print("
-📋 ИНФОРМАЦИЯ О ТРЕНИРОВКЕ:")
+        print("\n📋 ИНФОРМАЦИЯ О ТРЕНИРОВКЕ:")
         print(f"Итоговые метрики: mAP50 = {results.box.map50:.3f}")
         print(f"Модель сохранена: runs/detect/train/weights/best.pt")
         
@@ -9,13 +9,23 @@ import os
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 
 import argparse
+import json
+import time
+import yaml
 from ultralytics import YOLO
+import matplotlib
+matplotlib.use('Agg')  # графики только в файлы - оценка не блокируется окном и работает без дисплея
 import matplotlib.pyplot as plt
 import seaborn as sns
 from sklearn.metrics import classification_report, confusion_matrix
 import numpy as np
+from utils.export_utils import resolve_backend_model
+from utils.file_discovery import iter_images, iter_chunks
+from utils.label_index import parse_label_file
+from utils.cascade import labels_dir_for
+from utils.offline_eval import OfflineEvaluator, save_predictions
 
-def evaluate_model(model_path, data_path):
+def evaluate_model(model_path, data_path, plots_dir='runs/evaluate'):
     """Оценка модели на тестовых данных"""
     
     print("🧪 ОЦЕНКА МОДЕЛИ")
@@ -29,38 +39,183 @@ def evaluate_model(model_path, data_path):
     results = model.val(data=data_path, split='test')
     
     # Вывод результатов
-    print("
-📈 РЕЗУЛЬТАТЫ ОЦЕНКИ:")
+    print("\n📈 РЕЗУЛЬТАТЫ ОЦЕНКИ:")
     print(f"mAP50: {results.box.map50:.4f}")
     print(f"mAP50-95: {results.box.map:.4f}") 
     print(f"Precision: {results.box.mp:.4f}")
     print(f"Recall: {results.box.mr:.4f}")
     
     # Визуализация метрик
-    plot_training_results()
+    plot_training_results(output_dir=plots_dir)
     
     return results
 
-def plot_training_results():
-    """Визуализация результатов обучения"""
+def plot_training_results(results_img='runs/detect/train/results.png', output_dir='runs/evaluate'):
+    """Визуализация результатов обучения (сохраняется в файл)"""
     try:
         # Чтение результатов из YOLO
-        results_img = 'runs/detect/train/results.png'
         if os.path.exists(results_img):
             img = plt.imread(results_img)
-            plt.figure(figsize=(12, 8))
+            fig = plt.figure(figsize=(12, 8))
             plt.imshow(img)
             plt.axis('off')
             plt.title('Графики обучения')
-            plt.show()
+            os.makedirs(output_dir, exist_ok=True)
+            output_path = os.path.join(output_dir, 'training_results.png')
+            fig.savefig(output_path, dpi=100, bbox_inches='tight')
+            plt.close(fig)
+            print(f"🖼️ Графики обучения: {output_path}")
         else:
             print("⚠️ Графики обучения не найдены")
     except Exception as e:
         print(f"⚠️ Не удалось визуализировать графики: {e}")
 
-def test_single_image(model_path, image_path):
+def _split_images(data_path, split):
+    """Снимки сплита из data.yaml: папка или список файлов (как после 09_split_dataset.py)"""
+    with open(data_path, 'r') as f:
+        config = yaml.safe_load(f) or {}
+    root = config.get('path', '')
+    if root and not os.path.isabs(root) and not os.path.exists(root):
+        root = os.path.join(os.path.dirname(os.path.abspath(data_path)), root)
+    entry = os.path.join(root, config[split])
+    names = config.get('names', [])
+    names = [names[i] for i in sorted(names)] if isinstance(names, dict) else list(names)
+    if entry.endswith('.txt'):
+        return list(iter_images(root, file_list=entry)), names
+    return list(iter_images(entry)), names
+
+def dump_predictions(model_path, data_path, split='val', output_path=None, conf_floor=0.001, imgsz=640,
+                     batch_size=16, backend='pytorch', int8=False):
+    """Однократный прогон модели по сплиту с низким порогом уверенности и сохранение
+    предсказаний вместе с разметкой в .npz для OfflineEvaluator"""
+    image_paths, names = _split_images(data_path, split)
+    if not image_paths:
+        print(f"❌ В сплите {split} нет изображений")
+        return None
+    output_path = output_path or os.path.join('runs', 'evaluate', f"predictions_{split}.npz")
+    model = YOLO(resolve_backend_model(model_path, backend, imgsz, int8), task='detect')
+    names = names or [model.names[i] for i in sorted(model.names)]
+
+    print(f"📦 Предсказания для {len(image_paths)} снимков ({split}, conf >= {conf_floor})...")
+    start = time.time()
+    shapes, pred, gt = [], ([], [], [], []), ([], [], [])
+    for chunk_start, chunk in enumerate(iter_chunks(image_paths, batch_size)):
+        results = model.predict(source=chunk, conf=conf_floor, imgsz=imgsz, verbose=False)
+        for offset, (path, r) in enumerate(zip(chunk, results)):
+            idx = chunk_start * batch_size + offset
+            height, width = r.orig_shape
+            shapes.append((height, width))
+            boxes = r.boxes
+            pred[0].append(np.full(len(boxes), idx, np.int32))
+            pred[1].append(boxes.cls.cpu().numpy())
+            pred[2].append(boxes.conf.cpu().numpy())
+            pred[3].append(boxes.xyxy.cpu().numpy().reshape(-1, 4))
+
+            stem = os.path.splitext(os.path.basename(path))[0]
+            class_ids, xywh = parse_label_file(os.path.join(labels_dir_for(os.path.dirname(path)), stem + '.txt'))
+            scale = np.array([width, height, width, height], np.float32)
+            gt[0].append(np.full(len(class_ids), idx, np.int32))
+            gt[1].append(class_ids)
+            gt[2].append(np.concatenate([xywh[:, :2] - xywh[:, 2:] / 2, xywh[:, :2] + xywh[:, 2:] / 2], axis=1) * scale)
+
+    image_names = [os.path.relpath(p, os.path.commonpath(image_paths)) if len(image_paths) > 1
+                   else os.path.basename(p) for p in image_paths]
+    meta = {'model': model_path, 'data': data_path, 'split': split, 'conf_floor': conf_floor, 'imgsz': imgsz,
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S')}
+    save_predictions(output_path, names, image_names, shapes, [np.concatenate(a) for a in pred],
+                     [np.concatenate(a) for a in gt], meta)
+    size_kb = os.path.getsize(output_path) / 1024
+    print(f"💾 {sum(len(a) for a in pred[0])} предсказаний за {time.time() - start:.1f} с: "
+          f"{output_path} ({size_kb:.0f} КБ)")
+    return output_path
+
+def save_evaluation_plots(evaluator, output_dir, conf_threshold=0.25):
+    """PR-кривые, F1 от порога уверенности и матрица ошибок - в PNG без вывода на экран"""
+    os.makedirs(output_dir, exist_ok=True)
+    paths = []
+
+    curves = evaluator.threshold_curves()
+    fig, (ax_pr, ax_f1) = plt.subplots(1, 2, figsize=(14, 6))
+    for c, name in enumerate(evaluator.names):
+        if evaluator.gt_counts[c]:
+            ax_pr.plot(curves['recall'][c], curves['precision'][c], label=name)
+            ax_f1.plot(curves['conf'], curves['f1'][c], label=name)
+    ax_pr.set(xlabel='Recall', ylabel='Precision', title='PR-кривые (IoU 0.5)', xlim=(0, 1), ylim=(0, 1.05))
+    ax_f1.set(xlabel='Порог уверенности', ylabel='F1', title='F1 от порога уверенности', xlim=(0, 1), ylim=(0, 1.05))
+    ax_f1.axvline(conf_threshold, color='gray', linestyle='--')
+    ax_pr.legend()
+    ax_f1.legend()
+    paths.append(os.path.join(output_dir, 'pr_f1_curves.png'))
+    fig.savefig(paths[-1], dpi=100, bbox_inches='tight')
+    plt.close(fig)
+
+    labels = list(range(evaluator.nc + 1))
+    y_true, y_pred = evaluator.confusion_pairs(conf_threshold)
+    matrix = confusion_matrix(y_true, y_pred, labels=labels)
+    fig = plt.figure(figsize=(8, 7))
+    tick_names = evaluator.names + ['background']
+    sns.heatmap(matrix, annot=True, fmt='d', cmap='Blues', xticklabels=tick_names, yticklabels=tick_names)
+    plt.xlabel('Предсказание')
+    plt.ylabel('Разметка')
+    plt.title(f'Матрица ошибок (conf >= {conf_threshold:.2f}, IoU 0.5)')
+    paths.append(os.path.join(output_dir, 'confusion_matrix.png'))
+    fig.savefig(paths[-1], dpi=100, bbox_inches='tight')
+    plt.close(fig)
+    return paths
+
+def evaluate_offline(predictions_path, conf_thresholds=(0.25,), plots_dir=None, report_path=None):
+    """Метрики по сохраненным предсказаниям без инференса: AP по классам, mAP50, mAP50-95,
+    точки работы для каждого порога уверенности, матрица ошибок и графики"""
+    start = time.perf_counter()
+    evaluator = OfflineEvaluator(predictions_path)
+    load_time = time.perf_counter() - start
+
+    print("🧪 ОФЛАЙН-ОЦЕНКА")
+    print("=" * 50)
+    print(f"📦 {predictions_path}: {len(evaluator.image_names)} снимков, {len(evaluator.pred_conf)} предсказаний "
+          f"(conf >= {evaluator.meta.get('conf_floor', 0)}), загрузка и сопоставление {load_time * 1e3:.0f} мс")
+
+    start = time.perf_counter()
+    metrics = evaluator.metrics(conf_thresholds[0])
+    points = {conf: evaluator.operating_point(conf) for conf in conf_thresholds}
+    best_conf, best_f1 = evaluator.best_f1_threshold()
+    metrics_time = time.perf_counter() - start
+
+    print("\n📈 РЕЗУЛЬТАТЫ ОЦЕНКИ:")
+    print(f"mAP50: {metrics['map50']:.4f}")
+    print(f"mAP50-95: {metrics['map50_95']:.4f}")
+    for name, values in metrics['per_class'].items():
+        print(f"   {name}: AP50 {values['ap50']:.4f}, AP50-95 {values['ap50_95']:.4f} ({values['instances']} рамок)")
+
+    print("\n🎯 ТОЧКИ РАБОТЫ (IoU 0.5):")
+    for conf, point in points.items():
+        print(f"   conf {conf:g}: precision {point['precision']:.4f}, recall {point['recall']:.4f}, "
+              f"F1 {point['f1']:.4f}")
+    print(f"   Лучший F1 {best_f1:.4f} при conf {best_conf:.2f}")
+    print(f"⏱️ Метрики посчитаны за {metrics_time * 1e3:.1f} мс")
+
+    y_true, y_pred = evaluator.confusion_pairs(conf_thresholds[0])
+    labels = list(range(evaluator.nc + 1))
+    print(f"\n📋 КЛАССИФИКАЦИЯ РАМОК (conf >= {conf_thresholds[0]:.2f}, IoU 0.5, background - фон):")
+    print(classification_report(y_true, y_pred, labels=labels, target_names=evaluator.names + ['background'],
+                                zero_division=0))
+
+    report = {'metrics': metrics, 'operating_points': {str(c): p for c, p in points.items()},
+              'best_f1': {'conf': best_conf, 'f1': best_f1},
+              'confusion_matrix': confusion_matrix(y_true, y_pred, labels=labels).tolist(),
+              'meta': evaluator.meta}
+    if plots_dir:
+        for path in save_evaluation_plots(evaluator, plots_dir, conf_thresholds[0]):
+            print(f"🖼️ {path}")
+    if report_path:
+        with open(report_path, 'w') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"💾 Отчет: {report_path}")
+    return report
+
+def test_single_image(model_path, image_path, backend='pytorch', int8=False):
     """Тестирование на одном изображении"""
-    model = YOLO(model_path)
+    model = YOLO(resolve_backend_model(model_path, backend, int8=int8), task='detect')
     
     print(f"🔍 Тестируем изображение: {image_path}")
     results = model.predict(source=image_path, save=True, conf=0.5)
@@ -79,16 +234,41 @@ def test_single_image(model_path, image_path):
 
 def main():
     parser = argparse.ArgumentParser(description='Evaluate trained model')
-    parser.add_argument('--model', type=str, required=True, help='Path to trained model')
+    parser.add_argument('--model', type=str, help='Path to trained model')
     parser.add_argument('--data', type=str, default='./data/data.yaml', help='Path to data config')
     parser.add_argument('--image', type=str, help='Test single image')
+    parser.add_argument('--backend', type=str, default='pytorch', choices=['pytorch', 'onnx', 'openvino'],
+                        help='Inference backend for --image')
+    parser.add_argument('--int8', action='store_true', help='Use INT8-quantized exported model')
+    parser.add_argument('--dump', action='store_true',
+                        help='Run the model once over --split and save predictions for offline evaluation')
+    parser.add_argument('--predictions', type=str,
+                        help='Predictions .npz to evaluate offline (output of --dump, no inference)')
+    parser.add_argument('--split', type=str, default='val', help='Split for --dump')
+    parser.add_argument('--conf-floor', type=float, default=0.001, help='Lowest confidence kept by --dump')
+    parser.add_argument('--imgsz', type=int, default=640, help='Image size for --dump')
+    parser.add_argument('--batch-size', type=int, default=16, help='Images per forward pass for --dump')
+    parser.add_argument('--conf', type=float, nargs='+', default=[0.25],
+                        help='Confidence thresholds for operating points (first is used for plots)')
+    parser.add_argument('--plots-dir', type=str, default='runs/evaluate', help='Where plots are written')
+    parser.add_argument('--report', type=str, help='Write offline metrics to this JSON file')
     
     args = parser.parse_args()
     
-    if args.image:
-        test_single_image(args.model, args.image)
+    if not args.model and not args.predictions:
+        parser.error('--model or --predictions is required')
+
+    if args.dump or args.predictions:
+        predictions = args.predictions
+        if args.dump:
+            predictions = dump_predictions(args.model, args.data, args.split, args.predictions, args.conf_floor,
+                                           args.imgsz, args.batch_size, args.backend, args.int8)
+        if predictions:
+            evaluate_offline(predictions, args.conf, args.plots_dir, args.report)
+    elif args.image:
+        test_single_image(args.model, args.image, args.backend, args.int8)
     else:
-        evaluate_model(args.model, args.data)
+        evaluate_model(args.model, args.data, args.plots_dir)
 
 if __name__ == "__main__":
     main()
@@ -9,85 +9,861 @@ import os
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 
 import argparse
+import time
+import multiprocessing
+from multiprocessing.util import Finalize
+from collections import Counter, deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
 from ultralytics import YOLO
 import cv2
+import numpy as np
 from PIL import Image
 import pandas as pd
+from utils.export_utils import resolve_backend_model
+from utils.prediction_writer import PredictionWriter
+from utils.prediction_cache import PredictionCache
+from utils.file_discovery import iter_images, iter_chunks
+from utils.latency_profiler import StageProfiler
+from utils.tiling import tile_grid, merge_detections
+from utils.cascade import (suspicion_score, labels_dir_for, load_ground_truth, matched_findings,
+                           cascade_operating_points)
+
+# Этапы инференса в порядке вывода сводки; load - чтение/декодирование и сохранение
+# внутри ultralytics, когда модели передается путь к файлу (predict_image)
+INFERENCE_STAGES = ('read', 'cache', 'decode', 'load', 'preprocess', 'inference', 'nms', 'parse', 'merge', 'total')
+
+def _pending_images(writer, images_dir, skipped, **discovery):
+    """Ленивый поток снимков, которых еще нет в выходном файле"""
+    for path in iter_images(images_dir, **discovery):
+        if writer.is_done(os.path.relpath(path, images_dir)):
+            skipped['done'] += 1
+            continue
+        yield path
 
 class ChestXRayDetector:
-    def __init__(self, model_path):
-        self.model = YOLO(model_path)
+    def __init__(self, model_path, backend='pytorch', int8=False, imgsz=640, cache_path=None, cache_max_mb=512,
+                 profile=False, profile_window_s=None):
+        # backend='onnx'/'openvino' использует экспортированную модель (экспортирует best.pt при отсутствии)
+        self.model_path = resolve_backend_model(model_path, backend, imgsz, int8)
+        self.backend = backend
+        self.imgsz = imgsz
+        self.model = YOLO(self.model_path, task='detect')
+        # Кэш предсказаний по содержимому снимка: повторные снимки не прогоняются через модель
+        self.cache = PredictionCache(cache_path, self.model_path, imgsz=imgsz, max_mb=cache_max_mb) if cache_path else None
+        # Замер задержки по этапам (profile=True); выключенный профилировщик почти ничего не стоит
+        self.profiler = StageProfiler(profile, INFERENCE_STAGES, profile_window_s)
         self.class_names = {
             0: 'Перелом ключицы',
             1: 'Инородное тело в бронхах',
             2: 'Норма'
         }
-    
-    def predict_image(self, image_path, conf_threshold=0.5):
-        """Предсказание для одного изображения"""
-        results = self.model.predict(
-            source=image_path,
-            conf=conf_threshold,
-            save=True,
-            save_txt=True
-        )
-        
+
+    def close(self):
+        """Сброс отложенных обновлений кэша предсказаний и закрытие базы"""
+        if self.cache is not None:
+            self.cache.close()
+            self.cache = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _parse_result(self, r):
+        """Преобразование результата YOLO в список детекций"""
         detections = []
-        for r in results:
-            if len(r.boxes) > 0:
-                for box in r.boxes:
-                    cls_id = int(box.cls[0])
-                    confidence = float(box.conf[0])
-                    bbox = box.xyxy[0].cpu().numpy()
-                    
-                    detection = {
-                        'class': self.class_names[cls_id],
-                        'confidence': confidence,
-                        'bbox': bbox
-                    }
-                    detections.append(detection)
-            else:
+        if len(r.boxes) > 0:
+            for box in r.boxes:
+                cls_id = int(box.cls[0])
+                confidence = float(box.conf[0])
+                bbox = box.xyxy[0].cpu().numpy()
+
                 detection = {
-                    'class': 'Норма',
-                    'confidence': 1.0,
-                    'bbox': None
+                    'class': self.class_names[cls_id],
+                    'confidence': confidence,
+                    'bbox': bbox
                 }
                 detections.append(detection)
-        
+        else:
+            detection = {
+                'class': 'Норма',
+                'confidence': 1.0,
+                'bbox': None
+            }
+            detections.append(detection)
+
+        return detections
+
+    def _record_speed(self, results, elapsed=None):
+        """Этапы ultralytics из r.speed (мс на снимок): preprocess, inference и postprocess (NMS).
+        elapsed - полное время вызова predict на один снимок, остаток записывается как load."""
+        for r in results:
+            speed = r.speed
+            if speed.get('inference') is None:
+                continue
+            self.profiler.record('preprocess', speed['preprocess'] / 1e3)
+            self.profiler.record('inference', speed['inference'] / 1e3)
+            self.profiler.record('nms', speed['postprocess'] / 1e3)
+            if elapsed is not None:
+                self.profiler.record('load', max(elapsed - sum(speed.values()) / 1e3, 0.0))
+
+    def latency_summary(self):
+        """Квантили задержки по этапам: {этап: {'count', 'mean_ms', 'p50_ms', 'p95_ms', 'p99_ms', 'max_ms'}}"""
+        return self.profiler.summary()
+
+    def predict_image(self, image_path, conf_threshold=0.5):
+        """Предсказание для одного изображения
+
+        При попадании в кэш модель не запускается и вместо results возвращается None.
+        """
+        with self.profiler.stage('total'):
+            cache_key = None
+            if self.cache is not None:
+                with self.profiler.stage('read'):
+                    with open(image_path, 'rb') as f:
+                        data = f.read()
+                with self.profiler.stage('cache'):
+                    cache_key = self.cache.key(data, conf_threshold)
+                    cached = self.cache.get(cache_key)
+                if cached is not None:
+                    return cached, None
+
+            start = time.perf_counter()
+            results = self.model.predict(
+                source=image_path,
+                conf=conf_threshold,
+                imgsz=self.imgsz,
+                save=True,
+                save_txt=True
+            )
+            if self.profiler.enabled:
+                self._record_speed(results, (time.perf_counter() - start) / max(len(results), 1))
+
+            detections = []
+            with self.profiler.stage('parse'):
+                for r in results:
+                    detections.extend(self._parse_result(r))
+
+            if cache_key is not None:
+                self.cache.put(cache_key, detections)
+
         return detections, results
-    
-    def predict_batch(self, images_dir, output_dir='predictions'):
-        """Пакетное предсказание"""
-        os.makedirs(output_dir, exist_ok=True)
-        
-        image_files = [f for f in os.listdir(images_dir) 
-                      if f.endswith(('.jpg', '.png', '.jpeg'))]
-        
-        all_results = []
-        print(f"🔍 Обрабатываем {len(image_files)} изображений...")
-        
-        for i, img_file in enumerate(image_files, 1):
-            img_path = os.path.join(images_dir, img_file)
-            detections, _ = self.predict_image(img_path)
-            
-            for det in detections:
-                all_results.append({
-                    'image': img_file,
-                    'class': det['class'],
-                    'confidence': det['confidence'],
-                    'bbox': str(det['bbox'])
-                })
-            
-            if i % 10 == 0:
-                print(f"✅ Обработано {i}/{len(image_files)}")
-        
-        # Сохраняем результаты
-        df = pd.DataFrame(all_results)
-        csv_path = os.path.join(output_dir, 'predictions.csv')
-        df.to_csv(csv_path, index=False)
-        
-        print(f"💾 Результаты сохранены в {csv_path}")
-        return df
+
+    def _load_image(self, image_path, conf_threshold):
+        """Чтение снимка для батча: (ключ кэша, декодированный снимок, детекции из кэша)"""
+        with self.profiler.stage('read'):
+            with open(image_path, 'rb') as f:
+                data = f.read()
+        cache_key = None
+        if self.cache is not None:
+            with self.profiler.stage('cache'):
+                cache_key = self.cache.key(data, conf_threshold)
+                cached = self.cache.get(cache_key)
+            if cached is not None:
+                return cache_key, None, cached
+        # imdecode из байтов - тот же путь чтения, что и у ultralytics для файлов
+        with self.profiler.stage('decode'):
+            image = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+        return cache_key, image, None
+
+    def _read_image(self, image_path, conf_threshold=None):
+        """Чтение снимка без кэша предсказаний (для тайлового режима и каскада)"""
+        with self.profiler.stage('decode'):
+            return cv2.imread(image_path, cv2.IMREAD_COLOR)
+
+    def _prefetch_batches(self, image_paths, batch_size, workers=4, conf_threshold=0.5, loader=None):
+        """Генератор батчей: следующий батч декодируется в фоне, пока модель занята текущим.
+
+        image_paths может быть ленивым итератором - он читается по одному батчу вперед.
+        loader(path, conf_threshold) - чтение одного снимка, по умолчанию _load_image с кэшем.
+        """
+        loader = loader or self._load_image
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            def submit(paths):
+                return paths, [pool.submit(loader, p, conf_threshold) for p in paths]
+
+            batches = iter_chunks(image_paths, batch_size)
+            pending = next(batches, None)
+            pending = submit(pending) if pending else None
+            while pending:
+                paths, futures = pending
+                following = next(batches, None)
+                pending = submit(following) if following else None
+                yield paths, [f.result() for f in futures]
+
+    def predict_arrays(self, images, conf_threshold=0.5):
+        """Предсказание для списка уже декодированных снимков (BGR ndarray) батчами"""
+        # Группируем снимки по размеру: ultralytics применяет тот же letterbox,
+        # что и при поштучном инференсе, только к батчу одинаковых по форме снимков
+        groups = {}
+        for idx, img in enumerate(images):
+            groups.setdefault(img.shape, []).append(idx)
+
+        all_detections = [None] * len(images)
+        for idxs in groups.values():
+            results = self.model.predict(
+                source=[images[i] for i in idxs],
+                conf=conf_threshold,
+                imgsz=self.imgsz,
+                verbose=False
+            )
+            if self.profiler.enabled:
+                self._record_speed(results)
+            for i, r in zip(idxs, results):
+                with self.profiler.stage('parse'):
+                    all_detections[i] = self._parse_result(r)
+
+        return all_detections
+
+    def predict_images_batched(self, image_paths, conf_threshold=0.5, batch_size=8, workers=4):
+        """Батчевое предсказание: модель получает до batch_size снимков за один проход.
+
+        Возвращает генератор пар (путь, детекции) в исходном порядке.
+        """
+        for paths, items in self._prefetch_batches(image_paths, batch_size, workers, conf_threshold):
+            batch_detections = [cached for _, _, cached in items]
+            to_predict = []
+            for idx, (path, (_, img, cached)) in enumerate(zip(paths, items)):
+                if cached is None and img is None:
+                    print(f"⚠️ Не удалось прочитать изображение: {path}")
+                elif cached is None:
+                    to_predict.append(idx)
+
+            predicted = self.predict_arrays([items[i][1] for i in to_predict], conf_threshold)
+            for idx, detections in zip(to_predict, predicted):
+                batch_detections[idx] = detections
+                if self.cache is not None:
+                    self.cache.put(items[idx][0], detections)
+
+            for path, detections in zip(paths, batch_detections):
+                if detections is not None:
+                    yield path, detections
+
+    def _detections_from_arrays(self, boxes, scores, classes):
+        """Детекции в формате _parse_result из массивов xyxy / уверенностей / классов"""
+        if len(boxes) == 0:
+            return [{'class': 'Норма', 'confidence': 1.0, 'bbox': None}]
+        return [{'class': self.class_names[int(c)], 'confidence': float(conf), 'bbox': box}
+                for box, conf, c in zip(boxes, scores, classes)]
+
+    def detection_arrays(self, detections):
+        """Обратное к _detections_from_arrays: (классы [n], xyxy [n, 4], уверенности [n]) без записи нормы"""
+        class_ids = {name: class_id for class_id, name in self.class_names.items()}
+        found = [d for d in detections if d['bbox'] is not None]
+        return (np.array([class_ids[d['class']] for d in found], np.int64),
+                np.array([d['bbox'] for d in found], np.float32).reshape(-1, 4),
+                np.array([d['confidence'] for d in found], np.float32))
+
+    def predict_tiled_array(self, image, conf_threshold=0.5, tile_size=None, overlap=0.2, merge='nms',
+                            iou_threshold=0.5, batch_size=8, full_image=True, tile_classes=(0, 1)):
+        """Тайловый инференс одного снимка (BGR ndarray) в исходном разрешении.
+
+        Снимок режется на перекрывающиеся тайлы tile_size (по умолчанию imgsz модели),
+        тайлы идут в модель батчами по batch_size без уменьшения, боксы переносятся в
+        координаты снимка и объединяются NMS или WBF. Из тайлов берутся только классы
+        tile_classes (мелкие находки); full_image=True добавляет обычный проход по
+        всему снимку для крупных объектов, рамка нормы занимает всю грудную клетку.
+        Кэш предсказаний в этом режиме не используется.
+        Возвращает (детекции, {'tiles', 'forward_passes', 'seconds'}).
+        """
+        start = time.perf_counter()
+        tile_size = tile_size or self.imgsz
+        tiles = tile_grid(image.shape[0], image.shape[1], tile_size, overlap)
+        boxes, scores, classes = [], [], []
+
+        def collect(results, offsets, allowed=None):
+            if self.profiler.enabled:
+                self._record_speed(results)
+            for r, (x0, y0) in zip(results, offsets):
+                if len(r.boxes) == 0:
+                    continue
+                # Одна передача на CPU на тайл, а не на каждый бокс
+                xyxy = r.boxes.xyxy.cpu().numpy()
+                cls = r.boxes.cls.cpu().numpy().astype(np.int64)
+                conf = r.boxes.conf.cpu().numpy()
+                keep = np.isin(cls, allowed) if allowed is not None else slice(None)
+                boxes.append(xyxy[keep] + np.array([x0, y0, x0, y0], np.float32))
+                scores.append(conf[keep])
+                classes.append(cls[keep])
+
+        passes = 0
+        allowed = None if tile_classes is None or len(tiles) == 1 else list(tile_classes)
+        for i in range(0, len(tiles), batch_size):
+            chunk = tiles[i:i + batch_size]
+            crops = [np.ascontiguousarray(image[y0:y1, x0:x1]) for x0, y0, x1, y1 in chunk]
+            results = self.model.predict(source=crops, conf=conf_threshold, imgsz=tile_size, verbose=False)
+            collect(results, [(x0, y0) for x0, y0, _, _ in chunk], allowed)
+            passes += 1
+        if full_image and len(tiles) > 1:
+            results = self.model.predict(source=image, conf=conf_threshold, imgsz=self.imgsz, verbose=False)
+            collect(results, [(0, 0)])
+            passes += 1
+
+        with self.profiler.stage('merge'):
+            if boxes:
+                merged = merge_detections(np.concatenate(boxes), np.concatenate(scores), np.concatenate(classes),
+                                          merge, iou_threshold)
+            else:
+                merged = (np.empty((0, 4), np.float32), np.empty(0, np.float32), np.empty(0, np.int64))
+            detections = self._detections_from_arrays(*merged)
+        return detections, {'tiles': len(tiles), 'forward_passes': passes,
+                            'seconds': time.perf_counter() - start}
+
+    def predict_tiled(self, image_path, conf_threshold=0.5, **tiling):
+        """Тайловый инференс снимка с диска: (детекции, статистика тайлов) или (None, None)"""
+        image = self._read_image(image_path)
+        if image is None:
+            return None, None
+        return self.predict_tiled_array(image, conf_threshold, **tiling)
+
+    def predict_images_tiled(self, image_paths, conf_threshold=0.5, workers=4, stats=None, **tiling):
+        """Тайловый инференс потока снимков; следующие снимки декодируются в фоне.
+
+        stats (Counter) накапливает 'images', 'tiles', 'forward_passes' и 'seconds'.
+        """
+        for paths, images in self._prefetch_batches(image_paths, max(1, workers), workers, conf_threshold,
+                                                    loader=self._read_image):
+            for path, image in zip(paths, images):
+                if image is None:
+                    print(f"⚠️ Не удалось прочитать изображение: {path}")
+                    continue
+                detections, image_stats = self.predict_tiled_array(image, conf_threshold, **tiling)
+                if stats is not None:
+                    stats.update(image_stats)
+                    stats['images'] += 1
+                yield path, detections
+
+    def predict_batch(self, images_dir, output_dir='predictions', conf_threshold=0.5, batch_size=1, workers=4,
+                      output_format='csv', flush_every=100, resume=False,
+                      recursive=True, include=None, exclude=None, file_list=None, tiling=None, cascade=None):
+        """Пакетное предсказание с потоковой записью результатов
+
+        batch_size=1 - поштучный инференс с сохранением размеченных снимков,
+        batch_size>1 - батчевый инференс с фоновой загрузкой следующего батча.
+        resume=True - пропускает снимки, уже записанные в выходной файл.
+        tiling - параметры predict_tiled_array (tile_size, overlap, merge, batch_size, ...)
+        для тайлового инференса в исходном разрешении; тайлов за проход тогда задает
+        tiling['batch_size'] (--tile-batch), а batch_size не используется.
+        cascade - TriageCascade: сначала все снимки оценивает легкая модель, этой
+        моделью обрабатываются только подозрительные.
+        Снимки находятся лениво (рекурсивно, с фильтрами include/exclude или по file_list),
+        инференс начинается до окончания обхода папки.
+        """
+        with PredictionWriter(output_dir, output_format, flush_every, resume) as writer:
+            skipped = Counter()
+            image_paths = _pending_images(writer, images_dir, skipped, recursive=recursive,
+                                          include=include, exclude=exclude, file_list=file_list)
+
+            print(f"🔍 Обрабатываем изображения из {images_dir}...")
+            start_time = time.time()
+            processed = 0
+
+            tile_stats, cascade_stats = Counter(), Counter()
+            if cascade is not None:
+                predictions = cascade.predict_images(image_paths, conf_threshold, max(batch_size, 1), workers,
+                                                     cascade_stats)
+            elif tiling is not None:
+                predictions = self.predict_images_tiled(image_paths, conf_threshold, workers, tile_stats, **tiling)
+            elif batch_size > 1:
+                predictions = self.predict_images_batched(image_paths, conf_threshold, batch_size, workers)
+            else:
+                predictions = ((p, self.predict_image(p, conf_threshold)[0]) for p in image_paths)
+
+            for processed, (img_path, detections) in enumerate(predictions, 1):
+                writer.write(os.path.relpath(img_path, images_dir), detections)
+
+                if processed % 10 == 0:
+                    print(f"✅ Обработано {processed}")
+
+            elapsed = time.time() - start_time
+            if skipped['done']:
+                print(f"⏭️ Пропущено уже обработанных: {skipped['done']}")
+            if processed:
+                batch_text = (f"тайлов за проход={tiling.get('batch_size', 8)}" if tiling is not None and cascade is None
+                              else f"batch_size={batch_size}")
+                print(f"⏱️ {processed} изображений за {elapsed:.1f} с "
+                      f"({processed / max(elapsed, 1e-9):.2f} изобр/с, {batch_text})")
+            if tile_stats['images']:
+                print(f"🧩 Тайлы: {tile_stats['tiles'] / tile_stats['images']:.1f} на снимок, "
+                      f"{tile_stats['forward_passes'] / tile_stats['images']:.1f} проходов модели на снимок, "
+                      f"{tile_stats['seconds'] / tile_stats['images'] * 1e3:.0f} мс на снимок")
+            if cascade_stats['images']:
+                print(f"🔀 Каскад: {cascade_stats['escalated']} из {cascade_stats['images']} снимков "
+                      f"({cascade_stats['escalated'] / cascade_stats['images']:.1%}) переданы тяжелой модели")
+
+        print(f"💾 Результаты сохранены в {writer.path}")
+        if self.cache is not None:
+            stats = self.cache.stats()
+            print(f"🗄️ Кэш: {stats['hits']} попаданий, {stats['misses']} промахов "
+                  f"({stats['hit_rate']:.1%}), {stats['entries']} записей, {stats['size_mb']:.1f} МБ")
+        if self.profiler.enabled:
+            print("⏱️ ЗАДЕРЖКА ПО ЭТАПАМ (на снимок):")
+            print(self.profiler.format_summary())
+        return {
+            'output': writer.path,
+            'images': processed,
+            'class_counts': pd.Series(writer.class_counts, dtype='int64').sort_values(ascending=False)
+        }
+
+def _filter_confidence(detections, conf_threshold):
+    """Детекции не ниже порога; если не осталось ни одной - запись нормы, как в _parse_result"""
+    kept = [d for d in detections if d['bbox'] is None or d['confidence'] >= conf_threshold]
+    return kept or [{'class': 'Норма', 'confidence': 1.0, 'bbox': None}]
+
+class TriageCascade:
+    """Двухступенчатый каскад: легкая модель-сортировщик (yolov8n, 416) оценивает
+    каждый снимок, тяжелая (yolov8s, 640) запускается только на снимках с
+    подозрительностью не ниже suspicion_threshold. Для остальных снимков
+    результатом остаются детекции сортировщика. Кэш предсказаний не используется.
+    """
+
+    def __init__(self, triage, heavy, suspicion_threshold=0.25):
+        self.triage = triage
+        self.heavy = heavy
+        self.suspicion_threshold = suspicion_threshold
+
+    def suspicion(self, detections):
+        """Максимальная уверенность сортировщика среди находок патологий"""
+        class_ids, _, confidences = self.triage.detection_arrays(detections)
+        return suspicion_score(class_ids, confidences)
+
+    def predict_arrays(self, images, conf_threshold=0.5):
+        """Каскад на списке снимков (BGR ndarray): (детекции, флаги передачи тяжелой модели)"""
+        # Сортировщик видит находки и ниже conf_threshold, иначе порог подозрительности
+        # меньше conf_threshold ничего бы не менял
+        triaged = self.triage.predict_arrays(images, min(conf_threshold, self.suspicion_threshold))
+        escalated = [self.suspicion(d) >= self.suspicion_threshold for d in triaged]
+        detections = [_filter_confidence(d, conf_threshold) for d in triaged]
+
+        idxs = [i for i, flag in enumerate(escalated) if flag]
+        if idxs:
+            for i, heavy_detections in zip(idxs, self.heavy.predict_arrays([images[i] for i in idxs],
+                                                                          conf_threshold)):
+                detections[i] = heavy_detections
+        return detections, escalated
+
+    def predict_images(self, image_paths, conf_threshold=0.5, batch_size=8, workers=4, stats=None):
+        """Каскад на потоке снимков: генератор (путь, детекции) в исходном порядке.
+
+        stats (Counter) накапливает 'images' и 'escalated'.
+        """
+        for paths, images in self.triage._prefetch_batches(image_paths, batch_size, workers, conf_threshold,
+                                                           loader=self.triage._read_image):
+            readable = []
+            for path, image in zip(paths, images):
+                if image is None:
+                    print(f"⚠️ Не удалось прочитать изображение: {path}")
+                else:
+                    readable.append((path, image))
+            if not readable:
+                continue
+            detections, escalated = self.predict_arrays([image for _, image in readable], conf_threshold)
+            if stats is not None:
+                stats['images'] += len(readable)
+                stats['escalated'] += sum(escalated)
+            for (path, _), image_detections in zip(readable, detections):
+                yield path, image_detections
+
+def evaluate_cascade(cascade, images_dir, labels_dir=None, conf_threshold=0.5, batch_size=8, thresholds=None,
+                     iou_threshold=0.5):
+    """Оценка каскада на размеченном сплите относительно тяжелой модели на всех снимках.
+
+    Обе модели один раз прогоняются по всем снимкам; по этим прогонам для каждого
+    порога подозрительности считаются доля переданных снимков, оценка пропускной
+    способности и потерянный recall находок (IoU >= iou_threshold с рамкой того же
+    класса). Пропускная способность каскада с текущим порогом замеряется отдельно.
+    """
+    labels_dir = labels_dir or labels_dir_for(images_dir)
+    image_paths = list(iter_images(images_dir))
+    if not image_paths:
+        print("❌ Нет изображений для оценки")
+        return None
+    thresholds = sorted(set(thresholds or (0.05, 0.1, 0.15, 0.25, 0.35, 0.5)) | {cascade.suspicion_threshold})
+    triage_floor = min(conf_threshold, thresholds[0])
+
+    print(f"🔀 ОЦЕНКА КАСКАДА: {len(image_paths)} изображений, разметка {labels_dir}")
+    first = cv2.imread(image_paths[0], cv2.IMREAD_COLOR)
+    cascade.triage.predict_arrays([first], triage_floor)  # прогрев обеих моделей
+    cascade.heavy.predict_arrays([first], conf_threshold)
+
+    scores, triage_found, heavy_found, gt_counts, triage_s, heavy_s = [], [], [], [], [], []
+    cascade_time, escalated_total, readable = 0.0, 0, []
+    for chunk in iter_chunks(image_paths, batch_size):
+        images, stems = [], []
+        for path in chunk:
+            image = cv2.imread(path, cv2.IMREAD_COLOR)
+            if image is None:
+                print(f"⚠️ Не удалось прочитать изображение: {path}")
+                continue
+            images.append(image)
+            stems.append(os.path.splitext(os.path.basename(path))[0])
+        if not images:
+            continue
+        readable.extend(stems)
+
+        start = time.perf_counter()
+        triaged = cascade.triage.predict_arrays(images, triage_floor)
+        triage_s.extend([(time.perf_counter() - start) / len(images)] * len(images))
+        start = time.perf_counter()
+        heavy = cascade.heavy.predict_arrays(images, conf_threshold)
+        heavy_s.extend([(time.perf_counter() - start) / len(images)] * len(images))
+        start = time.perf_counter()
+        _, escalated = cascade.predict_arrays(images, conf_threshold)
+        cascade_time += time.perf_counter() - start
+        escalated_total += sum(escalated)
+
+        for image, stem, triage_detections, heavy_detections in zip(images, stems, triaged, heavy):
+            gt = load_ground_truth(labels_dir, stem, image.shape[1], image.shape[0])
+            triage_pred = cascade.triage.detection_arrays(triage_detections)
+            scores.append(suspicion_score(triage_pred[0], triage_pred[2]))
+            triage_found.append(matched_findings(triage_pred, gt, conf_threshold, iou_threshold))
+            heavy_found.append(matched_findings(cascade.heavy.detection_arrays(heavy_detections), gt,
+                                                conf_threshold, iou_threshold))
+            gt_counts.append(len(gt[0]))
+
+    report = cascade_operating_points(scores, triage_found, heavy_found, gt_counts, triage_s, heavy_s, thresholds)
+    report['images'] = len(readable)
+    report['findings'] = int(sum(gt_counts))
+    report['measured'] = {'threshold': cascade.suspicion_threshold,
+                          'escalated': escalated_total / max(len(readable), 1),
+                          'images_per_sec': len(readable) / max(cascade_time, 1e-9)}
+
+    print(f"   Находок в разметке: {report['findings']}")
+    print(f"   Тяжелая модель на всех снимках: recall {report['heavy_recall']:.3f}, "
+          f"{report['heavy_images_per_sec']:.2f} изобр/с")
+    print(f"   {'порог':>6} {'передано':>9} {'изобр/с':>8} {'recall':>7} {'потеря':>7} {'пропущено исслед.':>18}")
+    for point in report['points']:
+        marker = ' ◀' if point['threshold'] == cascade.suspicion_threshold else ''
+        print(f"   {point['threshold']:>6.2f} {point['escalated']:>9.1%} {point['images_per_sec']:>8.2f} "
+              f"{point['recall']:>7.3f} {point['recall_lost']:>+7.3f} {point['missed_studies']:>18.1%}{marker}")
+    measured = report['measured']
+    print(f"   Замер каскада (порог {measured['threshold']:.2f}): {measured['images_per_sec']:.2f} изобр/с, "
+          f"передано {measured['escalated']:.1%}")
+    return report
+
+def benchmark_batching(detector, images_dir, conf_threshold=0.5, batch_size=8, workers=4):
+    """Сравнение скорости поштучного и батчевого инференса и проверка совпадения результатов"""
+    image_paths = list(iter_images(images_dir))
+    if not image_paths:
+        print("❌ Нет изображений для замера")
+        return None
+
+    print(f"⏱️ ЗАМЕР СКОРОСТИ: {len(image_paths)} изображений")
+
+    start = time.time()
+    single = [detector.predict_image(p, conf_threshold)[0] for p in image_paths]
+    single_time = time.time() - start
+
+    start = time.time()
+    batched = [d for _, d in detector.predict_images_batched(image_paths, conf_threshold, batch_size, workers)]
+    batched_time = time.time() - start
+
+    def same(a, b):
+        if len(a) != len(b):
+            return False
+        for da, db in zip(a, b):
+            if da['class'] != db['class'] or abs(da['confidence'] - db['confidence']) > 1e-4:
+                return False
+            if (da['bbox'] is None) != (db['bbox'] is None):
+                return False
+            if da['bbox'] is not None and abs(da['bbox'] - db['bbox']).max() > 1e-2:
+                return False
+        return True
+
+    mismatches = sum(not same(a, b) for a, b in zip(single, batched))
+    single_ips = len(image_paths) / single_time
+    batched_ips = len(image_paths) / batched_time
+
+    print(f"   Поштучно:            {single_ips:.2f} изобр/с")
+    print(f"   Батчами ({batch_size:>3}):       {batched_ips:.2f} изобр/с")
+    print(f"   Ускорение:           {batched_ips / single_ips:.2f}x")
+    if mismatches:
+        print(f"   ⚠️ Расхождения в результатах: {mismatches} изображений")
+    else:
+        print("   ✅ Результаты совпадают")
+
+    return {
+        'images': len(image_paths),
+        'single_ips': single_ips,
+        'batched_ips': batched_ips,
+        'speedup': batched_ips / single_ips,
+        'mismatches': mismatches
+    }
+
+def benchmark_tiling(detector, images_dir, conf_threshold=0.5, **tiling):
+    """Стоимость тайлового инференса относительно обычного (весь снимок в imgsz) и разница в находках"""
+    image_paths = list(iter_images(images_dir))
+    images = [img for img in (cv2.imread(p, cv2.IMREAD_COLOR) for p in image_paths) if img is not None]
+    if not images:
+        print("❌ Нет изображений для замера")
+        return None
+
+    print(f"⏱️ ЗАМЕР ТАЙЛОВОГО ИНФЕРЕНСА: {len(images)} изображений")
+    detector.predict_arrays(images[:1], conf_threshold)  # прогрев
+
+    start = time.time()
+    whole = [detector.predict_arrays([img], conf_threshold)[0] for img in images]
+    whole_time = time.time() - start
+
+    start = time.time()
+    tiled, stats = [], Counter()
+    for img in images:
+        detections, image_stats = detector.predict_tiled_array(img, conf_threshold, **tiling)
+        tiled.append(detections)
+        stats.update(image_stats)
+    tiled_time = time.time() - start
+
+    def class_counts(results):
+        return Counter(d['class'] for dets in results for d in dets if d['bbox'] is not None)
+
+    whole_counts, tiled_counts = class_counts(whole), class_counts(tiled)
+    print(f"   Весь снимок:         {whole_time / len(images) * 1e3:.0f} мс/снимок")
+    print(f"   Тайлы:               {tiled_time / len(images) * 1e3:.0f} мс/снимок "
+          f"({stats['tiles'] / len(images):.1f} тайлов, {stats['forward_passes'] / len(images):.1f} проходов)")
+    print(f"   Стоимость:           {tiled_time / whole_time:.2f}x")
+    for name in sorted(set(whole_counts) | set(tiled_counts)):
+        print(f"   {name}: {whole_counts[name]} -> {tiled_counts[name]} находок")
+
+    return {
+        'images': len(images),
+        'whole_ms': whole_time / len(images) * 1e3,
+        'tiled_ms': tiled_time / len(images) * 1e3,
+        'cost_ratio': tiled_time / whole_time,
+        'tiles_per_image': stats['tiles'] / len(images),
+        'whole_counts': dict(whole_counts),
+        'tiled_counts': dict(tiled_counts)
+    }
+
+# Детектор процесса-воркера для predict_parallel (создается один раз на процесс)
+_worker_detector = None
+
+def _init_worker(detector_kwargs, threads):
+    """Инициализация процесса-воркера: своя модель и подобранное число потоков torch"""
+    global _worker_detector
+    import torch
+    torch.set_num_threads(threads)
+    cv2.setNumThreads(1)
+    _worker_detector = ChestXRayDetector(**detector_kwargs)
+    # atexit в процессах multiprocessing не вызывается - кэш воркера закрывается финализатором
+    Finalize(_worker_detector, _worker_detector.close, exitpriority=10)
+
+def _predict_chunk(image_paths, conf_threshold, batch_size):
+    """Предсказание для порции снимков внутри воркера: (результаты, замеры этапов для слияния или None)"""
+    results = list(_worker_detector.predict_images_batched(image_paths, conf_threshold, batch_size, workers=1))
+    profiler = _worker_detector.profiler
+    return results, profiler.snapshot() if profiler.enabled else None
+
+def predict_parallel(detector_kwargs, images_dir, output_dir='predictions', conf_threshold=0.5, workers=2,
+                     threads=None, chunk_size=16, batch_size=4, output_format='csv', flush_every=100,
+                     resume=False, max_retries=2, recursive=True, include=None, exclude=None, file_list=None):
+    """Многопроцессный инференс: снимки делятся на порции, которые воркеры забирают из общей очереди.
+
+    Свободный воркер сразу берет следующую порцию, поэтому снимки разного размера
+    не задерживают остальных. Результаты пишутся в один файл в порядке обхода.
+    Если воркер падает, незавершенные порции перезапускаются в новом пуле,
+    а уже полученные результаты остаются в файле. Какая из них уронила воркер,
+    неизвестно, поэтому они прогоняются по одной: попытка засчитывается только
+    порции, на которой пул упал снова, остальные не страдают из-за соседки.
+    """
+    threads = threads or max(1, (os.cpu_count() or 1) // workers)
+    # Замеры этапов из воркеров сливаются в одну гистограмму на каждый этап
+    profiler = StageProfiler(detector_kwargs.get('profile', False), INFERENCE_STAGES)
+    # Экспорт (для onnx/openvino) делаем один раз здесь, а не в каждом воркере
+    detector_kwargs = dict(detector_kwargs)
+    detector_kwargs['model_path'] = resolve_backend_model(
+        detector_kwargs['model_path'], detector_kwargs.get('backend', 'pytorch'),
+        detector_kwargs.get('imgsz', 640), detector_kwargs.get('int8', False)
+    )
+
+    with PredictionWriter(output_dir, output_format, flush_every, resume) as writer:
+        skipped = Counter()
+        chunk_iter = enumerate(iter_chunks(_pending_images(
+            writer, images_dir, skipped, recursive=recursive, include=include,
+            exclude=exclude, file_list=file_list
+        ), chunk_size))
+
+        print(f"🔍 Обрабатываем изображения из {images_dir}: {workers} процессов x {threads} потоков torch")
+        start_time = time.time()
+
+        chunks = {}        # порции, которые еще не записаны в файл
+        retry = deque()
+        # Порции, которые были в работе при падении воркера: идут в пул по одной
+        suspects = deque()
+        suspect_ids = set()
+        attempts = Counter()
+        failed = []
+        ready = {}
+        next_chunk = 0
+        processed = 0
+        exhausted = False
+
+        def next_work():
+            nonlocal exhausted
+            if suspects:
+                return suspects.popleft()
+            if retry:
+                return retry.popleft()
+            if not exhausted:
+                try:
+                    idx, paths = next(chunk_iter)
+                    chunks[idx] = paths
+                    return idx
+                except StopIteration:
+                    exhausted = True
+            return None
+
+        def retry_or_fail(idx, error, crashed=False):
+            attempts[idx] += 1
+            if attempts[idx] > max_retries:
+                print(f"❌ Порция {idx} не обработана ({error}), снимков: {len(chunks[idx])}")
+                failed.extend(chunks[idx])
+                ready[idx] = []
+                suspect_ids.discard(idx)
+            elif crashed:
+                # Порция роняет воркер - повторяем ее отдельно от остальных
+                suspect_ids.add(idx)
+                suspects.appendleft(idx)
+            else:
+                retry.append(idx)
+
+        def write_ready():
+            nonlocal next_chunk, processed
+            written = processed
+            while next_chunk in ready:
+                for img_path, detections in ready.pop(next_chunk):
+                    writer.write(os.path.relpath(img_path, images_dir), detections)
+                    processed += 1
+                del chunks[next_chunk]
+                next_chunk += 1
+            if processed > written:
+                print(f"✅ Обработано {processed}")
+
+        ctx = multiprocessing.get_context('spawn')
+        while retry or suspects or not exhausted:
+            in_flight = {}
+            with ProcessPoolExecutor(max_workers=workers, mp_context=ctx, initializer=_init_worker,
+                                     initargs=(detector_kwargs, threads)) as pool:
+                try:
+                    while True:
+                        # Ограниченное окно порций в работе, чтобы не держать в памяти все результаты
+                        # Пока ищем порцию, уронившую воркер, в работе только одна порция
+                        while len(in_flight) < (1 if suspect_ids else 2 * workers):
+                            idx = next_work()
+                            if idx is None:
+                                break
+                            in_flight[pool.submit(_predict_chunk, chunks[idx], conf_threshold, batch_size)] = idx
+                        if not in_flight:
+                            break
+
+                        done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            idx = in_flight[future]
+                            if isinstance(future.exception(), BrokenProcessPool):
+                                raise future.exception()
+                            del in_flight[future]
+                            if future.exception() is not None:
+                                retry_or_fail(idx, future.exception())
+                            else:
+                                ready[idx], snapshot = future.result()
+                                profiler.merge(snapshot)
+                                suspect_ids.discard(idx)
+                        write_ready()
+
+                except BrokenProcessPool as e:
+                    print("⚠️ Воркер аварийно завершился, перезапускаем незавершенные порции")
+                    unfinished = []
+                    for future, idx in in_flight.items():
+                        if future.done() and future.exception() is None:
+                            ready[idx], snapshot = future.result()
+                            profiler.merge(snapshot)
+                            suspect_ids.discard(idx)
+                        else:
+                            unfinished.append(idx)
+                    if len(unfinished) == 1:
+                        # В работе была одна порция - виновник известен
+                        retry_or_fail(unfinished[0], e, crashed=True)
+                    else:
+                        # Виновник неизвестен: попытки не засчитываем, порции пойдут по одной
+                        for idx in sorted(unfinished):
+                            suspect_ids.add(idx)
+                            suspects.append(idx)
+            write_ready()
+
+        elapsed = time.time() - start_time
+        if skipped['done']:
+            print(f"⏭️ Пропущено уже обработанных: {skipped['done']}")
+        if processed:
+            print(f"⏱️ {processed} изображений за {elapsed:.1f} с "
+                  f"({processed / max(elapsed, 1e-9):.2f} изобр/с, workers={workers})")
+        if failed:
+            print(f"⚠️ Не обработано снимков: {len(failed)} (повторите запуск с --resume)")
+
+    print(f"💾 Результаты сохранены в {writer.path}")
+    if profiler.enabled:
+        print("⏱️ ЗАДЕРЖКА ПО ЭТАПАМ (на снимок, все воркеры):")
+        print(profiler.format_summary())
+    return {
+        'output': writer.path,
+        'images': processed,
+        'failed': failed,
+        'latency': profiler.summary(),
+        'class_counts': pd.Series(writer.class_counts, dtype='int64').sort_values(ascending=False)
+    }
+
+def run_detector(args, detector, tiling):
+    """Режимы main, работающие с одной моделью в основном процессе"""
+    cascade = None
+    if args.triage_model:
+        triage = ChestXRayDetector(args.triage_model, args.backend, args.int8, args.triage_imgsz,
+                                   profile=args.profile)
+        cascade = TriageCascade(triage, detector, args.suspicion)
+
+    if os.path.isfile(args.source):
+        print(f"🔍 Анализируем изображение: {args.source}")
+        if cascade is not None:
+            image = cv2.imread(args.source, cv2.IMREAD_COLOR)
+            if image is None:
+                print("❌ Не удалось прочитать изображение")
+                return
+            detections, escalated = cascade.predict_arrays([image], args.conf)
+            detections = detections[0]
+            print("🔀 Передано тяжелой модели" if escalated[0] else "🔀 Решение сортировщика")
+        elif tiling is not None:
+            detections, stats = detector.predict_tiled(args.source, args.conf, **tiling)
+            if detections is None:
+                print("❌ Не удалось прочитать изображение")
+                return
+            print(f"🧩 {stats['tiles']} тайлов, {stats['forward_passes']} проходов модели, "
+                  f"{stats['seconds'] * 1e3:.0f} мс")
+        else:
+            detections, _ = detector.predict_image(args.source, args.conf)
+
+        print("\n📋 РЕЗУЛЬТАТЫ:")
+        for det in detections:
+            print(f"   {det['class']}: {det['confidence']:.2%}")
+
+    elif args.cascade_eval:
+        evaluate_cascade(cascade, args.source, args.labels, args.conf, max(args.batch_size, 1))
+
+    elif args.benchmark and tiling is not None:
+        benchmark_tiling(detector, args.source, args.conf, **tiling)
+
+    elif args.benchmark:
+        benchmark_batching(detector, args.source, args.conf, max(args.batch_size, 2), args.loader_workers)
+
+    else:
+        print(f"📁 Анализируем директорию: {args.source}")
+        summary = detector.predict_batch(args.source, args.output, args.conf,
+                                         args.batch_size, args.loader_workers,
+                                         args.format, args.flush_every, args.resume,
+                                         recursive=not args.no_recursive, include=args.include,
+                                         exclude=args.exclude, file_list=args.file_list, tiling=tiling,
+                                         cascade=cascade)
+
+        print("\n📊 СТАТИСТИКА:")
+        print(summary['class_counts'])
 
 def main():
     parser = argparse.ArgumentParser(description='Chest X-ray detection prediction')
@@ -95,30 +871,88 @@ def main():
     parser.add_argument('--source', type=str, required=True, help='Image or directory path')
     parser.add_argument('--output', type=str, default='predictions', help='Output directory')
     parser.add_argument('--conf', type=float, default=0.5, help='Confidence threshold')
-    
+    parser.add_argument('--batch-size', type=int, default=1, help='Images per forward pass (1 = per-image mode)')
+    parser.add_argument('--loader-workers', type=int, default=4, help='Background threads decoding the next batch')
+    parser.add_argument('--benchmark', action='store_true', help='Compare per-image and batched throughput')
+    parser.add_argument('--backend', type=str, default='pytorch', choices=['pytorch', 'onnx', 'openvino'],
+                        help='Inference backend')
+    parser.add_argument('--int8', action='store_true', help='Use INT8-quantized exported model')
+    parser.add_argument('--format', type=str, default='csv', choices=['csv', 'jsonl', 'parquet'],
+                        help='Results file format')
+    parser.add_argument('--flush-every', type=int, default=100, help='Flush results to disk every N images')
+    parser.add_argument('--resume', action='store_true', help='Skip images already present in the output')
+    parser.add_argument('--imgsz', type=int, default=640, help='Inference image size')
+    parser.add_argument('--cache', type=str, help='Path to SQLite prediction cache')
+    parser.add_argument('--cache-max-mb', type=float, default=512, help='Prediction cache size limit (LRU)')
+    parser.add_argument('--workers', type=int, default=1, help='Inference processes, each with its own model')
+    parser.add_argument('--threads', type=int, help='Torch threads per worker (default: cpu_count // workers)')
+    parser.add_argument('--chunk-size', type=int, default=16, help='Images per work item in --workers mode')
+    parser.add_argument('--include', type=str, action='append', help='Glob of images to include (repeatable)')
+    parser.add_argument('--exclude', type=str, action='append', help='Glob of files/dirs to exclude (repeatable)')
+    parser.add_argument('--file-list', type=str, help='Text file with image paths instead of scanning --source')
+    parser.add_argument('--profile', action='store_true',
+                        help='Time each inference stage and print p50/p95/p99 latency at the end')
+    parser.add_argument('--tile-size', type=int,
+                        help='Tiled inference at native resolution with tiles of this size (e.g. 640)')
+    parser.add_argument('--tile-overlap', type=float, default=0.2, help='Tile overlap as a fraction of the tile')
+    parser.add_argument('--tile-merge', type=str, default='nms', choices=['nms', 'wbf'],
+                        help='How to merge boxes across tiles')
+    parser.add_argument('--tile-batch', type=int, default=8, help='Tiles per forward pass')
+    parser.add_argument('--tile-iou', type=float, default=0.5, help='IoU for merging boxes across tiles')
+    parser.add_argument('--triage-model', type=str,
+                        help='Light model (e.g. trained from lightweight_config.yaml) screening every image; '
+                             'only suspicious images go to --model')
+    parser.add_argument('--triage-imgsz', type=int, default=416, help='Triage model image size')
+    parser.add_argument('--suspicion', type=float, default=0.25,
+                        help='Triage pathology confidence at which an image is escalated to --model')
+    parser.add_argument('--cascade-eval', action='store_true',
+                        help='Evaluate escalation rate, throughput and recall lost on a labeled split (--source)')
+    parser.add_argument('--labels', type=str, help='Labels directory for --cascade-eval (default: images -> labels)')
+    parser.add_argument('--no-recursive', action='store_true', help='Do not descend into subdirectories')
+
     args = parser.parse_args()
-    
-    detector = ChestXRayDetector(args.model)
-    
-    if os.path.isfile(args.source):
-        print(f"🔍 Анализируем изображение: {args.source}")
-        detections, _ = detector.predict_image(args.source, args.conf)
-        
-        print("
-📋 РЕЗУЛЬТАТЫ:")
-        for det in detections:
-            print(f"   {det['class']}: {det['confidence']:.2%}")
-            
-    elif os.path.isdir(args.source):
-        print(f"📁 Анализируем директорию: {args.source}")
-        results_df = detector.predict_batch(args.source, args.output)
-        
-        print("
-📊 СТАТИСТИКА:")
-        print(results_df['class'].value_counts())
-        
-    else:
+
+    if not os.path.exists(args.source):
         print("❌ Указанный путь не существует")
+        return
+
+    if args.triage_model and args.tile_size:
+        print("❌ Каскад и тайловый режим не совмещаются")
+        return
+
+    tiling = None
+    if args.tile_size:
+        tiling = {'tile_size': args.tile_size, 'overlap': args.tile_overlap, 'merge': args.tile_merge,
+                  'iou_threshold': args.tile_iou, 'batch_size': args.tile_batch}
+        if args.workers > 1:
+            print("⚠️ Тайловый режим работает в одном процессе, --workers игнорируется")
+    if args.triage_model and args.workers > 1:
+        print("⚠️ Каскад работает в одном процессе, --workers игнорируется")
+    if args.cascade_eval and not (args.triage_model and os.path.isdir(args.source)):
+        print("❌ Для --cascade-eval нужны --triage-model и папка снимков в --source")
+        return
+
+    if (os.path.isdir(args.source) and args.workers > 1 and not args.benchmark and tiling is None
+            and not args.triage_model):
+        # Каждый воркер загружает свою модель - в основном процессе она не нужна
+        print(f"📁 Анализируем директорию: {args.source}")
+        detector_kwargs = {
+            'model_path': args.model, 'backend': args.backend, 'int8': args.int8, 'imgsz': args.imgsz,
+            'cache_path': args.cache, 'cache_max_mb': args.cache_max_mb, 'profile': args.profile
+        }
+        summary = predict_parallel(detector_kwargs, args.source, args.output, args.conf, args.workers,
+                                   args.threads, args.chunk_size, max(args.batch_size, 1),
+                                   args.format, args.flush_every, args.resume,
+                                   recursive=not args.no_recursive, include=args.include,
+                                   exclude=args.exclude, file_list=args.file_list)
+
+        print("\n📊 СТАТИСТИКА:")
+        print(summary['class_counts'])
+        return
+
+    with ChestXRayDetector(args.model, args.backend, args.int8, args.imgsz,
+                           args.cache, args.cache_max_mb, args.profile) as detector:
+        run_detector(args, detector, tiling)
 
 if __name__ == "__main__":
     main()
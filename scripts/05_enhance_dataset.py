@@ -3,37 +3,54 @@
 Улучшение датасета через аугментацию миноритарных классов
 """
 
+import sys
 import os
-import albumentations as A
-import cv2
-import numpy as np
-from utils.data_balancer import DataBalancer
-
-def augment_minority_class(image_dir, label_dir, target_count, output_dir):
-    """Аугментация для увеличения миноритарных классов"""
-    
-    transform = A.Compose([
-        A.HorizontalFlip(p=0.5),
-        A.RandomBrightnessContrast(p=0.2),
-        A.Rotate(limit=15, p=0.3),
-        A.GaussianBlur(blur_limit=3, p=0.1),
-    ])
-    
-    # Реализация аугментации...
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+import argparse
+from utils.data_balancer import DataBalancer, CLASS_NAMES
+from utils.augmentation_utils import augment_minority_classes
+from utils.label_index import load_label_index
+
+def augment_minority_class(image_dir, label_dir, target_count, output_dir=None, class_id=0, workers=None, seed=0):
+    """Аугментация для увеличения миноритарного класса до target_count объектов"""
     print(f"🔄 Аугментируем данные до {target_count} примеров")
+    output_images = os.path.join(output_dir, 'images') if output_dir else None
+    output_labels = os.path.join(output_dir, 'labels') if output_dir else None
+    return augment_minority_classes(image_dir, label_dir, {class_id: target_count},
+                                    output_images, output_labels, workers=workers, seed=seed)
 
 def main():
+    parser = argparse.ArgumentParser(description='Augment minority classes up to DataBalancer.target_balance')
+    parser.add_argument('--data-dir', type=str, default='./data', help='Dataset root')
+    parser.add_argument('--split', type=str, default='train', help='Split to write augmented samples into')
+    parser.add_argument('--workers', type=int, help='Augmentation processes (default: all CPUs)')
+    parser.add_argument('--seed', type=int, default=0, help='Base seed for per-sample seeds')
+    args = parser.parse_args()
+
     print("🎨 УЛУЧШЕНИЕ ДАТАСЕТА ЧЕРЕЗ АУГМЕНТАЦИЮ")
-    
-    balancer = DataBalancer()
+
+    balancer = DataBalancer(args.data_dir)
     current_counts = balancer.analyze_current_balance()
-    
-    # Аугментируем классы, где меньше целевого количества
-    for class_name, target in balancer.target_balance.items():
-        current = current_counts.get(class_name, 0)
+
+    images_dir = os.path.join(args.data_dir, 'images', args.split)
+    labels_dir = os.path.join(args.data_dir, 'labels', args.split)
+    split_counts = load_label_index(labels_dir).class_counts(len(CLASS_NAMES))
+
+    # Цель задана на весь датасет, а дописываем только в один сплит:
+    # объекты других сплитов вычитаем из цели
+    targets = {}
+    for class_id, target in balancer.target_counts().items():
+        current = current_counts.get(class_id, 0)
         if current < target:
-            print(f"Аугментируем {class_name}: {current} → {target}")
-            # augment_minority_class(...)
+            print(f"Аугментируем {CLASS_NAMES[class_id]}: {current} → {target}")
+            targets[class_id] = target - (current - int(split_counts[class_id]))
+
+    if not targets:
+        print("✅ Все классы достигли целевого баланса")
+        return
+
+    augment_minority_classes(images_dir, labels_dir, targets, workers=args.workers, seed=args.seed)
 
 if __name__ == "__main__":
     main()
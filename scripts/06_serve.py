@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+HTTP-сервис инференса с динамическим микробатчингом
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+import argparse
+import asyncio
+import importlib
+import time
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+import numpy as np
+from aiohttp import web
+
+ChestXRayDetector = importlib.import_module('scripts.04_predict').ChestXRayDetector
+
+def detections_to_json(detections):
+    """Перевод детекций в JSON-совместимый вид"""
+    return [{
+        'class': det['class'],
+        'confidence': det['confidence'],
+        'bbox': None if det['bbox'] is None else [float(v) for v in det['bbox']]
+    } for det in detections]
+
+class MicroBatcher:
+    """Очередь запросов, которая собирает снимки в батчи для одной модели.
+
+    Батч уходит в модель, когда набралось max_batch_size снимков
+    или с момента прихода первого снимка прошло max_wait_ms.
+    """
+
+    def __init__(self, detector, conf_threshold=0.5, max_batch_size=8, max_wait_ms=10, max_queue=256):
+        self.detector = detector
+        self.conf_threshold = conf_threshold
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        # Один поток для модели: батчи выполняются строго по очереди
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.stats = {'requests': 0, 'batches': 0, 'images': 0}
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        # Дожидаемся текущего батча, чтобы детектор можно было закрыть после остановки
+        self.executor.shutdown(wait=True)
+
+    async def submit(self, image):
+        """Поставить снимок в очередь и дождаться его детекций"""
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((image, future))
+        self.stats['requests'] += 1
+        return await future
+
+    async def _collect_batch(self):
+        batch = [await self.queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect_batch()
+            images = [image for image, _ in batch]
+            try:
+                results = await loop.run_in_executor(
+                    self.executor, self.detector.predict_arrays, images, self.conf_threshold
+                )
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            self.stats['batches'] += 1
+            self.stats['images'] += len(batch)
+            for (_, future), detections in zip(batch, results):
+                if not future.done():
+                    future.set_result(detections)
+
+async def handle_predict(request):
+    """POST /predict - снимок в теле запроса (raw) или в поле image (multipart)"""
+    if request.content_type.startswith('multipart/'):
+        data = None
+        reader = await request.multipart()
+        async for part in reader:
+            if part.name == 'image':
+                data = await part.read()
+                break
+    else:
+        data = await request.read()
+
+    if not data:
+        return web.json_response({'error': 'empty request body'}, status=400)
+
+    loop = asyncio.get_running_loop()
+    image = await loop.run_in_executor(
+        request.app['decode_pool'], cv2.imdecode, np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR
+    )
+    if image is None:
+        return web.json_response({'error': 'cannot decode image'}, status=400)
+
+    start = time.perf_counter()
+    detections = await request.app['batcher'].submit(image)
+    return web.json_response({
+        'detections': detections_to_json(detections),
+        'latency_ms': (time.perf_counter() - start) * 1000
+    })
+
+async def handle_health(request):
+    """GET /health - сервис запущен и модель загружена"""
+    return web.json_response({'status': 'ok', 'model': request.app['model_path']})
+
+async def handle_queue(request):
+    """GET /queue - глубина очереди и счетчики батчей"""
+    batcher = request.app['batcher']
+    stats = dict(batcher.stats)
+    stats['queue_depth'] = batcher.queue.qsize()
+    stats['avg_batch_size'] = stats['images'] / stats['batches'] if stats['batches'] else 0.0
+    return web.json_response(stats)
+
+def create_app(model_path, conf_threshold=0.5, max_batch_size=8, max_wait_ms=10, max_queue=256,
+               backend='pytorch', int8=False, imgsz=640):
+    """Создание aiohttp-приложения; модель загружается один раз при старте.
+
+    backend='onnx'/'openvino' (и int8) - экспортированная модель для CPU; экспорт
+    делается при старте, если его еще нет для этого imgsz или веса изменились.
+    """
+    print(f"🧠 Загружаем модель: {model_path} ({backend}{' INT8' if int8 else ''}, imgsz={imgsz})")
+    detector = ChestXRayDetector(model_path, backend, int8, imgsz)
+
+    app = web.Application(client_max_size=64 * 1024 * 1024)
+    app['model_path'] = detector.model_path
+    app['decode_pool'] = ThreadPoolExecutor(max_workers=4)
+
+    async def on_startup(app):
+        app['batcher'] = MicroBatcher(detector, conf_threshold, max_batch_size, max_wait_ms, max_queue)
+        app['batcher'].start()
+
+    async def on_cleanup(app):
+        await app['batcher'].stop()
+        app['decode_pool'].shutdown(wait=False)
+        detector.close()
+
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+    app.router.add_post('/predict', handle_predict)
+    app.router.add_get('/health', handle_health)
+    app.router.add_get('/queue', handle_queue)
+    return app
+
+def main():
+    parser = argparse.ArgumentParser(description='Chest X-ray detection inference server')
+    parser.add_argument('--model', type=str, required=True, help='Path to trained model')
+    parser.add_argument('--host', type=str, default='0.0.0.0', help='Bind address')
+    parser.add_argument('--port', type=int, default=8080, help='Port')
+    parser.add_argument('--conf', type=float, default=0.5, help='Confidence threshold')
+    parser.add_argument('--imgsz', type=int, default=640, help='Inference image size')
+    parser.add_argument('--backend', type=str, default='pytorch', choices=['pytorch', 'onnx', 'openvino'],
+                        help='Inference backend')
+    parser.add_argument('--int8', action='store_true', help='Use INT8-quantized exported model')
+    parser.add_argument('--max-batch-size', type=int, default=8, help='Flush a micro-batch at this many images')
+    parser.add_argument('--max-wait-ms', type=float, default=10, help='Flush a micro-batch after this wait')
+    parser.add_argument('--max-queue', type=int, default=256, help='Max queued images before clients wait')
+
+    args = parser.parse_args()
+
+    app = create_app(args.model, args.conf, args.max_batch_size, args.max_wait_ms, args.max_queue,
+                     args.backend, args.int8, args.imgsz)
+    print(f"🚀 Сервис запущен: http://{args.host}:{args.port}")
+    web.run_app(app, host=args.host, port=args.port, print=None)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Нагрузочное тестирование сервиса инференса: задержки p50/p99 и пропускная способность
+"""
+
+import argparse
+import asyncio
+import os
+import time
+import aiohttp
+import numpy as np
+
+async def run_load_test(url, image_paths, total_requests, concurrency):
+    """Отправка total_requests запросов с заданной конкурентностью"""
+    payloads = []
+    for path in image_paths:
+        with open(path, 'rb') as f:
+            payloads.append(f.read())
+
+    latencies = []
+    errors = 0
+    counter = iter(range(total_requests))
+
+    async def worker(session):
+        nonlocal errors
+        for i in counter:
+            data = payloads[i % len(payloads)]
+            start = time.perf_counter()
+            try:
+                async with session.post(f"{url}/predict", data=data,
+                                        headers={'Content-Type': 'application/octet-stream'}) as resp:
+                    await resp.read()
+                    if resp.status != 200:
+                        errors += 1
+                        continue
+            except aiohttp.ClientError:
+                errors += 1
+                continue
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(session) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+        async with session.get(f"{url}/queue") as resp:
+            server_stats = await resp.json()
+
+    latencies = np.array(latencies)
+    report = {
+        'requests': total_requests,
+        'errors': errors,
+        'concurrency': concurrency,
+        'throughput_rps': len(latencies) / elapsed,
+        'p50_ms': float(np.percentile(latencies, 50)) if len(latencies) else None,
+        'p99_ms': float(np.percentile(latencies, 99)) if len(latencies) else None,
+        'avg_batch_size': server_stats.get('avg_batch_size')
+    }
+
+    print("📈 РЕЗУЛЬТАТЫ НАГРУЗОЧНОГО ТЕСТА:")
+    print(f"   Запросов: {total_requests} (ошибок: {errors}), конкурентность: {concurrency}")
+    print(f"   Пропускная способность: {report['throughput_rps']:.2f} запр/с")
+    if report['p50_ms'] is not None:
+        print(f"   Задержка p50: {report['p50_ms']:.1f} мс, p99: {report['p99_ms']:.1f} мс")
+    print(f"   Средний размер батча на сервере: {report['avg_batch_size']:.2f}")
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test for the inference server')
+    parser.add_argument('--url', type=str, default='http://127.0.0.1:8080', help='Server URL')
+    parser.add_argument('--source', type=str, required=True, help='Image or directory of images to send')
+    parser.add_argument('--requests', type=int, default=200, help='Total requests')
+    parser.add_argument('--concurrency', type=int, default=16, help='Concurrent clients')
+
+    args = parser.parse_args()
+
+    if os.path.isdir(args.source):
+        image_paths = [os.path.join(args.source, f) for f in sorted(os.listdir(args.source))
+                       if f.endswith(('.jpg', '.png', '.jpeg'))]
+    else:
+        image_paths = [args.source]
+
+    if not image_paths:
+        print("❌ Нет изображений для отправки")
+        return
+
+    asyncio.run(run_load_test(args.url.rstrip('/'), image_paths, args.requests, args.concurrency))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+"""
+Экспорт модели в ONNX / OpenVINO для CPU, INT8-квантизация и проверка соответствия PyTorch
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+import argparse
+from utils.export_utils import export_model, compare_backends, list_images
+
+def main():
+    parser = argparse.ArgumentParser(description='Export model for CPU inference')
+    parser.add_argument('--model', type=str, required=True, help='Path to best.pt')
+    parser.add_argument('--format', type=str, default='onnx', choices=['onnx', 'openvino'], help='Export format')
+    parser.add_argument('--imgsz', type=int, default=640, help='Input image size')
+    parser.add_argument('--int8', action='store_true', help='Post-training INT8 quantization')
+    parser.add_argument('--calib-dir', type=str, default='./data/images/val', help='Calibration images (ONNX INT8)')
+    parser.add_argument('--data', type=str, default='./data/data.yaml', help='Data config (OpenVINO INT8 calibration)')
+    parser.add_argument('--calib-size', type=int, default=100, help='Number of calibration images')
+    parser.add_argument('--compare', type=str, help='Directory of images for parity and latency check')
+    parser.add_argument('--compare-limit', type=int, default=50, help='Max images for parity check')
+    parser.add_argument('--conf', type=float, default=0.25, help='Confidence threshold for parity check')
+
+    args = parser.parse_args()
+
+    exported = export_model(args.model, args.format, args.imgsz, args.int8,
+                            args.calib_dir, args.data, args.calib_size)
+
+    if args.compare:
+        image_paths = list_images(args.compare, args.compare_limit)
+        compare_backends(args.model, exported, image_paths, args.conf, args.imgsz)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+"""
+Стратифицированное разбиение датасета через списки снимков (без перемещения файлов)
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+import argparse
+import time
+from utils.data_balancer import DataBalancer
+
+def main():
+    parser = argparse.ArgumentParser(description='Stratified, patient-grouped train/val/test and k-fold manifests')
+    parser.add_argument('--data-dir', type=str, default='./data', help='Dataset root with images/ and labels/')
+    parser.add_argument('--metadata', type=str, default='Data_Entry_2017.csv', help='NIH metadata CSV (Patient ID)')
+    parser.add_argument('--ratios', type=float, nargs=3, default=[0.7, 0.15, 0.15], help='train val test')
+    parser.add_argument('--k-folds', type=int, default=0, help='K folds over train+val (test stays held out)')
+    parser.add_argument('--seed', type=int, default=42, help='Seed for tie-breaking')
+    parser.add_argument('--output', type=str, help='Output dir for lists and data.yaml variants')
+    args = parser.parse_args()
+
+    print("✂️ РАЗБИЕНИЕ ДАТАСЕТА")
+    if not os.path.exists(args.metadata):
+        print(f"⚠️ Метаданные {args.metadata} не найдены: каждый снимок - отдельная группа")
+
+    start = time.perf_counter()
+    balancer = DataBalancer(args.data_dir)
+    outputs = balancer.create_split_manifests(metadata_csv=args.metadata, ratios=args.ratios,
+                                              k_folds=args.k_folds, seed=args.seed, output_dir=args.output)
+    print(f"⏱️ Готово за {time.perf_counter() - start:.1f} с")
+    for path in outputs:
+        print(f"   {path}")
+
+if __name__ == "__main__":
+    main()
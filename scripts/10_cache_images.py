@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Предекодирование сплитов в memory-mapped кэш и замер эпохи с кэшем и без
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+import argparse
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import psutil
+import yaml
+from ultralytics import YOLO
+from utils.image_cache import attach_image_cache, load_image_cache, split_image_paths
+
+def process_memory():
+    """(RSS, PSS) процесса и его воркеров в МБ; PSS делит общие страницы memmap между процессами"""
+    processes = [psutil.Process()]
+    processes += processes[0].children(recursive=True)
+    rss, pss = 0, 0
+    for p in processes:
+        try:
+            info = p.memory_full_info()
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            continue
+        rss += info.rss
+        pss += getattr(info, 'pss', info.rss)
+    return rss / 1024 ** 2, pss / 1024 ** 2
+
+def measure_training(model_path, data_yaml, imgsz, epochs, batch, workers, use_cache, cache_dir):
+    """Обучение без валидации с замером времени каждой эпохи и пиковой памяти"""
+    model = YOLO(model_path)
+    if use_cache:
+        attach_image_cache(model, cache_dir, workers)
+
+    epoch_times, peak = [], {'rss': 0.0, 'pss': 0.0}
+    state = {}
+
+    def on_train_epoch_start(trainer):
+        state['start'] = time.perf_counter()
+
+    def on_train_batch_end(trainer):
+        rss, pss = process_memory()
+        peak['rss'], peak['pss'] = max(peak['rss'], rss), max(peak['pss'], pss)
+
+    def on_train_epoch_end(trainer):
+        epoch_times.append(time.perf_counter() - state['start'])
+
+    model.add_callback('on_train_epoch_start', on_train_epoch_start)
+    model.add_callback('on_train_batch_end', on_train_batch_end)
+    model.add_callback('on_train_epoch_end', on_train_epoch_end)
+    model.train(data=data_yaml, epochs=epochs, imgsz=imgsz, batch=batch, workers=workers, device='cpu',
+                val=False, plots=False, exist_ok=True, name='cache_benchmark', verbose=False)
+    return epoch_times, peak
+
+def main():
+    parser = argparse.ArgumentParser(description='Build memory-mapped image caches and benchmark epoch time')
+    parser.add_argument('--data', type=str, default='./data/data.yaml', help='data.yaml')
+    parser.add_argument('--config', type=str, help='Training config to take imgsz from (e.g. configs/lightweight_config.yaml)')
+    parser.add_argument('--imgsz', type=int, default=640, help='Target size (overridden by --config)')
+    parser.add_argument('--cache-dir', type=str, default='./data/cache', help='Where to store caches')
+    parser.add_argument('--workers', type=int, default=4, help='Decode threads / dataloader workers')
+    parser.add_argument('--benchmark', action='store_true', help='Compare epoch time and memory with and without cache')
+    parser.add_argument('--model', type=str, default='yolov8n.pt', help='Model for --benchmark')
+    parser.add_argument('--epochs', type=int, default=2, help='Epochs for --benchmark')
+    parser.add_argument('--batch', type=int, default=8, help='Batch for --benchmark')
+    args = parser.parse_args()
+
+    imgsz = args.imgsz
+    if args.config:
+        with open(args.config, 'r') as f:
+            imgsz = yaml.safe_load(f).get('imgsz', imgsz)
+
+    print(f"💾 КЭШ СНИМКОВ (imgsz={imgsz})")
+    for split in ('train', 'val'):
+        paths = split_image_paths(args.data, split)
+        if paths:
+            cache = load_image_cache(paths, os.path.join(args.cache_dir, f"{split}_{imgsz}"), imgsz, args.workers)
+            print(f"   {split}: {len(cache)} снимков")
+
+    if not args.benchmark:
+        return
+
+    # Каждый замер в отдельном процессе, чтобы память первого прогона не попала во второй
+    results = {}
+    for use_cache in (False, True):
+        label = 'с кэшем' if use_cache else 'без кэша'
+        print(f"\n⏱️ Обучение {label}...")
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as pool:
+            results[label] = pool.submit(measure_training, args.model, args.data, imgsz, args.epochs,
+                                         args.batch, args.workers, use_cache, args.cache_dir).result()
+
+    print("\n📊 ЭПОХА И ПАМЯТЬ:")
+    for label, (epoch_times, peak) in results.items():
+        times = ', '.join(f"{t:.1f}" for t in epoch_times)
+        print(f"   {label}: эпохи [{times}] с, пик RSS {peak['rss']:.0f} МБ, пик PSS {peak['pss']:.0f} МБ")
+
+if __name__ == "__main__":
+    main()
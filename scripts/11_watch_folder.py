@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+Демон: инференс новых снимков, которые появляются в папке (выгрузка из PACS)
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+import argparse
+import importlib
+import queue
+import signal
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+from utils.folder_watcher import FolderWatcher, atomic_write_json
+from utils.prediction_writer import detection_rows
+
+ChestXRayDetector = importlib.import_module('scripts.04_predict').ChestXRayDetector
+
+class WatchDaemon:
+    """Наблюдатель за папкой и батчевый инференс через ограниченную очередь.
+
+    Поток наблюдателя кладет готовые снимки в очередь на max_queue путей; когда
+    инференс отстает, постановка блокируется и наблюдатель перестает читать
+    события, поэтому память не растет (события копятся в ядре, при переполнении
+    папка пересматривается целиком). Основной поток собирает батчи до batch_size
+    снимков или max_wait_ms, пишет результат в <output>/<снимок>.json и затем
+    маркер обработки - оба атомарно.
+    """
+
+    def __init__(self, detector, watcher, output_dir, conf_threshold=0.5, batch_size=8, max_queue=64,
+                 max_wait_ms=200, loader_workers=4):
+        self.detector = detector
+        self.watcher = watcher
+        self.output_dir = output_dir
+        self.conf_threshold = conf_threshold
+        self.batch_size = batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.loader = ThreadPoolExecutor(max_workers=loader_workers)
+        # Снимки в очереди или в обработке: повторный обход папки не ставит их еще раз
+        self.in_flight = set()
+        self._lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self._producer_done = threading.Event()
+        self.stats = Counter()
+
+    def stop(self, *_):
+        self.stop_event.set()
+
+    def _produce(self, once):
+        try:
+            while not self.stop_event.is_set():
+                with self._lock:
+                    busy = set(self.in_flight)
+                for path, stat in self.watcher.ready(1.0, busy):
+                    with self._lock:
+                        self.in_flight.add(path)
+                    self._put((path, stat))
+                    if self.stop_event.is_set():
+                        return
+                # --once: выходим, когда все найденные при старте файлы дописаны и поставлены в очередь
+                if once and not self.watcher.pending:
+                    return
+        finally:
+            self._producer_done.set()
+
+    def _put(self, item):
+        """Постановка в очередь с ожиданием: обратное давление на наблюдателя"""
+        start = None
+        while not self.stop_event.is_set():
+            try:
+                self.queue.put(item, timeout=0.5)
+                break
+            except queue.Full:
+                start = start or time.monotonic()
+        if start is not None:
+            self.stats['backpressure_s'] += time.monotonic() - start
+
+    def _next_batch(self):
+        try:
+            batch = [self.queue.get(timeout=0.5)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def result_path(self, path):
+        return os.path.join(self.output_dir, self.watcher.relpath(path) + '.json')
+
+    def _process(self, batch):
+        try:
+            images = list(self.loader.map(lambda item: cv2.imread(item[0], cv2.IMREAD_COLOR), batch))
+            readable = [(item, image) for item, image in zip(batch, images) if image is not None]
+            for (path, stat), image in zip(batch, images):
+                if image is None:
+                    # Файл дописан, но не декодируется - не повторяем, пока его не перезапишут
+                    print(f"⚠️ Не удалось прочитать изображение: {path}")
+                    self.watcher.mark_done(path, stat, error='cannot decode image')
+                    self.stats['failed'] += 1
+
+            if readable:
+                detections = self.detector.predict_arrays([image for _, image in readable], self.conf_threshold)
+                for ((path, stat), _), image_detections in zip(readable, detections):
+                    try:
+                        current = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    if (current.st_size, current.st_mtime_ns) != (stat.st_size, stat.st_mtime_ns):
+                        # Файл перезаписали во время обработки - новая версия придет отдельным событием
+                        continue
+                    rel = self.watcher.relpath(path)
+                    rows = detection_rows(rel, image_detections)
+                    atomic_write_json(self.result_path(path), {
+                        'image': rel,
+                        'detections': [{k: v for k, v in row.items() if k != 'image'} for row in rows],
+                        'model': self.detector.model_path,
+                        'conf_threshold': self.conf_threshold,
+                        'processed_at': time.strftime('%Y-%m-%dT%H:%M:%S')
+                    })
+                    self.watcher.mark_done(path, stat, result=os.path.relpath(self.result_path(path), self.output_dir))
+                    self.stats['processed'] += 1
+
+            self.stats['batches'] += 1
+        except Exception as e:
+            # Демон продолжает работу; необработанные снимки найдет повторный обход папки
+            print(f"❌ Ошибка обработки батча ({len(batch)} снимков): {e}")
+            self.stats['errors'] += 1
+            self.watcher.request_rescan()
+        finally:
+            with self._lock:
+                self.in_flight.difference_update(path for path, _ in batch)
+
+    def _report(self, start):
+        elapsed = max(time.monotonic() - start, 1e-9)
+        print(f"📊 Обработано {self.stats['processed']} ({self.stats['processed'] / elapsed:.2f} изобр/с), "
+              f"ошибок {self.stats['failed']}, в очереди {self.queue.qsize()}/{self.queue.maxsize}, "
+              f"ожидают дозаписи {len(self.watcher.pending)}, "
+              f"обратное давление {self.stats['backpressure_s']:.1f} с")
+
+    def run(self, once=False, stats_every=30):
+        """Основной цикл до сигнала остановки (SIGINT/SIGTERM) или, при once, до обработки текущих файлов"""
+        producer = threading.Thread(target=self._produce, args=(once,), name='folder-watcher', daemon=True)
+        producer.start()
+        start = last_report = time.monotonic()
+        try:
+            while not self.stop_event.is_set():
+                batch = self._next_batch()
+                if batch:
+                    self._process(batch)
+                elif self._producer_done.is_set() and self.queue.empty():
+                    break
+                if stats_every and time.monotonic() - last_report >= stats_every:
+                    self._report(start)
+                    last_report = time.monotonic()
+        finally:
+            self.stop_event.set()
+            producer.join(timeout=5)
+            self.loader.shutdown(wait=True)
+            self.watcher.close()
+        self._report(start)
+        return self.stats
+
+def main():
+    parser = argparse.ArgumentParser(description='Watch a directory and run detection on new X-rays')
+    parser.add_argument('--model', type=str, required=True, help='Path to trained model')
+    parser.add_argument('--watch', type=str, required=True, help='Directory where new images appear')
+    parser.add_argument('--output', type=str, default='predictions/watch',
+                        help='Directory for per-image result JSON files')
+    parser.add_argument('--state-dir', type=str,
+                        help='Directory for processed-file markers (default: <output>/.processed)')
+    parser.add_argument('--conf', type=float, default=0.5, help='Confidence threshold')
+    parser.add_argument('--imgsz', type=int, default=640, help='Inference image size')
+    parser.add_argument('--backend', type=str, default='pytorch', choices=['pytorch', 'onnx', 'openvino'],
+                        help='Inference backend')
+    parser.add_argument('--int8', action='store_true', help='Use INT8-quantized exported model')
+    parser.add_argument('--batch-size', type=int, default=8, help='Max images per forward pass')
+    parser.add_argument('--max-wait-ms', type=float, default=200, help='Run a partial batch after this wait')
+    parser.add_argument('--max-queue', type=int, default=64,
+                        help='Max queued images; the watcher blocks when inference falls behind')
+    parser.add_argument('--loader-workers', type=int, default=4, help='Threads decoding a batch')
+    parser.add_argument('--settle', type=float, default=2.0,
+                        help='Seconds a file size/mtime must stay unchanged before it is processed')
+    parser.add_argument('--poll-interval', type=float, default=2.0, help='Rescan interval without inotify')
+    parser.add_argument('--polling', action='store_true', help='Force polling instead of inotify')
+    parser.add_argument('--no-recursive', action='store_true', help='Do not watch subdirectories')
+    parser.add_argument('--once', action='store_true', help='Process files already present and exit')
+    parser.add_argument('--stats-every', type=float, default=30, help='Print progress every N seconds (0 = off)')
+
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.watch):
+        print("❌ Папка для наблюдения не существует")
+        return
+
+    detector = ChestXRayDetector(args.model, args.backend, args.int8, args.imgsz)
+    watcher = FolderWatcher(args.watch, args.state_dir or os.path.join(args.output, '.processed'),
+                            args.settle, args.poll_interval, not args.no_recursive, not args.polling)
+    daemon = WatchDaemon(detector, watcher, args.output, args.conf, args.batch_size, args.max_queue,
+                         args.max_wait_ms, args.loader_workers)
+    signal.signal(signal.SIGINT, daemon.stop)
+    signal.signal(signal.SIGTERM, daemon.stop)
+
+    print(f"👀 Наблюдаем за {os.path.abspath(args.watch)} ({watcher.mode}), результаты в {args.output}")
+    try:
+        stats = daemon.run(args.once, args.stats_every)
+    finally:
+        detector.close()
+    print(f"✅ Остановлено: обработано {stats['processed']} снимков за {stats['batches']} батчей")
+
+if __name__ == "__main__":
+    main()
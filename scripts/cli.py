@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Единая точка входа: chestxray <команда> [аргументы команды]
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import importlib
+import json
+import subprocess
+
+# Команда -> (модуль скрипта, описание). Модуль импортируется только при запуске
+# своей команды, поэтому torch/ultralytics не грузятся ради анализа или --help
+COMMANDS = {
+    'download': ('scripts.00_download_and_prepare_data', 'Скачивание NIH и подготовка снимков'),
+    'analyze': ('scripts.01_analyze_data', 'Баланс классов и целостность датасета'),
+    'train': ('scripts.02_train_model', 'Обучение модели'),
+    'evaluate': ('scripts.03_evaluate_model', 'Оценка модели'),
+    'predict': ('scripts.04_predict', 'Детекция на новых снимках'),
+    'enhance': ('scripts.05_enhance_dataset', 'Аугментация миноритарных классов'),
+    'serve': ('scripts.06_serve', 'HTTP-сервис инференса'),
+    'load-test': ('scripts.07_load_test', 'Нагрузочный тест сервиса'),
+    'export': ('scripts.08_export_model', 'Экспорт в ONNX / OpenVINO'),
+    'split': ('scripts.09_split_dataset', 'Стратифицированное разбиение и k-fold'),
+    'cache': ('scripts.10_cache_images', 'Memory-mapped кэш снимков'),
+    'watch': ('scripts.11_watch_folder', 'Демон: инференс новых снимков из папки'),
+}
+
+# Команды, которые не должны импортировать тяжелые библиотеки, и сами библиотеки
+LIGHT_COMMANDS = ('analyze', 'split')
+HEAVY_MODULES = ('torch', 'ultralytics', 'matplotlib', 'seaborn', 'sklearn', 'albumentations')
+
+def measure_import(command):
+    """Импорт модуля команды в чистом интерпретаторе: (секунды, загруженные тяжелые библиотеки)"""
+    code = (
+        "import sys, time, json, importlib\n"
+        f"sys.path.insert(0, {os.path.dirname(os.path.dirname(os.path.abspath(__file__)))!r})\n"
+        "start = time.perf_counter()\n"
+        f"importlib.import_module({COMMANDS[command][0]!r})\n"
+        "elapsed = time.perf_counter() - start\n"
+        f"heavy = sorted(m for m in {HEAVY_MODULES!r} if m in sys.modules)\n"
+        "print(json.dumps([elapsed, heavy]))\n"
+    )
+    output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True).stdout
+    elapsed, heavy = json.loads(output.strip().splitlines()[-1])
+    return elapsed, heavy
+
+def check_import_budget(commands=LIGHT_COMMANDS, budget_s=1.0):
+    """Проверка времени старта легких команд: True, если все уложились в бюджет без тяжелых импортов"""
+    ok = True
+    for command in commands:
+        elapsed, heavy = measure_import(command)
+        passed = elapsed <= budget_s and not heavy
+        ok &= passed
+        status = '✅' if passed else '❌'
+        details = f", тяжелые импорты: {', '.join(heavy)}" if heavy else ''
+        print(f"{status} {command}: импорт {elapsed:.2f} с (бюджет {budget_s:.2f} с){details}")
+    return ok
+
+def build_parser():
+    commands = '\n'.join(f"  {name:<11} {description}" for name, (_, description) in COMMANDS.items())
+    parser = argparse.ArgumentParser(
+        prog='chestxray', formatter_class=argparse.RawDescriptionHelpFormatter,
+        description='Chest X-ray detection toolkit',
+        epilog=f"команды:\n{commands}\n  check-imports  Бюджет времени импорта легких команд (для CI)\n\n"
+               "Справка по команде: chestxray <команда> --help")
+    parser.add_argument('command', choices=list(COMMANDS) + ['check-imports'], metavar='command')
+    return parser
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    args = build_parser().parse_args(argv[:1] or ['--help'])
+    rest = argv[1:]
+
+    if args.command == 'check-imports':
+        parser = argparse.ArgumentParser(prog='chestxray check-imports')
+        parser.add_argument('--budget', type=float, default=1.0, help='Seconds allowed per command import')
+        parser.add_argument('--commands', nargs='+', default=list(LIGHT_COMMANDS), choices=list(COMMANDS))
+        options = parser.parse_args(rest)
+        return 0 if check_import_budget(options.commands, options.budget) else 1
+
+    module = importlib.import_module(COMMANDS[args.command][0])
+    # Скрипты разбирают sys.argv сами - подставляем аргументы команды
+    sys.argv = [f"chestxray {args.command}"] + rest
+    return module.main()
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,5 +1,5 @@
 
-from setuptools import setup, find_packages
+from setuptools import setup, find_namespace_packages
 import os
 
 # Read the contents of README.md
@@ -42,12 +42,14 @@ setup(
         "Topic :: Scientific/Engineering :: Medical Science Apps.",
         "Topic :: Scientific/Engineering :: Artificial Intelligence",
     ],
-    packages=find_packages(where=".", exclude=["tests", "tests.*"]),
+    # scripts/ и utils/ без __init__.py - ищем их как namespace-пакеты
+    packages=find_namespace_packages(where=".", include=["scripts", "utils"]),
     package_dir={"": "."},
     python_requires=">=3.8",
     install_requires=requirements,
     entry_points={
         'console_scripts': [
+            'chestxray=scripts.cli:main',
             'cxr-analyze=scripts.01_analyze_data:main',
             'cxr-train=scripts.02_train_model:main',
             'cxr-evaluate=scripts.03_evaluate_model:main',
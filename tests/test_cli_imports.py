@@ -0,0 +1,30 @@
+"""
+Бюджет времени импорта легких команд CLI: анализ и разбиение не тянут torch и компанию
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from scripts.cli import HEAVY_MODULES, LIGHT_COMMANDS, check_import_budget, measure_import
+
+# Тот же бюджет, что и в CI (chestxray check-imports --budget 1.0)
+BUDGET_S = 1.0
+
+@pytest.mark.parametrize('command', LIGHT_COMMANDS)
+def test_light_command_skips_heavy_modules(command):
+    elapsed, heavy = measure_import(command)
+
+    assert heavy == [], f"{command} импортирует {', '.join(heavy)}"
+    assert elapsed <= BUDGET_S
+
+def test_check_import_budget_passes_for_light_commands():
+    assert check_import_budget(LIGHT_COMMANDS, BUDGET_S)
+
+def test_heavy_imports_are_detected():
+    # Проверка самой проверки: инференс обязан грузить torch и ultralytics
+    _, heavy = measure_import('predict')
+
+    assert {'torch', 'ultralytics'} <= set(heavy)
+    assert set(heavy) <= set(HEAVY_MODULES)
@@ -0,0 +1,125 @@
+"""
+Докачка и потоковая распаковка против локального HTTP-сервера, который рвет соединение
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import hashlib
+import io
+import tarfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from utils.download_utils import download_file, make_session, stream_extract
+
+PAYLOAD = os.urandom(300_000)
+
+class FlakyHandler(BaseHTTPRequestHandler):
+    """Отдает server.payload с поддержкой Range; первые server.drops ответов
+    обрываются на середине тела (Content-Length при этом полный)"""
+
+    def do_GET(self):
+        server = self.server
+        payload = server.payload
+        range_header = self.headers.get('Range')
+        server.requests.append(range_header)
+        start = int(range_header.split('=')[1].split('-')[0]) if range_header else 0
+        if start >= len(payload):
+            self.send_response(416)
+            self.end_headers()
+            return
+
+        body = payload[start:]
+        self.send_response(206 if range_header else 200)
+        if range_header:
+            self.send_header('Content-Range', f"bytes {start}-{len(payload) - 1}/{len(payload)}")
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Accept-Ranges', 'bytes')
+        self.end_headers()
+
+        if server.drops > 0:
+            server.drops -= 1
+            self.wfile.write(body[:len(body) // 2])
+            self.wfile.flush()
+            self.close_connection = True
+            return
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), FlakyHandler)
+    httpd.payload = PAYLOAD
+    httpd.drops = 0
+    httpd.requests = []
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+def _url(httpd, name='file.bin'):
+    return f"http://127.0.0.1:{httpd.server_address[1]}/{name}"
+
+def test_resume_after_dropped_connection(server, tmp_path):
+    server.drops = 1
+    target = tmp_path / 'file.bin'
+    digest = download_file(make_session(retries=0), _url(server), str(target), max_attempts=3)
+
+    assert target.read_bytes() == PAYLOAD
+    assert digest == hashlib.sha256(PAYLOAD).hexdigest()
+    assert not (tmp_path / 'file.bin.part').exists()
+    # Повторный запрос продолжает с места обрыва, а не скачивает файл заново
+    assert server.requests[0] is None
+    assert server.requests[1] == f"bytes={len(PAYLOAD) // 2}-"
+
+def test_existing_part_is_continued_with_range(server, tmp_path):
+    target = tmp_path / 'file.bin'
+    (tmp_path / 'file.bin.part').write_bytes(PAYLOAD[:1000])
+    download_file(make_session(retries=0), _url(server), str(target), hashlib.sha256(PAYLOAD).hexdigest())
+
+    assert server.requests == ['bytes=1000-']
+    assert target.read_bytes() == PAYLOAD
+
+def test_sha256_mismatch_is_rejected(server, tmp_path):
+    server.drops = 1
+    target = tmp_path / 'file.bin'
+    with pytest.raises(ValueError):
+        download_file(make_session(retries=0), _url(server), str(target), '0' * 64, max_attempts=3)
+
+    assert len(server.requests) == 2
+    assert not target.exists()
+    assert not (tmp_path / 'file.bin.part').exists()
+
+def test_gives_up_after_max_attempts(server, tmp_path):
+    server.drops = 10
+    with pytest.raises(Exception):
+        download_file(make_session(retries=0), _url(server), str(tmp_path / 'file.bin'), max_attempts=2)
+    assert len(server.requests) == 2
+
+def test_stream_extract_rereads_archive_after_drop(server, tmp_path):
+    files = {f"images/{i:03d}.png": os.urandom(20_000) for i in range(10)}
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode='w:gz') as archive:
+        for name, data in files.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+    server.payload = buffer.getvalue()
+    server.drops = 1
+
+    wanted = ['001.png', '008.png']
+    remaining = {name: str(tmp_path / 'out' / name) for name in wanted}
+    extracted, _ = stream_extract(make_session(retries=0), _url(server, 'images.tar.gz'), remaining,
+                                  threading.Lock(), max_attempts=3)
+
+    assert not remaining
+    assert extracted == len(wanted)
+    for name in wanted:
+        assert (tmp_path / 'out' / name).read_bytes() == files[f"images/{name}"]
+    # Архив после обрыва читается с начала: gzip-поток нельзя продолжить с середины
+    assert server.requests == [None, None]
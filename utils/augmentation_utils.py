@@ -0,0 +1,225 @@
+
+import os
+import random
+import zlib
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+import albumentations as A
+import cv2
+import numpy as np
+from utils.file_discovery import iter_images
+from utils.label_index import load_label_index
+
+def build_transform():
+    """Аугментации для рентгеновских снимков с корректным пересчетом YOLO-боксов"""
+    return A.Compose([
+        A.HorizontalFlip(p=0.5),
+        A.RandomBrightnessContrast(p=0.2),
+        A.Rotate(limit=15, p=0.3),
+        A.GaussianBlur(blur_limit=3, p=0.1),
+    ], bbox_params=A.BboxParams(format='yolo', label_fields=['class_labels', 'box_ids'], min_visibility=0.3))
+
+def sample_seed(base_seed, name):
+    """Детерминированный seed образца - не зависит от процесса и порядка выполнения"""
+    return zlib.crc32(f"{base_seed}:{name}".encode()) & 0x7FFFFFFF
+
+def _clip_yolo(boxes):
+    """Обрезка YOLO-боксов (xywh, 0..1) по границам снимка - albumentations не принимает выходящие"""
+    xyxy = np.concatenate([boxes[:, :2] - boxes[:, 2:] / 2, boxes[:, :2] + boxes[:, 2:] / 2], axis=1)
+    xyxy = np.clip(xyxy, 0.0, 1.0)
+    wh = xyxy[:, 2:] - xyxy[:, :2]
+    return np.concatenate([xyxy[:, :2] + wh / 2, wh], axis=1), (wh > 0).all(axis=1)
+
+def augment_sample(transform, image, class_ids, boxes, seed=None):
+    """Аугментация одного снимка; возвращает (снимок, class_ids, boxes, индексы сохраненных боксов)"""
+    if seed is not None:
+        random.seed(seed)
+        np.random.seed(seed)
+        if hasattr(transform, 'set_random_seed'):
+            transform.set_random_seed(seed)
+
+    boxes, valid = _clip_yolo(np.asarray(boxes, np.float32).reshape(-1, 4))
+    ids = np.where(valid)[0]
+    result = transform(image=image, bboxes=boxes[ids], class_labels=np.asarray(class_ids)[ids].tolist(),
+                       box_ids=ids.tolist())
+    kept = np.asarray(result['box_ids'], np.int64)
+    return (result['image'], np.asarray(result['class_labels'], np.int64),
+            np.asarray(result['bboxes'], np.float32).reshape(-1, 4), kept)
+
+# Трансформация процесса-воркера (создается один раз на процесс)
+_worker_transform = None
+
+def _init_worker():
+    global _worker_transform
+    cv2.setNumThreads(1)
+    _worker_transform = build_transform()
+
+def _augment_chunk(tasks):
+    """Аугментация порции снимков в воркере; результат в памяти для пакетной записи"""
+    outputs = []
+    for image_path, class_ids, boxes, seed, name in tasks:
+        image = cv2.imread(image_path)
+        if image is None:
+            continue
+        aug_image, aug_cls, aug_boxes, _ = augment_sample(_worker_transform, image, class_ids, boxes, seed)
+        if len(aug_cls) == 0:
+            continue
+        ok, encoded = cv2.imencode('.jpg', aug_image, [cv2.IMWRITE_JPEG_QUALITY, 95])
+        if not ok:
+            continue
+        label_text = ''.join(f"{c} {x:.6f} {y:.6f} {w:.6f} {h:.6f}\n"
+                             for c, (x, y, w, h) in zip(aug_cls.tolist(), aug_boxes.tolist()))
+        outputs.append((name, encoded.tobytes(), label_text, aug_cls.tolist()))
+    return outputs
+
+def augment_minority_classes(images_dir, labels_dir, targets, output_images_dir=None, output_labels_dir=None,
+                             workers=None, seed=0, chunk_size=16, max_rounds=20):
+    """Аугментация миноритарных классов, пока каждый класс не достигнет целевого числа объектов.
+
+    targets - {class_id: целевое количество}. Работа идет раундами: в каждом
+    считается недостача по классам, снимки с этими классами аугментируются на пуле
+    процессов, результаты пишутся порциями, счетчики обновляются по фактически
+    сохраненным боксам. Имя и seed образца детерминированы, повторный запуск
+    продолжает нумерацию, а не перезаписывает файлы.
+    """
+    output_images_dir = output_images_dir or images_dir
+    output_labels_dir = output_labels_dir or labels_dir
+    os.makedirs(output_images_dir, exist_ok=True)
+    os.makedirs(output_labels_dir, exist_ok=True)
+
+    index = load_label_index(labels_dir)
+    counts = Counter({c: int(n) for c, n in enumerate(index.class_counts())})
+    existing = set(os.path.basename(os.path.splitext(f)[0]) for f in index.files)
+
+    images = {}
+    for path in iter_images(images_dir):
+        images[os.path.splitext(os.path.relpath(path, images_dir))[0]] = path
+
+    # Источники по классам: исходные (не аугментированные) снимки, где класс присутствует
+    sources = {c: [] for c in targets}
+    for i, label_file in enumerate(index.files):
+        stem = os.path.splitext(label_file)[0]
+        if '_aug' in os.path.basename(stem) or stem not in images:
+            continue
+        class_ids, _ = index.labels_for(i)
+        for c in set(class_ids.tolist()) & set(sources):
+            sources[c].append(i)
+
+    for c in targets:
+        if targets[c] > counts[c] and not sources[c]:
+            print(f"⚠️ Класс {c}: нет исходных снимков с объектами, аугментация невозможна")
+
+    uses = Counter()
+    added = Counter()
+
+    def next_name(i):
+        stem = os.path.splitext(index.files[i])[0].replace(os.sep, '__')
+        while True:
+            name = f"{stem}_aug{uses[i]}"
+            uses[i] += 1
+            if name not in existing:
+                existing.add(name)
+                return name
+
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1, initializer=_init_worker) as pool:
+        for round_idx in range(max_rounds):
+            deficits = {c: targets[c] - counts[c] for c in targets if targets[c] > counts[c] and sources[c]}
+            if not deficits:
+                break
+
+            tasks = []
+            for c, deficit in deficits.items():
+                per_image = max(1.0, np.mean([np.sum(index.labels_for(i)[0] == c) for i in sources[c]]))
+                for k in range(int(np.ceil(deficit / per_image))):
+                    i = sources[c][k % len(sources[c])]
+                    class_ids, boxes = index.labels_for(i)
+                    name = next_name(i)
+                    stem = os.path.splitext(index.files[i])[0]
+                    tasks.append((images[stem], class_ids, boxes, sample_seed(seed, name), name))
+
+            print(f"🔄 Раунд {round_idx + 1}: недостача {deficits}, задач {len(tasks)}")
+            chunks = [tasks[i:i + chunk_size] for i in range(0, len(tasks), chunk_size)]
+            produced = 0
+            for outputs in pool.map(_augment_chunk, chunks):
+                # Пакетная запись результатов порции
+                for name, image_bytes, label_text, class_ids in outputs:
+                    with open(os.path.join(output_images_dir, name + '.jpg'), 'wb') as f:
+                        f.write(image_bytes)
+                    with open(os.path.join(output_labels_dir, name + '.txt'), 'w') as f:
+                        f.write(label_text)
+                    counts.update(class_ids)
+                    added.update(class_ids)
+                    produced += 1
+            if produced == 0:
+                print("⚠️ Раунд не дал новых образцов, останавливаемся")
+                break
+
+    print(f"✅ Добавлено объектов по классам: {dict(added)}")
+    return dict(added)
+
+class MinorityAugmentation:
+    """Трансформация для пайплайна обучения ultralytics: аугментирует в памяти
+    только снимки, содержащие миноритарные классы, ничего не записывая на диск."""
+
+    def __init__(self, minority_classes, p=0.5):
+        self.minority = np.array(sorted(minority_classes), np.int64)
+        self.p = p
+        self.transform = build_transform()
+
+    def __call__(self, labels):
+        cls = labels['cls'].reshape(-1).astype(np.int64)
+        if not np.isin(cls, self.minority).any() or random.random() >= self.p:
+            return labels
+
+        image = labels['img']
+        instances = labels['instances']
+        instances.convert_bbox('xywh')
+        instances.normalize(*image.shape[:2][::-1])
+
+        aug_image, _, aug_boxes, kept = augment_sample(self.transform, image, cls, instances.bboxes)
+        labels['img'] = np.ascontiguousarray(aug_image)
+        labels['instances'] = instances[kept]
+        labels['instances'].update(bboxes=aug_boxes)
+        labels['cls'] = labels['cls'][kept]
+        return labels
+
+def _insert_into_pipeline(dataset, augmentation):
+    """Вставка аугментации в пайплайн датасета (перед Format); False, если уже вставлена"""
+    pipeline = getattr(dataset.transforms, 'transforms', None)
+    if pipeline is None or any(isinstance(t, MinorityAugmentation) for t in pipeline):
+        return False
+    # Перед Format - он переводит боксы в формат для лосса
+    pos = len(pipeline) - 1 if pipeline and type(pipeline[-1]).__name__ == 'Format' else len(pipeline)
+    pipeline.insert(pos, augmentation)
+    return True
+
+class _CloseMosaicHook:
+    """Обертка dataset.close_mosaic: пайплайн пересобирается посреди эпохи, возвращаем аугментацию.
+    Класс, а не замыкание - датасет должен оставаться picklable для воркеров даталоадера."""
+
+    def __init__(self, dataset, original, augmentation):
+        self.dataset = dataset
+        self.original = original
+        self.augmentation = augmentation
+
+    def __call__(self, hyp):
+        self.original(hyp)
+        _insert_into_pipeline(self.dataset, self.augmentation)
+
+def attach_minority_augmentation(model, minority_classes, p=0.5):
+    """Подключение MinorityAugmentation к датасету обучения YOLO через колбэки тренера"""
+    augmentation = MinorityAugmentation(minority_classes, p)
+
+    def on_pretrain_routine_end(trainer):
+        dataset = trainer.train_loader.dataset
+        if not _insert_into_pipeline(dataset, augmentation):
+            return
+        if hasattr(dataset, 'close_mosaic'):
+            dataset.close_mosaic = _CloseMosaicHook(dataset, dataset.close_mosaic, augmentation)
+        # Воркеры даталоадера держат копию датасета - пересоздаем их
+        if hasattr(trainer.train_loader, 'reset'):
+            trainer.train_loader.reset()
+        print(f"🎨 Аугментация на лету для классов {augmentation.minority.tolist()} (p={p})")
+
+    model.add_callback('on_pretrain_routine_end', on_pretrain_routine_end)
+    return augmentation
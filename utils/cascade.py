@@ -0,0 +1,85 @@
+
+import os
+import numpy as np
+from utils.label_index import parse_label_file
+from utils.tiling import box_iou
+
+# Классы находок; норма (2) не повышает подозрительность снимка
+PATHOLOGY_CLASSES = (0, 1)
+
+def suspicion_score(boxes_cls, boxes_conf, pathology_classes=PATHOLOGY_CLASSES):
+    """Подозрительность снимка по детекциям модели-сортировщика: максимальная
+    уверенность среди находок патологий (0, если их нет)"""
+    mask = np.isin(boxes_cls, pathology_classes)
+    return float(boxes_conf[mask].max()) if mask.any() else 0.0
+
+def labels_dir_for(images_dir):
+    """Папка разметки YOLO для папки снимков: .../images/val -> .../labels/val"""
+    parts = os.path.normpath(images_dir).split(os.sep)
+    if 'images' not in parts:
+        raise ValueError(f"Не удалось найти разметку для {images_dir}: укажите папку labels явно")
+    idx = len(parts) - 1 - parts[::-1].index('images')
+    parts[idx] = 'labels'
+    return os.sep.join(parts)
+
+def load_ground_truth(labels_dir, stem, width, height, pathology_classes=PATHOLOGY_CLASSES):
+    """Рамки находок из YOLO-разметки снимка в пикселях: (классы [n], xyxy [n, 4])"""
+    class_ids, xywh = parse_label_file(os.path.join(labels_dir, stem + '.txt'))
+    keep = np.isin(class_ids, pathology_classes)
+    class_ids, xywh = class_ids[keep].astype(np.int64), xywh[keep]
+    scale = np.array([width, height, width, height], np.float32)
+    xyxy = np.concatenate([xywh[:, :2] - xywh[:, 2:] / 2, xywh[:, :2] + xywh[:, 2:] / 2], axis=1) * scale
+    return class_ids, xyxy
+
+def matched_findings(pred, gt, conf_threshold=0.5, iou_threshold=0.5):
+    """Число найденных рамок разметки: жадное сопоставление по классу и IoU.
+
+    pred и gt - (классы, xyxy[, уверенности]); предсказания ниже conf_threshold не учитываются.
+    """
+    pred_cls, pred_xyxy, pred_conf = pred
+    gt_cls, gt_xyxy = gt
+    keep = pred_conf >= conf_threshold
+    pred_cls, pred_xyxy, pred_conf = pred_cls[keep], pred_xyxy[keep], pred_conf[keep]
+    used = np.zeros(len(gt_cls), bool)
+    found = 0
+    for i in np.argsort(-pred_conf, kind='stable'):
+        candidates = np.flatnonzero((gt_cls == pred_cls[i]) & ~used)
+        if not candidates.size:
+            continue
+        ious = box_iou(pred_xyxy[i], gt_xyxy[candidates])
+        best = int(np.argmax(ious))
+        if ious[best] >= iou_threshold:
+            used[candidates[best]] = True
+            found += 1
+    return found
+
+def cascade_operating_points(scores, triage_found, heavy_found, gt_counts, triage_s, heavy_s, thresholds):
+    """Точки работы каскада по порогу подозрительности без повторного инференса.
+
+    scores - подозрительность по сортировщику на снимок; *_found - найденные рамки
+    разметки каждой моделью на снимок; gt_counts - рамок разметки на снимок;
+    triage_s / heavy_s - время сортировщика / тяжелой модели на снимок.
+    Для каждого порога: доля переданных тяжелой модели снимков, оценка пропускной
+    способности, recall каскада и потеря recall относительно тяжелой модели на всех снимках.
+    """
+    scores, triage_found, heavy_found, gt_counts = map(np.asarray, (scores, triage_found, heavy_found, gt_counts))
+    triage_s, heavy_s = np.asarray(triage_s, np.float64), np.asarray(heavy_s, np.float64)
+    total_gt = max(int(gt_counts.sum()), 1)
+    heavy_recall = float(heavy_found.sum() / total_gt)
+    has_findings = gt_counts > 0
+    points = []
+    for threshold in thresholds:
+        escalated = scores >= threshold
+        recall = float(np.where(escalated, heavy_found, triage_found).sum() / total_gt)
+        seconds = float(triage_s.sum() + heavy_s[escalated].sum())
+        points.append({
+            'threshold': float(threshold),
+            'escalated': float(escalated.mean()) if len(scores) else 0.0,
+            'images_per_sec': len(scores) / seconds if seconds > 0 else 0.0,
+            'recall': recall,
+            'recall_lost': heavy_recall - recall,
+            # Доля снимков с находками, которые сортировщик пропустил мимо тяжелой модели
+            'missed_studies': float((has_findings & ~escalated).sum() / max(has_findings.sum(), 1))
+        })
+    return {'heavy_recall': heavy_recall, 'heavy_images_per_sec': len(scores) / max(float(heavy_s.sum()), 1e-9),
+            'points': points}
@@ -1,8 +1,14 @@
-import pandas as pd
+import numpy as np
 import os
-import shutil
-from sklearn.model_selection import train_test_split
 import yaml
+from utils.file_discovery import iter_images
+from utils.label_index import load_label_index
+from utils.file_placement import materialize_files
+from utils.split_utils import (SPLIT_NAMES, stratified_group_split, stratified_group_kfold,
+                               split_class_distribution, write_image_list, write_split_data_yaml)
+
+# Классы YOLO (порядок как в data.yaml)
+CLASS_NAMES = {0: 'clavicle_fracture', 1: 'foreign_body_bronchus', 2: 'normal'}
 
 class DataBalancer:
     """Класс для балансировки и управления медицинским датасетом"""
@@ -19,28 +25,28 @@ class DataBalancer:
         """Анализ текущего баланса датасета"""
         class_counts = {0: 0, 1: 0, 2: 0}  # YOLO классы
         
+        # Счетчики берутся из индекса разметки: перечитываются только измененные файлы
         for split in ['train', 'val', 'test']:
             labels_path = os.path.join(self.data_dir, 'labels', split)
             if os.path.exists(labels_path):
-                for label_file in os.listdir(labels_path):
-                    if label_file.endswith('.txt'):
-                        with open(os.path.join(labels_path, label_file), 'r') as f:
-                            for line in f:
-                                if line.strip():
-                                    class_id = int(line.split()[0])
-                                    class_counts[class_id] += 1
+                counts = load_label_index(labels_path).class_counts()
+                for class_id, count in enumerate(counts):
+                    class_counts[class_id] = class_counts.get(class_id, 0) + int(count)
         
         print("📊 ТЕКУЩИЙ БАЛАНС ДАТАСЕТА:")
-        class_names = {0: 'clavicle_fracture', 1: 'foreign_body_bronchus', 2: 'normal'}
         for class_id, count in class_counts.items():
-            print(f"   {class_names[class_id]}: {count} снимков")
+            print(f"   {CLASS_NAMES.get(class_id, class_id)}: {count} снимков")
         
         return class_counts
     
+    def target_counts(self):
+        """Целевой баланс по id классов YOLO (target_balance задан по именам)"""
+        class_ids = {name: class_id for class_id, name in CLASS_NAMES.items()}
+        return {class_ids[name]: target for name, target in self.target_balance.items()}
+    
     def recommend_actions(self, current_counts):
         """Рекомендации по балансировке"""
-        print("
-🎯 РЕКОМЕНДАЦИИ ПО БАЛАНСИРОВКЕ:")
+        print("\n🎯 РЕКОМЕНДАЦИИ ПО БАЛАНСИРОВКЕ:")
         
         for class_id, target in self.target_balance.items():
             class_name = class_id
@@ -54,36 +60,110 @@ class DataBalancer:
             else:
                 print(f"   ✅ {class_name}: оптимальное количество")
     
-    def create_balanced_splits(self, image_files, label_files, class_id):
-        """Создание сбалансированных разделов train/val/test"""
+    def create_balanced_splits(self, image_files, presence, groups=None, ratios=(0.7, 0.15, 0.15), seed=42):
+        """Создание сбалансированных разделов train/val/test.
+
+        presence - матрица [снимки x классы] из индекса разметки, groups - Patient ID
+        снимка: стратификация по всем классам сразу, пациент целиком в одном сплите.
+        """
         if len(image_files) == 0:
             return [], [], []
         
-        # Первый раздел: train
-        train_files = image_files[:int(len(image_files) * 0.7)]
-        remaining = image_files[len(train_files):]
+        assignment = stratified_group_split(presence, groups, ratios, seed)
+        image_files = np.asarray(image_files, dtype=object)
+        return tuple(image_files[assignment == i].tolist() for i in range(len(SPLIT_NAMES)))
+    
+    def load_split_arrays(self, images_dir=None, labels_dir=None, metadata_csv=None):
+        """Снимки, матрица классов и группы (пациенты) для разбиения без перемещения файлов.
+
+        Группа берется из Patient ID метаданных NIH (Data_Entry_2017.csv) по имени
+        снимка; снимки без метаданных образуют собственную группу.
+        """
+        # pandas и pyarrow нужны только для разбиения - анализ баланса их не импортирует
+        import pandas as pd
+        from utils.metadata_store import MetadataStore
+        
+        images_dir = images_dir or os.path.join(self.data_dir, 'images')
+        labels_dir = labels_dir or os.path.join(self.data_dir, 'labels')
+        
+        image_paths = np.array(list(iter_images(images_dir)), dtype=object)
+        stems = [os.path.splitext(os.path.relpath(p, images_dir))[0] for p in image_paths]
+        
+        index = load_label_index(labels_dir)
+        file_presence = index.image_class_presence(len(CLASS_NAMES))
+        rows = {os.path.splitext(f)[0]: i for i, f in enumerate(index.files)}
+        label_rows = np.array([rows.get(stem, -1) for stem in stems], np.int64)
+        presence = np.zeros((len(image_paths), len(CLASS_NAMES)), bool)
+        presence[label_rows >= 0] = file_presence[label_rows[label_rows >= 0]]
         
-        # Второй раздел: val и test
-        val_files = remaining[:len(remaining)//2]
-        test_files = remaining[len(remaining)//2:]
+        names = pd.Series([os.path.basename(p) for p in image_paths])
+        groups = names.to_numpy(dtype=object)
+        if metadata_csv and os.path.exists(metadata_csv):
+            metadata = MetadataStore(metadata_csv).df[['Image Index', 'Patient ID']].drop_duplicates('Image Index')
+            patients = names.map(metadata.set_index('Image Index')['Patient ID'])
+            groups = np.where(patients.notna(), 'patient_' + patients.astype(str), groups)
+        return image_paths, presence, groups
+    
+    def create_split_manifests(self, images_dir=None, labels_dir=None, metadata_csv=None,
+                               ratios=(0.7, 0.15, 0.15), k_folds=0, seed=42, output_dir=None):
+        """Разбиение без перемещения файлов: YOLO-списки снимков и варианты data.yaml.
+
+        Пишет train/val/test.txt и data_split.yaml; при k_folds > 1 test остается
+        отложенным, а train+val делятся на K фолдов (fold{i}_train/val.txt и
+        data_fold{i}.yaml).
+        """
+        output_dir = output_dir or os.path.join(self.data_dir, 'splits')
+        data_yaml = os.path.join(self.data_dir, 'data.yaml')
+        image_paths, presence, groups = self.load_split_arrays(images_dir, labels_dir, metadata_csv)
+        if len(image_paths) == 0:
+            raise FileNotFoundError(f"Нет снимков для разбиения в {images_dir or self.data_dir}")
+        
+        assignment = stratified_group_split(presence, groups, ratios, seed)
+        lists = {}
+        for i, split in enumerate(SPLIT_NAMES):
+            lists[split] = write_image_list(image_paths[assignment == i], os.path.join(output_dir, f'{split}.txt'))
+        outputs = [write_split_data_yaml(data_yaml, lists, os.path.join(output_dir, 'data_split.yaml'))]
+        
+        print("📊 РАСПРЕДЕЛЕНИЕ КЛАССОВ ПО СПЛИТАМ:")
+        print(split_class_distribution(presence, assignment, SPLIT_NAMES, CLASS_NAMES.values()).to_string())
         
-        return train_files, val_files, test_files
+        if k_folds > 1:
+            pool = np.where(assignment != SPLIT_NAMES.index('test'))[0]
+            folds = stratified_group_kfold(presence[pool], groups[pool], k_folds, seed)
+            for fold in range(k_folds):
+                fold_lists = {
+                    'train': write_image_list(image_paths[pool[folds != fold]],
+                                              os.path.join(output_dir, f'fold{fold}_train.txt')),
+                    'val': write_image_list(image_paths[pool[folds == fold]],
+                                            os.path.join(output_dir, f'fold{fold}_val.txt')),
+                    'test': lists['test']
+                }
+                outputs.append(write_split_data_yaml(data_yaml, fold_lists,
+                                                     os.path.join(output_dir, f'data_fold{fold}.yaml')))
+            print(f"🔁 {k_folds} фолдов: {np.bincount(folds, minlength=k_folds).tolist()} снимков")
+        
+        print(f"✅ Манифесты разбиения: {output_dir}")
+        return outputs
     
-    def copy_files_to_structure(self, files, source_dir, target_image_dir, target_label_dir):
-        """Копирование файлов в целевую структуру"""
+    def copy_files_to_structure(self, files, source_dir, target_image_dir, target_label_dir,
+                                mode='auto', workers=8, manifest_path=None):
+        """Размещение изображений и разметки в целевой структуре.
+
+        mode: auto (hardlink, затем reflink, затем копия), hardlink, reflink, symlink
+        или copy. Уже размещенные идентичные файлы пропускаются, манифест по
+        умолчанию пишется рядом с папкой изображений сплита.
+        """
+        pairs = []
         for file in files:
-            # Копируем изображение
-            img_src = os.path.join(source_dir, 'images', file)
-            img_dst = os.path.join(target_image_dir, file)
-            if os.path.exists(img_src):
-                shutil.copy2(img_src, img_dst)
-            
-            # Копируем разметку
+            pairs.append((os.path.join(source_dir, 'images', file), os.path.join(target_image_dir, file)))
             label_file = os.path.splitext(file)[0] + '.txt'
-            label_src = os.path.join(source_dir, 'labels', label_file)
-            label_dst = os.path.join(target_label_dir, label_file)
-            if os.path.exists(label_src):
-                shutil.copy2(label_src, label_dst)
+            pairs.append((os.path.join(source_dir, 'labels', label_file), os.path.join(target_label_dir, label_file)))
+
+        if manifest_path is None:
+            manifest_path = os.path.normpath(target_image_dir) + '.manifest.csv'
+        stats = materialize_files(pairs, mode, workers, manifest_path)
+        print(f"📁 {target_image_dir}: {stats}")
+        return stats
 
 def check_dataset_quality(data_dir):
     """Проверка качества и целостности датасета"""
@@ -99,10 +179,9 @@ def check_dataset_quality(data_dir):
             issues.append(f"❌ Отсутствует папка для {split}")
             continue
         
-        images = set([f.split('.')[0] for f in os.listdir(images_dir) 
-                     if f.endswith(('.jpg', '.png', '.jpeg'))])
-        labels = set([f.split('.')[0] for f in os.listdir(labels_dir) 
-                     if f.endswith('.txt')])
+        # Сопоставляем по относительному пути без расширения (с учетом вложенных папок)
+        images = set(os.path.splitext(os.path.relpath(p, images_dir))[0] for p in iter_images(images_dir))
+        labels = load_label_index(labels_dir).stems()
         
         # Проверяем соответствие изображений и разметки
         missing_labels = images - labels
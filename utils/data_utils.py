@@ -1,19 +1,17 @@
 import os
-import cv2
-import numpy as np
 import yaml
 from collections import Counter
-import matplotlib.pyplot as plt
-import seaborn as sns
-from sklearn.model_selection import train_test_split
+from utils.label_index import load_label_index, parse_label_file
 
 def check_dataset_balance(labels_path):
-    """Анализ баланса датасета"""
-    with open(labels_path, 'r') as f:
-        labels = [line.strip().split()[0] for line in f if line.strip()]
-    
-    class_counts = Counter(labels)
-    total = len(labels)
+    """Анализ баланса датасета (labels_path - папка разметки сплита или отдельный файл)"""
+    if os.path.isdir(labels_path):
+        counts = load_label_index(labels_path).class_counts()
+        class_counts = Counter({class_id: int(c) for class_id, c in enumerate(counts) if c})
+    else:
+        class_ids, _ = parse_label_file(labels_path)
+        class_counts = Counter(class_ids.tolist())
+    total = sum(class_counts.values())
     
     print("📊 АНАЛИЗ БАЛАНСА ДАТАСЕТА:")
     print("-" * 40)
@@ -22,7 +20,8 @@ def check_dataset_balance(labels_path):
         percentage = (count / total) * 100
         print(f"Класс {class_id}: {count} примеров ({percentage:.1f}%)")
     
-    # Визуализация
+    # Визуализация (matplotlib импортируется только здесь - анализ без графиков стартует быстрее)
+    import matplotlib.pyplot as plt
     plt.figure(figsize=(10, 6))
     plt.bar(class_counts.keys(), class_counts.values())
     plt.title('Распределение классов в датасете')
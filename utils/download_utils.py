@@ -0,0 +1,263 @@
+
+import os
+import time
+import hashlib
+import tarfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import requests
+import urllib3
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from tqdm import tqdm
+
+CHUNK_SIZE = 1 << 20
+
+# Сетевые ошибки, после которых докачиваем с места обрыва
+RESUMABLE_ERRORS = (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError)
+
+def make_session(pool_size=8, retries=3):
+    """Session с пулом соединений: один TCP/TLS-handshake на хост вместо запроса на каждый файл"""
+    retry = Retry(total=retries, connect=retries, backoff_factor=0.5,
+                  status_forcelist=(429, 500, 502, 503, 504), allowed_methods=('GET', 'HEAD'))
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+def file_sha256(path, chunk_size=CHUNK_SIZE):
+    """SHA-256 файла, читаемого порциями"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(chunk_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def load_checksum_manifest(path):
+    """Манифест в формате sha256sum: '<sha256>  <имя файла>' в каждой строке"""
+    checksums = {}
+    if path and os.path.exists(path):
+        with open(path, 'r') as f:
+            for line in f:
+                parts = line.strip().split(maxsplit=1)
+                if len(parts) == 2 and not parts[0].startswith('#'):
+                    checksums[parts[1].lstrip('*')] = parts[0].lower()
+    return checksums
+
+def save_checksum_manifest(path, checksums):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write(''.join(f"{digest}  {name}\n" for name, digest in sorted(checksums.items())))
+    os.replace(tmp_path, path)
+
+def _iter_available(response, chunk_size):
+    """Порции тела ответа по мере поступления (до chunk_size байт).
+
+    read1 отдает уже принятые байты, не дожидаясь полной порции, поэтому при
+    обрыве в .part остается все полученное до него; iter_content в этом случае
+    теряет недочитанную порцию (до chunk_size байт на каждый обрыв).
+    """
+    read1 = getattr(response.raw, 'read1', None)
+    if read1 is None:
+        yield from response.iter_content(chunk_size=chunk_size)
+        return
+    while True:
+        data = read1(chunk_size)
+        if not data:
+            return
+        yield data
+
+def download_file(session, url, filepath, expected_sha256=None, chunk_size=CHUNK_SIZE,
+                  max_attempts=10, timeout=60, position=None):
+    """Скачивание с докачкой: данные пишутся в filepath.part, после обрыва запрос
+    повторяется с заголовком Range с текущего размера. Готовый файл проверяется по
+    SHA-256 и атомарно переименовывается. Возвращает SHA-256 файла.
+    """
+    if os.path.exists(filepath):
+        if expected_sha256 is None:
+            return file_sha256(filepath)
+        if file_sha256(filepath) == expected_sha256:
+            return expected_sha256
+        print(f"⚠️ {os.path.basename(filepath)}: контрольная сумма не совпадает, скачиваем заново")
+        os.remove(filepath)
+
+    part_path = filepath + '.part'
+    bar = tqdm(desc=os.path.basename(filepath), unit='iB', unit_scale=True, unit_divisor=1024,
+               position=position, leave=position is None)
+    try:
+        for attempt in range(1, max_attempts + 1):
+            offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+            headers = {'Range': f'bytes={offset}-'} if offset else {}
+            try:
+                with session.get(url, headers=headers, stream=True, timeout=timeout) as response:
+                    if response.status_code == 416:
+                        # Файл уже скачан целиком
+                        break
+                    response.raise_for_status()
+                    if offset and response.status_code != 206:
+                        # Сервер не поддерживает Range - начинаем сначала
+                        offset = 0
+                    length = int(response.headers.get('content-length', 0))
+                    bar.reset(total=offset + length if length else None)
+                    bar.update(offset)
+                    with open(part_path, 'ab' if offset else 'wb') as f:
+                        for data in _iter_available(response, chunk_size):
+                            bar.update(f.write(data))
+                    if length and os.path.getsize(part_path) < offset + length:
+                        raise requests.exceptions.ChunkedEncodingError("Соединение закрыто до конца файла")
+                break
+            except RESUMABLE_ERRORS + (urllib3.exceptions.HTTPError,) as e:
+                if attempt == max_attempts:
+                    raise
+                delay = min(2 ** (attempt - 1), 30) * 0.5
+                bar.write(f"🔁 {os.path.basename(filepath)}: обрыв ({type(e).__name__}), "
+                          f"докачка через {delay:.1f} с (попытка {attempt + 1}/{max_attempts})")
+                time.sleep(delay)
+    finally:
+        bar.close()
+
+    digest = file_sha256(part_path)
+    if expected_sha256 is not None and digest != expected_sha256:
+        os.remove(part_path)
+        raise ValueError(f"{os.path.basename(filepath)}: SHA-256 {digest} не совпадает с манифестом {expected_sha256}")
+    os.replace(part_path, filepath)
+    return digest
+
+def download_files(urls, dest_dir, workers=4, manifest_path=None, session=None, **kwargs):
+    """Параллельное скачивание {имя файла: url} в dest_dir с проверкой по манифесту.
+
+    Файлы, которых нет в манифесте, после скачивания добавляются в него - при
+    следующих запусках они уже проверяются.
+    """
+    os.makedirs(dest_dir, exist_ok=True)
+    session = session or make_session(pool_size=workers)
+    checksums = load_checksum_manifest(manifest_path)
+
+    results, failed = {}, {}
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = {
+            pool.submit(download_file, session, url, os.path.join(dest_dir, name),
+                        checksums.get(name), position=i, **kwargs): name
+            for i, (name, url) in enumerate(urls.items())
+        }
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                results[name] = future.result()
+            except Exception as e:
+                failed[name] = e
+
+    if manifest_path:
+        new_entries = {name: digest for name, digest in results.items() if name not in checksums}
+        if new_entries:
+            checksums.update(new_entries)
+            save_checksum_manifest(manifest_path, checksums)
+
+    for name, e in sorted(failed.items()):
+        print(f"❌ {name}: {e}")
+    print(f"✅ Скачано и проверено {len(results)} из {len(urls)} файлов")
+    return results, failed
+
+class _ProgressReader:
+    """Обертка потока ответа для tarfile: считает прочитанные байты"""
+
+    def __init__(self, raw, bar):
+        self.raw = raw
+        self.bar = bar
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        data = self.raw.read(size)
+        self.bytes_read += len(data)
+        self.bar.update(len(data))
+        return data
+
+def stream_extract(session, url, remaining, lock, timeout=60, max_attempts=10, position=None):
+    """Распаковка нужных файлов из tar.gz прямо из HTTP-потока, без сохранения архива.
+
+    remaining - общий для всех потоков словарь {имя файла: путь назначения};
+    извлеченные файлы удаляются из него, и как только он опустел, соединение
+    закрывается - остаток архива не скачивается. После обрыва архив читается
+    заново (gzip-поток нельзя продолжить с середины), уже извлеченные файлы
+    пропускаются. Возвращает (число извлеченных файлов, скачано байт).
+    """
+    extracted, downloaded = 0, 0
+    bar = tqdm(desc=os.path.basename(url), unit='iB', unit_scale=True, unit_divisor=1024,
+               position=position, leave=position is None)
+    try:
+        for attempt in range(1, max_attempts + 1):
+            if not remaining:
+                break
+            reader = None
+            try:
+                with session.get(url, stream=True, timeout=timeout) as response:
+                    response.raise_for_status()
+                    bar.reset(total=int(response.headers.get('content-length', 0)) or None)
+                    # Распаковкой gzip занимается tarfile, а не urllib3
+                    response.raw.decode_content = False
+                    reader = _ProgressReader(response.raw, bar)
+                    with tarfile.open(fileobj=reader, mode='r|gz') as archive:
+                        for member in archive:
+                            with lock:
+                                target = remaining.get(os.path.basename(member.name))
+                            if target is None or not member.isfile():
+                                if not remaining:
+                                    break
+                                continue
+                            data = archive.extractfile(member).read()
+                            os.makedirs(os.path.dirname(target), exist_ok=True)
+                            tmp_path = target + '.part'
+                            with open(tmp_path, 'wb') as f:
+                                f.write(data)
+                            os.replace(tmp_path, target)
+                            extracted += 1
+                            with lock:
+                                remaining.pop(os.path.basename(member.name), None)
+                            if not remaining:
+                                break
+                downloaded += reader.bytes_read
+                break
+            except RESUMABLE_ERRORS + (urllib3.exceptions.HTTPError, tarfile.ReadError, EOFError) as e:
+                downloaded += reader.bytes_read if reader else 0
+                if attempt == max_attempts:
+                    raise
+                delay = min(2 ** (attempt - 1), 30) * 0.5
+                bar.write(f"🔁 {os.path.basename(url)}: обрыв ({type(e).__name__}), "
+                          f"перечитываем архив через {delay:.1f} с (попытка {attempt + 1}/{max_attempts})")
+                time.sleep(delay)
+    finally:
+        bar.close()
+    return extracted, downloaded
+
+def extract_from_archives(urls, wanted, workers=4, session=None, **kwargs):
+    """Параллельное потоковое извлечение {имя файла: путь назначения} из списка tar.gz-архивов.
+
+    Уже существующие файлы назначения не скачиваются повторно. Возвращает
+    (число извлеченных файлов, скачано байт, имена, которых нет ни в одном архиве).
+    """
+    remaining = {name: path for name, path in wanted.items() if not os.path.exists(path)}
+    skipped = len(wanted) - len(remaining)
+    if skipped:
+        print(f"⏭️ Уже извлечено: {skipped} файлов")
+    session = session or make_session(pool_size=workers)
+    lock = threading.Lock()
+
+    extracted, downloaded = 0, 0
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = [pool.submit(stream_extract, session, url, remaining, lock, position=i, **kwargs)
+                   for i, url in enumerate(urls)]
+        for future in as_completed(futures):
+            try:
+                count, size = future.result()
+            except Exception as e:
+                print(f"❌ Ошибка при извлечении: {e}")
+                continue
+            extracted += count
+            downloaded += size
+
+    missing = sorted(remaining)
+    print(f"✅ Извлечено {extracted} файлов, скачано {downloaded / 1024 ** 2:.1f} МБ")
+    if missing:
+        print(f"⚠️ Не найдено в архивах: {len(missing)} файлов")
+    return extracted, downloaded, missing
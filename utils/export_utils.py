@@ -0,0 +1,260 @@
+
+import os
+import json
+import time
+import shutil
+from itertools import islice
+import cv2
+import numpy as np
+from ultralytics import YOLO
+from utils.file_discovery import iter_images
+from utils.prediction_cache import file_sha256
+
+try:
+    import openvino  # noqa: F401
+    HAS_OPENVINO = True
+except ImportError:
+    HAS_OPENVINO = False
+
+BACKENDS = ('pytorch', 'onnx', 'openvino')
+
+def letterbox(image, imgsz=640, color=(114, 114, 114)):
+    """Масштабирование с сохранением пропорций и паддингом до квадрата imgsz (как в YOLO)"""
+    h, w = image.shape[:2]
+    scale = min(imgsz / h, imgsz / w)
+    new_w, new_h = int(round(w * scale)), int(round(h * scale))
+    if (new_w, new_h) != (w, h):
+        image = cv2.resize(image, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+
+    pad_w, pad_h = (imgsz - new_w) / 2, (imgsz - new_h) / 2
+    top, bottom = int(round(pad_h - 0.1)), int(round(pad_h + 0.1))
+    left, right = int(round(pad_w - 0.1)), int(round(pad_w + 0.1))
+    return cv2.copyMakeBorder(image, top, bottom, left, right, cv2.BORDER_CONSTANT, value=color)
+
+def _to_input_tensor(image, imgsz):
+    """BGR uint8 -> RGB float32 NCHW в диапазоне 0..1"""
+    image = letterbox(image, imgsz)[:, :, ::-1].transpose(2, 0, 1)
+    return np.ascontiguousarray(image, dtype=np.float32)[None] / 255.0
+
+def list_images(images_dir, limit=None):
+    """Список изображений в папке (рекурсивно, в порядке обхода, не более limit)"""
+    if not os.path.isdir(images_dir):
+        return []
+    return list(islice(iter_images(images_dir), limit))
+
+def exported_model_path(model_path, backend, int8=False, imgsz=640):
+    """Путь к экспортированной модели рядом с исходными весами best.pt.
+
+    Размер входа входит в имя: экспорт фиксирует форму входа, и модель на 640
+    нельзя молча использовать для запуска с --imgsz 1024.
+    """
+    base = os.path.splitext(model_path)[0]
+    suffix = f"_{imgsz}" + ('_int8' if int8 else '')
+    if backend == 'onnx':
+        return f"{base}{suffix}.onnx"
+    if backend == 'openvino':
+        return f"{base}{suffix}_openvino_model"
+    return model_path
+
+def _source_stamp_path(target):
+    return f"{target}.source.json"
+
+def write_source_stamp(model_path, target, sha256=None):
+    """Отметка рядом с экспортом: из каких весов (размер, mtime, SHA-256) он получен"""
+    stat = os.stat(model_path)
+    stamp = {
+        'source': os.path.abspath(model_path),
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'sha256': sha256 or file_sha256(model_path)
+    }
+    tmp_path = f"{_source_stamp_path(target)}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(stamp, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, _source_stamp_path(target))
+
+def export_is_current(model_path, target):
+    """Экспорт существует и сделан из текущих весов.
+
+    Совпадение размера и mtime проверяется без чтения весов; если mtime изменился
+    (веса скопировали или перезаписали тем же файлом), сравнивается SHA-256.
+    """
+    if not os.path.exists(target):
+        return False
+    try:
+        with open(_source_stamp_path(target), 'r', encoding='utf-8') as f:
+            stamp = json.load(f)
+    except (OSError, ValueError):
+        return False
+
+    stat = os.stat(model_path)
+    if stamp.get('size') == stat.st_size and stamp.get('mtime_ns') == stat.st_mtime_ns:
+        return True
+    sha256 = file_sha256(model_path)
+    if stamp.get('sha256') != sha256:
+        return False
+    write_source_stamp(model_path, target, sha256)
+    return True
+
+def quantize_onnx_int8(onnx_path, output_path, calib_dir='./data/images/val', imgsz=640, calib_size=100):
+    """Статическая INT8-квантизация ONNX-модели с калибровкой на снимках из calib_dir"""
+    from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_static
+
+    calib_images = list_images(calib_dir, calib_size)
+    if not calib_images:
+        raise FileNotFoundError(f"Нет изображений для калибровки в {calib_dir}")
+
+    class ImageCalibrationReader(CalibrationDataReader):
+        def __init__(self):
+            self._paths = iter(calib_images)
+
+        def get_next(self):
+            for path in self._paths:
+                image = cv2.imread(path)
+                if image is not None:
+                    return {'images': _to_input_tensor(image, imgsz)}
+            return None
+
+    print(f"⚖️ Калибровка INT8 на {len(calib_images)} снимках из {calib_dir}")
+    quantize_static(
+        onnx_path,
+        output_path,
+        ImageCalibrationReader(),
+        quant_format=QuantFormat.QDQ,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+        per_channel=True
+    )
+    return output_path
+
+def export_model(model_path, backend='onnx', imgsz=640, int8=False,
+                 calib_dir='./data/images/val', data_yaml='./data/data.yaml', calib_size=100):
+    """Экспорт best.pt в ONNX или OpenVINO с опциональной INT8-квантизацией"""
+    if backend not in ('onnx', 'openvino'):
+        raise ValueError(f"Неизвестный формат экспорта: {backend}")
+    if backend == 'openvino' and not HAS_OPENVINO:
+        raise ImportError("OpenVINO не установлен: pip install openvino")
+
+    print(f"📦 Экспортируем {model_path} -> {backend}{' INT8' if int8 else ''} (imgsz={imgsz})")
+    model = YOLO(model_path)
+    target = exported_model_path(model_path, backend, int8, imgsz)
+
+    if backend == 'onnx':
+        onnx_path = model.export(format='onnx', imgsz=imgsz)
+        if int8:
+            quantize_onnx_int8(onnx_path, target, calib_dir, imgsz, calib_size)
+        elif os.path.abspath(onnx_path) != os.path.abspath(target):
+            shutil.move(onnx_path, target)
+    else:
+        # Калибровку OpenVINO (NNCF) ultralytics делает по val-разбиению из data.yaml
+        export_path = model.export(format='openvino', imgsz=imgsz, int8=int8,
+                                   data=data_yaml if int8 else None)
+        if os.path.abspath(export_path) != os.path.abspath(target):
+            if os.path.exists(target):
+                shutil.rmtree(target)
+            shutil.move(export_path, target)
+
+    write_source_stamp(model_path, target)
+    print(f"✅ Модель экспортирована: {target}")
+    return target
+
+def resolve_backend_model(model_path, backend='pytorch', imgsz=640, int8=False):
+    """Путь к модели для выбранного бэкенда; экспортирует best.pt, если экспорта для
+    этого imgsz еще нет или он сделан из других весов"""
+    if backend not in BACKENDS:
+        raise ValueError(f"Неизвестный бэкенд: {backend}. Доступны: {', '.join(BACKENDS)}")
+    if backend == 'pytorch' or not model_path.endswith('.pt'):
+        return model_path
+
+    target = exported_model_path(model_path, backend, int8, imgsz)
+    if not export_is_current(model_path, target):
+        if os.path.exists(target):
+            print(f"♻️ Веса {model_path} изменились - экспорт {target} устарел")
+        export_model(model_path, backend, imgsz, int8)
+    return target
+
+def box_iou(boxes_a, boxes_b):
+    """Матрица IoU между двумя наборами боксов xyxy"""
+    area_a = (boxes_a[:, 2] - boxes_a[:, 0]) * (boxes_a[:, 3] - boxes_a[:, 1])
+    area_b = (boxes_b[:, 2] - boxes_b[:, 0]) * (boxes_b[:, 3] - boxes_b[:, 1])
+    lt = np.maximum(boxes_a[:, None, :2], boxes_b[None, :, :2])
+    rb = np.minimum(boxes_a[:, None, 2:], boxes_b[None, :, 2:])
+    inter = np.clip(rb - lt, 0, None).prod(axis=2)
+    return inter / (area_a[:, None] + area_b[None, :] - inter + 1e-9)
+
+def _match_detections(ref, other, iou_threshold=0.5):
+    """Жадное сопоставление боксов одного класса по IoU"""
+    ious, conf_deltas, unmatched = [], [], 0
+    used = set()
+    for i in np.argsort(-ref['conf']):
+        candidates = np.where(other['cls'] == ref['cls'][i])[0]
+        candidates = [j for j in candidates if j not in used]
+        if not candidates:
+            unmatched += 1
+            continue
+        iou = box_iou(ref['xyxy'][i:i + 1], other['xyxy'][candidates])[0]
+        best = int(np.argmax(iou))
+        if iou[best] < iou_threshold:
+            unmatched += 1
+            continue
+        used.add(candidates[best])
+        ious.append(float(iou[best]))
+        conf_deltas.append(abs(float(ref['conf'][i]) - float(other['conf'][candidates[best]])))
+    extra = len(other['cls']) - len(used)
+    return ious, conf_deltas, unmatched, extra
+
+def _run_backend(model, image_paths, conf_threshold, imgsz):
+    """Инференс с замером задержки; возвращает боксы по снимкам и задержки в мс"""
+    outputs, latencies = [], []
+    # Прогрев, чтобы первый вызов не искажал задержки
+    model.predict(source=image_paths[0], conf=conf_threshold, imgsz=imgsz, verbose=False)
+    for path in image_paths:
+        start = time.perf_counter()
+        r = model.predict(source=path, conf=conf_threshold, imgsz=imgsz, verbose=False)[0]
+        latencies.append((time.perf_counter() - start) * 1000)
+        outputs.append({
+            'xyxy': r.boxes.xyxy.cpu().numpy(),
+            'conf': r.boxes.conf.cpu().numpy(),
+            'cls': r.boxes.cls.cpu().numpy().astype(int)
+        })
+    return outputs, np.array(latencies)
+
+def compare_backends(model_path, exported_path, image_paths, conf_threshold=0.25, imgsz=640):
+    """Сравнение экспортированной модели с PyTorch: IoU боксов, разница уверенности и задержка"""
+    if not image_paths:
+        raise FileNotFoundError("Нет изображений для сравнения бэкендов")
+
+    print(f"🔬 Сравниваем {os.path.basename(exported_path)} с PyTorch на {len(image_paths)} снимках")
+    ref_outputs, ref_latency = _run_backend(YOLO(model_path), image_paths, conf_threshold, imgsz)
+    exp_outputs, exp_latency = _run_backend(YOLO(exported_path, task='detect'), image_paths, conf_threshold, imgsz)
+
+    ious, conf_deltas, unmatched, extra = [], [], 0, 0
+    for ref, other in zip(ref_outputs, exp_outputs):
+        i, c, u, e = _match_detections(ref, other)
+        ious += i
+        conf_deltas += c
+        unmatched += u
+        extra += e
+
+    report = {
+        'matched_boxes': len(ious),
+        'missed_boxes': unmatched,
+        'extra_boxes': extra,
+        'mean_iou': float(np.mean(ious)) if ious else None,
+        'min_iou': float(np.min(ious)) if ious else None,
+        'mean_conf_delta': float(np.mean(conf_deltas)) if conf_deltas else None,
+        'max_conf_delta': float(np.max(conf_deltas)) if conf_deltas else None,
+        'pytorch_ms_p50': float(np.percentile(ref_latency, 50)),
+        'exported_ms_p50': float(np.percentile(exp_latency, 50)),
+        'speedup': float(np.percentile(ref_latency, 50) / np.percentile(exp_latency, 50))
+    }
+
+    print("📊 СООТВЕТСТВИЕ БЭКЕНДОВ:")
+    print(f"   Совпавших боксов: {report['matched_boxes']}, "
+          f"пропущено: {report['missed_boxes']}, лишних: {report['extra_boxes']}")
+    if ious:
+        print(f"   IoU: среднее {report['mean_iou']:.4f}, минимум {report['min_iou']:.4f}")
+        print(f"   Δ уверенности: средняя {report['mean_conf_delta']:.4f}, макс {report['max_conf_delta']:.4f}")
+    print(f"⏱️ Задержка p50: PyTorch {report['pytorch_ms_p50']:.1f} мс, "
+          f"экспорт {report['exported_ms_p50']:.1f} мс ({report['speedup']:.2f}x)")
+    return report
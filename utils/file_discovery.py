@@ -0,0 +1,78 @@
+
+import os
+from fnmatch import fnmatch
+from itertools import islice
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+LABEL_EXTENSIONS = ('.txt',)
+
+def _matches(rel_path, patterns):
+    return any(fnmatch(rel_path, p) or fnmatch(os.path.basename(rel_path), p) for p in patterns)
+
+def iter_files(root, extensions=IMAGE_EXTENSIONS, recursive=True, include=None, exclude=None, file_list=None):
+    """Ленивый обход файлов через os.scandir.
+
+    Отдает пути по мере обхода, не собирая список целиком: потребитель начинает
+    работу до окончания перечисления. Расширения сравниваются без учета регистра,
+    include/exclude - glob-шаблоны по относительному пути или имени файла
+    (exclude, совпавший с папкой, отсекает всю папку). file_list - текстовый файл
+    с путями (по одному на строку, относительные - от root) вместо обхода папки.
+    """
+    extensions = tuple(e.lower() for e in extensions) if extensions else None
+    include = list(include or [])
+    exclude = list(exclude or [])
+
+    def accept(path, rel_path):
+        if extensions and not path.lower().endswith(extensions):
+            return False
+        if include and not _matches(rel_path, include):
+            return False
+        return not (exclude and _matches(rel_path, exclude))
+
+    if file_list:
+        with open(file_list, 'r', encoding='utf-8') as f:
+            for line in f:
+                path = line.strip()
+                if not path or path.startswith('#'):
+                    continue
+                if not os.path.isabs(path):
+                    path = os.path.join(root, path)
+                if accept(path, os.path.relpath(path, root)):
+                    yield path
+        return
+
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        try:
+            with os.scandir(directory) as entries:
+                subdirs = []
+                for entry in entries:
+                    rel_path = os.path.relpath(entry.path, root)
+                    if entry.is_dir(follow_symlinks=False):
+                        if recursive and not (exclude and _matches(rel_path, exclude)):
+                            subdirs.append(entry.path)
+                    elif entry.is_file() and accept(entry.name, rel_path):
+                        yield entry.path
+        except (PermissionError, FileNotFoundError) as e:
+            print(f"⚠️ Пропускаем недоступную папку {directory}: {e}")
+            continue
+        # Обходим вложенные папки в алфавитном порядке (стек - поэтому в обратном)
+        stack.extend(sorted(subdirs, reverse=True))
+
+def iter_images(root, **kwargs):
+    """Ленивый обход изображений (jpg/jpeg/png в любом регистре)"""
+    return iter_files(root, IMAGE_EXTENSIONS, **kwargs)
+
+def iter_labels(root, **kwargs):
+    """Ленивый обход файлов разметки YOLO (.txt)"""
+    return iter_files(root, LABEL_EXTENSIONS, **kwargs)
+
+def iter_chunks(iterable, size):
+    """Порции по size элементов из итератора без материализации всего списка"""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
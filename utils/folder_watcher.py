@@ -0,0 +1,236 @@
+
+import ctypes
+import ctypes.util
+import json
+import os
+import select
+import struct
+import time
+from utils.file_discovery import iter_files, iter_images, IMAGE_EXTENSIONS
+
+# Флаги inotify из <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+_EVENT = struct.Struct('iIII')
+
+def atomic_write_json(path, data):
+    """Запись JSON через временный файл и os.replace: читатель видит файл целиком или не видит вовсе"""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+class InotifySource:
+    """События о новых файлах через inotify (Linux, без сторонних библиотек).
+
+    Файл сообщается после закрытия записи (IN_CLOSE_WRITE) или переноса в папку
+    (IN_MOVED_TO); новые подпапки берутся под наблюдение сразу при создании.
+    """
+
+    MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+    def __init__(self, root, recursive=True):
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self._libc = libc
+        self._fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1')
+        self.root = root
+        self.recursive = recursive
+        self._watches = {}
+        self._watch_tree(root)
+
+    def _watch_tree(self, directory):
+        """Наблюдение за папкой и (recursive) всеми вложенными"""
+        stack = [directory]
+        while stack:
+            current = stack.pop()
+            wd = self._libc.inotify_add_watch(self._fd, os.fsencode(current), self.MASK)
+            if wd < 0:
+                print(f"⚠️ Не удалось наблюдать за {current}: {os.strerror(ctypes.get_errno())}")
+                continue
+            self._watches[wd] = current
+            if self.recursive:
+                with os.scandir(current) as entries:
+                    stack.extend(e.path for e in entries if e.is_dir(follow_symlinks=False))
+
+    def poll(self, timeout):
+        """Новые пути за время ожидания до timeout: (пути, нужен ли полный пересмотр папки)"""
+        ready, _, _ = select.select([self._fd], [], [], timeout)
+        if not ready:
+            return [], False
+        try:
+            data = os.read(self._fd, 1 << 16)
+        except BlockingIOError:
+            return [], False
+
+        paths, rescan, offset = [], False, 0
+        while offset + _EVENT.size <= len(data):
+            wd, mask, _, length = _EVENT.unpack_from(data, offset)
+            name = data[offset + _EVENT.size:offset + _EVENT.size + length].rstrip(b'\0')
+            offset += _EVENT.size + length
+            if mask & IN_Q_OVERFLOW:
+                # Очередь ядра переполнилась (например, пока обработка отставала) - часть событий потеряна
+                rescan = True
+                continue
+            directory = self._watches.get(wd)
+            if directory is None or not name:
+                continue
+            path = os.path.join(directory, os.fsdecode(name))
+            if mask & IN_ISDIR:
+                if self.recursive and mask & (IN_CREATE | IN_MOVED_TO):
+                    # Файлы могли появиться в папке до того, как она попала под наблюдение
+                    self._watch_tree(path)
+                    paths.extend(iter_images(path))
+            elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+                paths.append(path)
+        return paths, rescan
+
+    def close(self):
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+class PollingSource:
+    """Запасной вариант без inotify (другая ОС, сетевые папки): периодический обход папки"""
+
+    def __init__(self, root, recursive=True, interval=2.0):
+        self.root = root
+        self.recursive = recursive
+        self.interval = interval
+
+    def poll(self, timeout):
+        time.sleep(min(timeout, self.interval))
+        return [], True
+
+    def close(self):
+        pass
+
+class FolderWatcher:
+    """Отслеживание папки с новыми снимками: выдает только полностью записанные и еще не обработанные.
+
+    Снимок готов, когда его размер и время изменения не менялись settle_s секунд.
+    Обработанный снимок отмечается маркером в state_dir (атомарно, с размером и
+    временем изменения файла), поэтому после перезапуска он не обрабатывается
+    повторно, а перезаписанный файл с тем же именем - обрабатывается. Маркеры
+    читаются один раз при запуске в индекс в памяти, дальше проверка обработки -
+    только stat файла без открытия маркера.
+    """
+
+    def __init__(self, root, state_dir, settle_s=2.0, poll_interval=2.0, recursive=True, use_inotify=True):
+        self.root = os.path.abspath(root)
+        self.state_dir = state_dir
+        self.settle_s = settle_s
+        self.recursive = recursive
+        self.source = None
+        if use_inotify:
+            try:
+                self.source = InotifySource(self.root, recursive)
+            except (OSError, AttributeError) as e:
+                print(f"⚠️ inotify недоступен ({e}) - опрос папки каждые {poll_interval:.1f} с")
+        if self.source is None:
+            self.source = PollingSource(self.root, recursive, poll_interval)
+        self.mode = 'inotify' if isinstance(self.source, InotifySource) else 'polling'
+        # Путь -> (размер, mtime_ns, время последнего изменения) для еще не готовых файлов
+        self.pending = {}
+        # Относительный путь -> (размер, mtime_ns) обработанной версии снимка
+        self.done = self._load_done_index()
+        self._rescan = True
+
+    def _load_done_index(self):
+        """Индекс обработанных снимков из маркеров state_dir (битые маркеры пропускаются)"""
+        done = {}
+        if not os.path.isdir(self.state_dir):
+            return done
+        for marker in iter_files(self.state_dir, extensions=('.done',)):
+            try:
+                with open(marker, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                done[os.path.relpath(marker, self.state_dir)[:-len('.done')]] = (data['size'], data['mtime_ns'])
+            except (OSError, ValueError, KeyError):
+                continue
+        if done:
+            print(f"🗂️ Обработанных снимков по маркерам {self.state_dir}: {len(done)}")
+        return done
+
+    def relpath(self, path):
+        return os.path.relpath(path, self.root)
+
+    def marker_path(self, path):
+        return os.path.join(self.state_dir, self.relpath(path) + '.done')
+
+    def is_done(self, path, stat=None):
+        """Текущая версия файла уже обработана (по индексу маркеров)"""
+        done = self.done.get(self.relpath(path))
+        if done is None:
+            return False
+        try:
+            stat = stat or os.stat(path)
+        except OSError:
+            return False
+        return done == (stat.st_size, stat.st_mtime_ns)
+
+    def mark_done(self, path, stat, **extra):
+        atomic_write_json(self.marker_path(path), {
+            'image': self.relpath(path), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+            'processed_at': time.strftime('%Y-%m-%dT%H:%M:%S'), **extra
+        })
+        self.done[self.relpath(path)] = (stat.st_size, stat.st_mtime_ns)
+
+    def _track(self, path, now):
+        if path.lower().endswith(IMAGE_EXTENSIONS) and path not in self.pending:
+            self.pending[path] = (-1, -1, now)
+
+    def request_rescan(self):
+        """Полный обход папки при следующей проверке (можно вызывать из другого потока)"""
+        self._rescan = True
+
+    def ready(self, timeout=1.0, exclude=()):
+        """Ожидание до timeout и список готовых к обработке снимков.
+
+        exclude - снимки, которые уже в очереди или обрабатываются.
+        """
+        now = time.monotonic()
+        if self._rescan:
+            self._rescan = False
+            for path in iter_images(self.root, recursive=self.recursive):
+                # Уже обработанные снимки при обходе сразу отбрасываются
+                if path not in self.pending and path not in exclude and not self.is_done(path):
+                    self._track(path, now)
+        # Пока есть незавершенные файлы, ждем не дольше settle_s, чтобы вовремя их проверить
+        wait = min(timeout, self.settle_s) if self.pending else timeout
+        paths, rescan = self.source.poll(wait)
+        self._rescan = self._rescan or rescan
+        now = time.monotonic()
+        for path in paths:
+            self._track(path, now)
+
+        ready = []
+        for path, (size, mtime_ns, changed_at) in list(self.pending.items()):
+            if path in exclude:
+                continue
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                del self.pending[path]
+                continue
+            if (stat.st_size, stat.st_mtime_ns) != (size, mtime_ns) or stat.st_size == 0:
+                self.pending[path] = (stat.st_size, stat.st_mtime_ns, now)
+                continue
+            if now - changed_at < self.settle_s:
+                continue
+            del self.pending[path]
+            if not self.is_done(path, stat):
+                ready.append((path, stat))
+        return ready
+
+    def close(self):
+        self.source.close()
@@ -0,0 +1,198 @@
+
+import os
+import math
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+import numpy as np
+import yaml
+from utils.file_discovery import IMAGE_EXTENSIONS, iter_files, iter_images
+
+def load_resized(path, imgsz):
+    """Декодирование и масштабирование длинной стороны до imgsz - как load_image в ultralytics
+    (паддинг до квадрата делает LetterBox в пайплайне аугментаций)"""
+    image = cv2.imread(path, cv2.IMREAD_COLOR)
+    if image is None:
+        raise FileNotFoundError(f"Не удалось прочитать снимок: {path}")
+    h0, w0 = image.shape[:2]
+    r = imgsz / max(h0, w0)
+    if r != 1:
+        w, h = min(math.ceil(w0 * r), imgsz), min(math.ceil(h0 * r), imgsz)
+        image = cv2.resize(image, (w, h), interpolation=cv2.INTER_LINEAR)
+    return image, (h0, w0)
+
+class ImageCache:
+    """Предекодированные снимки одного сплита в memory-mapped файле.
+
+    <path>.bin - подряд записанные uint8-пиксели всех снимков, <path>.index.npz -
+    пути, mtime/размер исходников, смещения и формы. get() возвращает view на
+    отображенную память без копирования: страницы файла общие для всех воркеров
+    даталоадера через page cache ОС. Режим copy-on-write ('c') защищает файл от
+    аугментаций, меняющих снимок на месте.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.bin_path = path + '.bin'
+        self.index_path = path + '.index.npz'
+        with np.load(self.index_path, allow_pickle=False) as index:
+            self.files = index['files']
+            self.mtimes = index['mtimes']
+            self.sizes = index['sizes']
+            self.offsets = index['offsets']
+            self.shapes = index['shapes']
+            self.orig_shapes = index['orig_shapes']
+            self.imgsz = int(index['imgsz'])
+        self.positions = {f: i for i, f in enumerate(self.files)}
+        self._data = None
+
+    @property
+    def data(self):
+        # Открывается лениво: в каждом процессе-воркере свое отображение того же файла
+        if self._data is None:
+            self._data = np.memmap(self.bin_path, dtype=np.uint8, mode='c')
+        return self._data
+
+    def __getstate__(self):
+        # Без этого pickle скопировал бы весь массив в каждый воркер
+        state = self.__dict__.copy()
+        state['_data'] = None
+        return state
+
+    def __len__(self):
+        return len(self.files)
+
+    def __contains__(self, path):
+        return os.path.abspath(path) in self.positions
+
+    def get(self, path):
+        """(снимок hwc uint8 без копирования, исходные hw, hw после масштабирования)"""
+        i = self.positions[os.path.abspath(path)]
+        h, w, c = self.shapes[i]
+        image = self.data[self.offsets[i]:self.offsets[i + 1]].reshape(h, w, c)
+        return image, tuple(self.orig_shapes[i]), (h, w)
+
+    def is_fresh(self, image_paths, imgsz):
+        """Кэш построен для того же набора файлов (путь, mtime, размер) и того же imgsz;
+        порядок путей не важен - поиск идет по пути"""
+        if imgsz != self.imgsz or len(image_paths) != len(self.files) or not os.path.exists(self.bin_path):
+            return False
+        for path in image_paths:
+            i = self.positions.get(os.path.abspath(path))
+            if i is None:
+                return False
+            st = os.stat(path)
+            if st.st_mtime != self.mtimes[i] or st.st_size != self.sizes[i]:
+                return False
+        return True
+
+def build_image_cache(image_paths, cache_path, imgsz=640, workers=8):
+    """Однократное декодирование сплита в memory-mapped кэш.
+
+    Снимки декодируются пулом потоков (cv2 отпускает GIL) с окном в 2*workers
+    задач, поэтому в памяти одновременно лишь несколько снимков, а запись в
+    .bin идет последовательно.
+    """
+    os.makedirs(os.path.dirname(cache_path) or '.', exist_ok=True)
+    image_paths = [os.path.abspath(p) for p in image_paths]
+    offsets = np.zeros(len(image_paths) + 1, np.int64)
+    shapes = np.zeros((len(image_paths), 3), np.int32)
+    orig_shapes = np.zeros((len(image_paths), 2), np.int32)
+
+    start = time.perf_counter()
+    tmp_bin = cache_path + '.bin.tmp'
+    with open(tmp_bin, 'wb') as f, ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        pending = deque()
+        paths = iter(enumerate(image_paths))
+
+        def submit_next():
+            for i, path in paths:
+                pending.append((i, pool.submit(load_resized, path, imgsz)))
+                return
+
+        for _ in range(2 * max(1, workers)):
+            submit_next()
+        while pending:
+            i, future = pending.popleft()
+            submit_next()
+            image, orig_shape = future.result()
+            if image.ndim == 2:
+                image = image[..., None]
+            f.write(np.ascontiguousarray(image).data)
+            offsets[i + 1] = offsets[i] + image.size
+            shapes[i] = image.shape
+            orig_shapes[i] = orig_shape
+
+    stats = [os.stat(p) for p in image_paths]
+    tmp_index = cache_path + '.index.tmp.npz'
+    np.savez(tmp_index, files=np.array(image_paths, dtype=str), offsets=offsets, shapes=shapes,
+             orig_shapes=orig_shapes, imgsz=imgsz,
+             mtimes=np.array([s.st_mtime for s in stats], np.float64),
+             sizes=np.array([s.st_size for s in stats], np.int64))
+    os.replace(tmp_bin, cache_path + '.bin')
+    os.replace(tmp_index, cache_path + '.index.npz')
+    print(f"💾 Кэш снимков {cache_path}: {len(image_paths)} снимков, {offsets[-1] / 1024 ** 3:.2f} ГБ "
+          f"за {time.perf_counter() - start:.1f} с")
+    return ImageCache(cache_path)
+
+def split_image_paths(data_yaml, split):
+    """Снимки сплита из data.yaml: папка (рекурсивно) или txt-список путей"""
+    with open(data_yaml, 'r') as f:
+        config = yaml.safe_load(f)
+    root = config.get('path') or os.path.dirname(data_yaml)
+    if not os.path.isabs(root):
+        root = os.path.join(os.path.dirname(os.path.abspath(data_yaml)), root)
+    entry = config.get(split)
+    if not entry:
+        return []
+    entry = entry if os.path.isabs(entry) else os.path.join(root, entry)
+    if entry.endswith('.txt'):
+        return [p for p in iter_files(os.path.dirname(entry), IMAGE_EXTENSIONS, file_list=entry)]
+    return sorted(iter_images(entry))
+
+def load_image_cache(image_paths, cache_path, imgsz=640, workers=8):
+    """Кэш сплита: открывает существующий или пересобирает, если снимки или imgsz изменились"""
+    if os.path.exists(cache_path + '.index.npz'):
+        try:
+            cache = ImageCache(cache_path)
+            if cache.is_fresh(image_paths, imgsz):
+                return cache
+        except (OSError, KeyError, ValueError):
+            pass
+        print(f"🔄 Кэш снимков {cache_path} устарел, пересобираем")
+    return build_image_cache(image_paths, cache_path, imgsz, workers)
+
+class _CachedLoadImage:
+    """Замена dataset.load_image: снимок из memory-mapped кэша вместо декодирования.
+    Класс, а не замыкание - датасет должен оставаться picklable для воркеров даталоадера."""
+
+    def __init__(self, cache, original):
+        self.cache = cache
+        self.original = original
+
+    def __call__(self, i, rect_mode=True, resize_short=False):
+        path = self.original.__self__.im_files[i]
+        if not rect_mode or resize_short or path not in self.cache:
+            return self.original(i, rect_mode, resize_short)
+        return self.cache.get(path)
+
+def attach_image_cache(model, cache_dir='./data/cache', workers=8):
+    """Подключение кэша снимков к датасетам train/val тренера YOLO через колбэк"""
+
+    def on_pretrain_routine_end(trainer):
+        loaders = {'train': trainer.train_loader, 'val': getattr(trainer, 'test_loader', None)}
+        for name, loader in loaders.items():
+            dataset = getattr(loader, 'dataset', None)
+            if dataset is None or isinstance(dataset.load_image, _CachedLoadImage):
+                continue
+            if getattr(dataset, 'channels', 3) != 3:
+                print(f"⚠️ Кэш снимков поддерживает только 3 канала, {name} читается с диска")
+                continue
+            cache = load_image_cache(dataset.im_files, os.path.join(cache_dir, f"{name}_{dataset.imgsz}"),
+                                     dataset.imgsz, workers)
+            dataset.load_image = _CachedLoadImage(cache, dataset.load_image)
+            if hasattr(loader, 'reset'):
+                loader.reset()
+
+    model.add_callback('on_pretrain_routine_end', on_pretrain_routine_end)
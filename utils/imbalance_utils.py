@@ -1,9 +1,25 @@
 
-import torch
-import torch.nn as nn
+import os
 import numpy as np
+import yaml
 from collections import Counter
-from sklearn.utils import resample
+from utils.label_index import load_label_index, parse_label_file
+from utils.file_discovery import iter_images
+
+def train_split_paths(data_yaml):
+    """Снимки train из data.yaml и папка их разметки (YOLO: .../images/... -> .../labels/...).
+
+    Возвращает (корневая папка снимков, пути снимков, папка разметки); train может
+    быть папкой или txt-списком (как в k-fold конфигах).
+    """
+    from utils.image_cache import split_image_paths
+    from utils.cascade import labels_dir_for
+
+    image_paths = split_image_paths(data_yaml, 'train')
+    if not image_paths:
+        raise FileNotFoundError(f"В {data_yaml} нет снимков train")
+    images_dir = os.path.commonpath([os.path.dirname(os.path.abspath(p)) for p in image_paths])
+    return images_dir, image_paths, labels_dir_for(images_dir)
 
 class ImbalanceHandler:
     """Обработчик несбалансированных данных"""
@@ -13,10 +29,12 @@ class ImbalanceHandler:
         self.class_counts = self._count_classes()
     
     def _count_classes(self):
-        """Подсчет количества примеров по классам"""
-        with open(self.labels_path, 'r') as f:
-            labels = [line.strip().split()[0] for line in f if line.strip()]
-        return Counter(labels)
+        """Подсчет количества примеров по классам (по всей папке сплита через индекс разметки)"""
+        if os.path.isdir(self.labels_path):
+            counts = load_label_index(self.labels_path).class_counts()
+            return Counter({class_id: int(c) for class_id, c in enumerate(counts) if c})
+        class_ids, _ = parse_label_file(self.labels_path)
+        return Counter(class_ids.tolist())
     
     def calculate_class_weights(self):
         """Вычисление весов классов для weighted loss"""
@@ -42,28 +60,80 @@ class ImbalanceHandler:
         else:
             return "oversampling"
     
-    def apply_oversampling(self, images_dir, labels_dir):
-        """Применяет oversampling к миноритарным классам"""
-        # Для YOLO oversampling реализуется через дублирование данных
-        # В реальном проекте нужно дублировать файлы изображений и разметки
+    def image_sampling_weights(self, labels_dir, class_weights=None):
+        """Вес каждого снимка для сэмплирования: максимум весов классов, присутствующих на снимке.
+
+        Снимки без объектов (норма) получают минимальный вес - как мажоритарный класс.
+        Возвращает (относительные пути файлов разметки, веса).
+        """
+        class_weights = class_weights or self.calculate_class_weights()
+        index = load_label_index(labels_dir)
+        num_classes = max(max(class_weights) + 1, int(index.class_ids.max()) + 1 if len(index.class_ids) else 0)
+
+        weight_table = np.zeros(num_classes, np.float64)
+        for class_id, weight in class_weights.items():
+            weight_table[int(class_id)] = weight
+        presence = index.image_class_presence(num_classes)
+
+        weights = (presence * weight_table).max(axis=1)
+        weights[~presence.any(axis=1)] = min(class_weights.values())
+        return index.files, weights
+
+    def apply_oversampling(self, images_dir, labels_dir, epoch_length=None, seed=0, output_path=None,
+                           image_paths=None):
+        """Виртуальный oversampling: список снимков train с повторами миноритарных классов.
+
+        Файлы не копируются - YOLO принимает в data.yaml вместо папки txt-список путей,
+        в котором снимок может встречаться несколько раз. Каждый снимок входит в список
+        хотя бы один раз, сверх этого добавляются повторы пропорционально весу снимка.
+        epoch_length - длина списка (по умолчанию столько, чтобы вес снимка примерно
+        соответствовал числу его вхождений), seed - для воспроизводимости.
+        image_paths - снимки сплита, если train в data.yaml задан списком, а не папкой.
+        """
         print("🔄 Применяем oversampling к миноритарным классам")
-        return "oversampling_applied"
+        label_files, weights = self.image_sampling_weights(labels_dir)
 
-class FocalLoss(nn.Module):
-    """Focal Loss для борьбы с дисбалансом классов"""
-    
-    def __init__(self, alpha=1, gamma=2, reduction='mean'):
-        super(FocalLoss, self).__init__()
-        self.alpha = alpha
-        self.gamma = gamma
-        self.reduction = reduction
-        
-    def forward(self, inputs, targets):
-        BCE_loss = nn.functional.cross_entropy(inputs, targets, reduction='none')
-        pt = torch.exp(-BCE_loss)
-        focal_loss = self.alpha * (1 - pt) ** self.gamma * BCE_loss
-        
-        if self.reduction == 'mean':
-            return focal_loss.mean()
-        else:
-            return focal_loss
+        # Сопоставляем разметку со снимками по относительному пути без расширения
+        stems = {os.path.splitext(f)[0]: i for i, f in enumerate(label_files)}
+        selected, image_weights = [], []
+        for path in (image_paths if image_paths is not None else iter_images(images_dir)):
+            i = stems.get(os.path.splitext(os.path.relpath(path, images_dir))[0])
+            if i is not None:
+                selected.append(os.path.abspath(path))
+                image_weights.append(weights[i])
+
+        if not selected:
+            raise FileNotFoundError(f"Нет снимков с разметкой в {images_dir}")
+
+        image_weights = np.array(image_weights)
+        balanced_length = int(round((image_weights / image_weights.min()).sum()))
+        epoch_length = epoch_length or balanced_length
+        if epoch_length < len(selected):
+            raise ValueError(f"epoch_length={epoch_length} меньше числа снимков ({len(selected)}): "
+                             f"каждый снимок должен попасть в список хотя бы раз")
+        rng = np.random.default_rng(seed)
+        extra = rng.choice(len(selected), size=epoch_length - len(selected), replace=True,
+                           p=image_weights / image_weights.sum())
+        picks = np.concatenate([np.arange(len(selected)), extra])
+
+        # По умолчанию рядом с data.yaml: data/images/train -> data/train_oversampled.txt
+        data_root = os.path.dirname(os.path.dirname(os.path.normpath(images_dir)))
+        output_path = output_path or os.path.join(data_root, 'train_oversampled.txt')
+        with open(output_path, 'w') as f:
+            f.write(''.join(selected[i] + '\n' for i in picks))
+
+        print(f"✅ Список для обучения: {output_path} ({epoch_length} записей: {len(selected)} снимков "
+              f"+ {len(extra)} повторов)")
+        return output_path
+
+    def create_oversampled_data_yaml(self, data_yaml, image_list, output_path=None):
+        """Копия data.yaml, в которой train указывает на список снимков с повторами"""
+        with open(data_yaml, 'r') as f:
+            config = yaml.safe_load(f)
+        config['train'] = os.path.abspath(image_list)
+
+        output_path = output_path or os.path.join(os.path.dirname(data_yaml), 'data_oversampled.yaml')
+        with open(output_path, 'w') as f:
+            yaml.dump(config, f, default_flow_style=False)
+        print(f"✅ Конфиг с oversampling: {output_path}")
+        return output_path
@@ -0,0 +1,157 @@
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from utils.file_discovery import iter_labels
+
+# Ниже этого числа измененных файлов парсим в текущем процессе - пул дороже самой работы
+PARALLEL_THRESHOLD = 512
+
+def parse_label_file(path):
+    """Разбор YOLO-разметки: (class_ids int16 [n], boxes float32 [n, 4] в xywh)"""
+    try:
+        with open(path, 'r') as f:
+            rows = [line.split() for line in f if line.strip()]
+    except OSError:
+        rows = []
+    rows = [r for r in rows if len(r) >= 5]
+    if not rows:
+        return np.empty(0, np.int16), np.empty((0, 4), np.float32)
+    values = np.array([r[:5] for r in rows], dtype=np.float32)
+    return values[:, 0].astype(np.int16), values[:, 1:5]
+
+def _parse_many(paths):
+    return [parse_label_file(p) for p in paths]
+
+def index_path_for(labels_dir):
+    """Файл индекса рядом с папкой разметки (как labels/train.cache у ultralytics)"""
+    return os.path.normpath(labels_dir) + '.index.npz'
+
+class LabelIndex:
+    """Колоночный индекс YOLO-разметки одной папки (сплита), сохраняемый на диск.
+
+    Хранит для каждого файла разметки mtime и размер, а все объекты - в плоских
+    массивах class_ids/boxes со смещениями offsets. refresh() перечитывает только
+    новые и измененные файлы, поэтому повторный анализ большого датасета
+    почти не трогает диск.
+    """
+
+    def __init__(self, labels_dir, workers=None):
+        self.labels_dir = labels_dir
+        self.path = index_path_for(labels_dir)
+        self.workers = workers or os.cpu_count() or 1
+        self.files = np.empty(0, dtype=object)
+        self.mtimes = np.empty(0, np.float64)
+        self.sizes = np.empty(0, np.int64)
+        self.offsets = np.zeros(1, np.int64)
+        self.class_ids = np.empty(0, np.int16)
+        self.boxes = np.empty((0, 4), np.float32)
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with np.load(self.path, allow_pickle=False) as data:
+                self.files = data['files'].astype(object)
+                self.mtimes = data['mtimes']
+                self.sizes = data['sizes']
+                self.offsets = data['offsets']
+                self.class_ids = data['class_ids']
+                self.boxes = data['boxes']
+        except (OSError, KeyError, ValueError):
+            print(f"⚠️ Индекс разметки поврежден, пересоздаем: {self.path}")
+
+    def _save(self):
+        tmp_path = self.path + '.tmp.npz'
+        np.savez(tmp_path, files=self.files.astype(str), mtimes=self.mtimes, sizes=self.sizes,
+                 offsets=self.offsets, class_ids=self.class_ids, boxes=self.boxes)
+        os.replace(tmp_path, self.path)
+
+    def _parse(self, paths):
+        if len(paths) < PARALLEL_THRESHOLD or self.workers < 2:
+            return _parse_many(paths)
+        chunk = max(64, len(paths) // (self.workers * 4))
+        chunks = [paths[i:i + chunk] for i in range(0, len(paths), chunk)]
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            return [item for part in pool.map(_parse_many, chunks) for item in part]
+
+    def refresh(self):
+        """Инкрементальное обновление: перечитываются только новые и измененные файлы"""
+        if not os.path.isdir(self.labels_dir):
+            return self
+
+        files, mtimes, sizes = [], [], []
+        for path in iter_labels(self.labels_dir):
+            st = os.stat(path)
+            files.append(os.path.relpath(path, self.labels_dir))
+            mtimes.append(st.st_mtime)
+            sizes.append(st.st_size)
+        files = np.array(files, dtype=object)
+        mtimes = np.array(mtimes, np.float64)
+        sizes = np.array(sizes, np.int64)
+
+        old_pos = {f: i for i, f in enumerate(self.files)}
+        reuse = np.full(len(files), -1, np.int64)
+        for i, f in enumerate(files):
+            j = old_pos.get(f)
+            if j is not None and self.mtimes[j] == mtimes[i] and self.sizes[j] == sizes[i]:
+                reuse[i] = j
+
+        changed = np.where(reuse < 0)[0]
+        if len(changed) == 0 and len(files) == len(self.files):
+            return self
+
+        parsed = self._parse([os.path.join(self.labels_dir, files[i]) for i in changed])
+        parsed_by_pos = dict(zip(changed.tolist(), parsed))
+
+        counts = np.empty(len(files), np.int64)
+        class_parts, box_parts = [], []
+        for i in range(len(files)):
+            if reuse[i] >= 0:
+                start, end = self.offsets[reuse[i]], self.offsets[reuse[i] + 1]
+                cls, boxes = self.class_ids[start:end], self.boxes[start:end]
+            else:
+                cls, boxes = parsed_by_pos[i]
+            counts[i] = len(cls)
+            class_parts.append(cls)
+            box_parts.append(boxes)
+
+        self.files, self.mtimes, self.sizes = files, mtimes, sizes
+        self.offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        self.class_ids = np.concatenate(class_parts) if class_parts else np.empty(0, np.int16)
+        self.boxes = np.concatenate(box_parts) if box_parts else np.empty((0, 4), np.float32)
+        self._save()
+        print(f"🗂️ Индекс разметки {self.labels_dir}: перечитано {len(changed)} из {len(files)} файлов")
+        return self
+
+    def __len__(self):
+        return len(self.files)
+
+    def stems(self):
+        """Относительные пути файлов разметки без расширения"""
+        return set(os.path.splitext(f)[0] for f in self.files)
+
+    def class_counts(self, num_classes=None):
+        """Количество объектов каждого класса (np.bincount по всем файлам)"""
+        minlength = num_classes or 0
+        if len(self.class_ids) == 0:
+            return np.zeros(minlength, np.int64)
+        return np.bincount(self.class_ids.astype(np.int64), minlength=minlength)
+
+    def image_class_presence(self, num_classes):
+        """Матрица [файлы x классы]: есть ли в снимке хотя бы один объект класса"""
+        presence = np.zeros((len(self.files), num_classes), bool)
+        image_ids = np.repeat(np.arange(len(self.files)), np.diff(self.offsets))
+        valid = self.class_ids < num_classes
+        presence[image_ids[valid], self.class_ids[valid]] = True
+        return presence
+
+    def labels_for(self, i):
+        """(class_ids, boxes) для i-го файла разметки"""
+        start, end = self.offsets[i], self.offsets[i + 1]
+        return self.class_ids[start:end], self.boxes[start:end]
+
+def load_label_index(labels_dir, workers=None):
+    """Индекс разметки папки, обновленный до текущего состояния диска"""
+    return LabelIndex(labels_dir, workers).refresh()
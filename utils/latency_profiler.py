@@ -0,0 +1,175 @@
+
+import time
+import threading
+import numpy as np
+
+# HDR-гистограмма с логарифмически-линейными корзинами: 2^SUB_BITS корзин на
+# каждую двоичную октаву, относительная погрешность квантиля < 1 / 2^SUB_BITS
+SUB_BITS = 7
+SUB_COUNT = 1 << SUB_BITS
+MAX_EXPONENT = 26  # до ~2.4 ч в микросекундах
+BUCKET_COUNT = (MAX_EXPONENT + 2) * SUB_COUNT
+
+def _bucket_index(us):
+    exponent = us.bit_length() - (SUB_BITS + 1)
+    if exponent <= 0:
+        return us
+    exponent = min(exponent, MAX_EXPONENT)
+    return min(exponent * SUB_COUNT + (us >> exponent), BUCKET_COUNT - 1)
+
+def _bucket_values():
+    """Середина каждой корзины в микросекундах"""
+    idx = np.arange(BUCKET_COUNT)
+    exponent = np.maximum(idx // SUB_COUNT - 1, 0)
+    mantissa = idx - exponent * SUB_COUNT
+    return (mantissa << exponent) + ((1 << exponent) - 1) / 2
+
+BUCKET_VALUES_US = _bucket_values()
+
+class LatencyHistogram:
+    """Гистограмма задержек в стиле HDR: запись O(1), квантили по корзинам.
+
+    window_s=None - накопительная гистограмма за все время; иначе скользящее
+    окно из slots интервалов, устаревшие интервалы обнуляются при записи.
+    """
+
+    def __init__(self, window_s=None, slots=6):
+        self.window_s = window_s
+        self.slots = slots if window_s else 1
+        self.slot_s = window_s / self.slots if window_s else None
+        self.counts = np.zeros((self.slots, BUCKET_COUNT), np.int64)
+        self.slot_ids = np.zeros(self.slots, np.int64)
+        self.max_us = 0
+
+    def _slot(self, now):
+        if self.slot_s is None:
+            return 0
+        slot_id = int(now // self.slot_s)
+        k = slot_id % self.slots
+        if self.slot_ids[k] != slot_id:
+            self.counts[k] = 0
+            self.slot_ids[k] = slot_id
+        return k
+
+    def record(self, seconds, now=None):
+        us = max(int(seconds * 1e6), 0)
+        k = self._slot(time.perf_counter() if now is None else now)
+        self.counts[k, _bucket_index(us)] += 1
+        self.max_us = max(self.max_us, us)
+
+    def merged(self, now=None):
+        """Счетчики корзин за окно (или за все время)"""
+        if self.slot_s is None:
+            return self.counts[0].copy()
+        current = int((time.perf_counter() if now is None else now) // self.slot_s)
+        live = self.slot_ids > current - self.slots
+        return self.counts[live].sum(axis=0)
+
+    def add_counts(self, counts, max_us=0):
+        """Добавление счетчиков другой гистограммы (например, из процесса-воркера)"""
+        self.counts[self._slot(time.perf_counter())] += counts
+        self.max_us = max(self.max_us, max_us)
+
+    def stats(self, quantiles=(0.5, 0.95, 0.99)):
+        counts = self.merged()
+        total = int(counts.sum())
+        if not total:
+            return {'count': 0}
+        cumulative = np.cumsum(counts)
+        result = {'count': total, 'mean_ms': float(counts @ BUCKET_VALUES_US) / total / 1e3}
+        for q in quantiles:
+            idx = int(np.searchsorted(cumulative, q * total))
+            value = min(float(BUCKET_VALUES_US[min(idx, BUCKET_COUNT - 1)]), self.max_us)
+            result[f"p{q * 100:g}_ms"] = value / 1e3
+        result['max_ms'] = self.max_us / 1e3
+        return result
+
+class _StageTimer:
+    __slots__ = ('profiler', 'name', 'start')
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        now = time.perf_counter()
+        self.profiler.record(self.name, now - self.start, now)
+        return False
+
+class _NullStage:
+    """Общий пустой контекст для выключенного профилировщика: без замеров и аллокаций"""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NULL_STAGE = _NullStage()
+
+class StageProfiler:
+    """Замер задержки по этапам с гистограммой на каждый этап.
+
+    with profiler.stage('decode'): ... - замер блока, profiler.record(name, seconds) -
+    уже измеренное время. При enabled=False stage() возвращает общий пустой
+    контекст, а record() сразу выходит, поэтому выключенный режим почти бесплатен.
+    """
+
+    def __init__(self, enabled=True, stages=(), window_s=None):
+        self.enabled = enabled
+        self.window_s = window_s
+        self.histograms = {name: LatencyHistogram(window_s) for name in stages}
+        self._lock = threading.Lock()
+
+    def stage(self, name):
+        if not self.enabled:
+            return _NULL_STAGE
+        return _StageTimer(self, name)
+
+    def record(self, name, seconds, now=None):
+        if not self.enabled:
+            return
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = LatencyHistogram(self.window_s)
+            histogram.record(seconds, now)
+
+    def summary(self):
+        """{этап: {'count', 'mean_ms', 'p50_ms', 'p95_ms', 'p99_ms', 'max_ms'}} для этапов с замерами"""
+        with self._lock:
+            stats = {name: h.stats() for name, h in self.histograms.items()}
+        return {name: s for name, s in stats.items() if s['count']}
+
+    def snapshot(self):
+        """Счетчики всех гистограмм для передачи между процессами; после снимка они обнуляются"""
+        with self._lock:
+            snapshot = {name: (h.merged(), h.max_us) for name, h in self.histograms.items()}
+            for name in self.histograms:
+                self.histograms[name] = LatencyHistogram(self.window_s)
+        return snapshot
+
+    def merge(self, snapshot):
+        if not self.enabled or not snapshot:
+            return
+        with self._lock:
+            for name, (counts, max_us) in snapshot.items():
+                histogram = self.histograms.get(name)
+                if histogram is None:
+                    histogram = self.histograms[name] = LatencyHistogram(self.window_s)
+                histogram.add_counts(counts, max_us)
+
+    def format_summary(self):
+        summary = self.summary()
+        if not summary:
+            return "   нет замеров"
+        lines = [f"   {'этап':<12}{'n':>8}{'mean':>10}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}  мс"]
+        for name, s in summary.items():
+            lines.append(f"   {name:<12}{s['count']:>8}{s['mean_ms']:>10.2f}{s['p50_ms']:>10.2f}"
+                         f"{s['p95_ms']:>10.2f}{s['p99_ms']:>10.2f}{s['max_ms']:>10.2f}")
+        return '\n'.join(lines)
@@ -0,0 +1,22 @@
+
+import torch
+import torch.nn as nn
+
+class FocalLoss(nn.Module):
+    """Focal Loss для борьбы с дисбалансом классов"""
+    
+    def __init__(self, alpha=1, gamma=2, reduction='mean'):
+        super(FocalLoss, self).__init__()
+        self.alpha = alpha
+        self.gamma = gamma
+        self.reduction = reduction
+        
+    def forward(self, inputs, targets):
+        BCE_loss = nn.functional.cross_entropy(inputs, targets, reduction='none')
+        pt = torch.exp(-BCE_loss)
+        focal_loss = self.alpha * (1 - pt) ** self.gamma * BCE_loss
+        
+        if self.reduction == 'mean':
+            return focal_loss.mean()
+        else:
+            return focal_loss
@@ -0,0 +1,145 @@
+
+import os
+import json
+import numpy as np
+import pandas as pd
+
+# 14 патологий NIH ChestX-ray14; 'No Finding' - пустая маска
+NIH_PATHOLOGIES = [
+    'Atelectasis', 'Cardiomegaly', 'Effusion', 'Infiltration', 'Mass', 'Nodule', 'Pneumonia',
+    'Pneumothorax', 'Consolidation', 'Edema', 'Emphysema', 'Fibrosis', 'Pleural_Thickening', 'Hernia'
+]
+NO_FINDING = 'No Finding'
+
+CATEGORICAL_COLUMNS = ['Finding Labels', 'Patient Gender', 'View Position']
+INTEGER_COLUMNS = {'Follow-up #': np.int16, 'Patient ID': np.int32, 'Patient Age': np.int16}
+
+def cache_path_for(csv_path):
+    """Файл кэша рядом с CSV: Data_Entry_2017.csv -> Data_Entry_2017.parquet"""
+    return os.path.splitext(csv_path)[0] + '.parquet'
+
+def encode_pathologies(finding_labels, names):
+    """Битовая маска патологий из строк вида 'Effusion|Mass' (векторно через str.get_dummies)"""
+    dummies = finding_labels.astype(str).str.get_dummies(sep='|')
+    masks = np.zeros(len(finding_labels), np.uint32)
+    for bit, name in enumerate(names):
+        if name in dummies:
+            masks |= dummies[name].to_numpy(np.uint32) << np.uint32(bit)
+    return masks
+
+class MetadataStore:
+    """Колоночный кэш метаданных NIH (Data_Entry_2017.csv) в Parquet.
+
+    CSV разбирается один раз: категориальные столбцы хранятся как category,
+    'Finding Labels' дополнительно раскладывается в битовую маску pathology_mask.
+    Кэш пересобирается, если у CSV изменились размер или mtime.
+    """
+
+    def __init__(self, csv_path, cache_path=None):
+        self.csv_path = csv_path
+        self.cache_path = cache_path or cache_path_for(csv_path)
+        self.pathologies = list(NIH_PATHOLOGIES)
+        self.df = self._load()
+        self._masks = self.df['pathology_mask'].to_numpy()
+
+    def _source_stamp(self):
+        st = os.stat(self.csv_path)
+        return {'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+
+    def _load(self):
+        import pyarrow.parquet as pq
+
+        if not os.path.exists(self.csv_path):
+            raise FileNotFoundError(self.csv_path)
+        stamp = self._source_stamp()
+        if os.path.exists(self.cache_path):
+            try:
+                meta = json.loads(pq.read_schema(self.cache_path).metadata[b'chestxray'])
+                if meta['source'] == stamp:
+                    self.pathologies = meta['pathologies']
+                    return pd.read_parquet(self.cache_path)
+            except (OSError, KeyError, TypeError, ValueError):
+                pass
+            print(f"🔄 Метаданные {self.csv_path} изменились, пересобираем кэш")
+        return self._build(stamp)
+
+    def _build(self, stamp):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        df = pd.read_csv(self.csv_path)
+        df = df.loc[:, ~df.columns.str.startswith('Unnamed')]
+        for column, dtype in INTEGER_COLUMNS.items():
+            if column in df:
+                df[column] = pd.to_numeric(df[column], errors='coerce').fillna(-1).astype(dtype)
+        for column in CATEGORICAL_COLUMNS:
+            if column in df:
+                df[column] = df[column].astype('category')
+
+        # Патологии, которых нет в стандартном списке, добавляются в конец маски
+        findings = df['Finding Labels'] if 'Finding Labels' in df else pd.Series(NO_FINDING, index=df.index)
+        found = set(findings.astype(str).str.split('|').explode()) - {NO_FINDING}
+        self.pathologies = list(NIH_PATHOLOGIES) + sorted(found - set(NIH_PATHOLOGIES))
+        if len(self.pathologies) > 32:
+            raise ValueError(f"Слишком много разных патологий для маски uint32: {len(self.pathologies)}")
+        df['pathology_mask'] = encode_pathologies(findings, self.pathologies)
+
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        meta = json.dumps({'source': stamp, 'pathologies': self.pathologies})
+        table = table.replace_schema_metadata({**(table.schema.metadata or {}), b'chestxray': meta.encode()})
+        tmp_path = self.cache_path + '.tmp'
+        pq.write_table(table, tmp_path)
+        os.replace(tmp_path, self.cache_path)
+        print(f"🗃️ Кэш метаданных: {self.cache_path} ({len(df)} снимков, {len(self.pathologies)} патологий)")
+        return df
+
+    def mask_for(self, pathologies):
+        """Битовая маска для набора названий патологий"""
+        mask = 0
+        for name in pathologies:
+            if name not in self.pathologies:
+                raise ValueError(f"Неизвестная патология: {name}. Доступны: {', '.join(self.pathologies)}")
+            mask |= 1 << self.pathologies.index(name)
+        return np.uint32(mask)
+
+    def decode(self, mask):
+        """Названия патологий по маске"""
+        return [name for bit, name in enumerate(self.pathologies) if int(mask) >> bit & 1]
+
+    def query(self, pathologies=None, match='any', exclude=None, no_finding=None, patients=None,
+              views=None, gender=None, age_range=None):
+        """Выборка снимков по любому сочетанию условий (векторно по маскам и столбцам).
+
+        pathologies + match ('any' - хотя бы одна, 'all' - все, 'only' - ровно эти),
+        exclude - патологии, которых быть не должно, no_finding=True - только норма,
+        patients - Patient ID, views - 'PA'/'AP', age_range - (min, max) включительно.
+        """
+        selected = np.ones(len(self.df), bool)
+        masks = self._masks
+        if pathologies:
+            mask = self.mask_for(pathologies)
+            if match == 'all':
+                selected &= (masks & mask) == mask
+            elif match == 'only':
+                selected &= masks == mask
+            else:
+                selected &= (masks & mask) != 0
+        if exclude:
+            selected &= (masks & self.mask_for(exclude)) == 0
+        if no_finding is not None:
+            selected &= (masks == 0) == bool(no_finding)
+        if patients is not None:
+            selected &= np.isin(self.df['Patient ID'].to_numpy(), np.atleast_1d(patients))
+        if views is not None:
+            selected &= self.df['View Position'].isin(np.atleast_1d(views)).to_numpy()
+        if gender is not None:
+            selected &= (self.df['Patient Gender'] == gender).to_numpy()
+        if age_range is not None:
+            ages = self.df['Patient Age'].to_numpy()
+            selected &= (ages >= age_range[0]) & (ages <= age_range[1])
+        return self.df[selected]
+
+    def pathology_counts(self):
+        """Число снимков с каждой патологией"""
+        bits = (self._masks[:, None] >> np.arange(len(self.pathologies), dtype=np.uint32)) & 1
+        return pd.Series(bits.sum(axis=0), index=self.pathologies)
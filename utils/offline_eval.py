@@ -0,0 +1,216 @@
+
+import json
+import os
+import numpy as np
+
+# Пороги IoU для mAP50-95 (как в COCO и ultralytics)
+IOU_THRESHOLDS = np.linspace(0.5, 0.95, 10)
+# Точки recall для интерполированной AP (COCO, 101 точка)
+RECALL_POINTS = np.linspace(0, 1, 101)
+
+def save_predictions(path, names, image_names, image_shapes, pred, gt, meta=None):
+    """Сохранение предсказаний и разметки в сжатый .npz (атомарно, через временный файл).
+
+    pred - (индексы снимков, классы, уверенности, xyxy), gt - (индексы снимков, классы, xyxy).
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    pred_image, pred_cls, pred_conf, pred_xyxy = pred
+    gt_image, gt_cls, gt_xyxy = gt
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        np.savez_compressed(
+            f, names=np.array(names), image_names=np.array(image_names),
+            image_shapes=np.asarray(image_shapes, np.int32).reshape(-1, 2),
+            pred_image=np.asarray(pred_image, np.int32), pred_cls=np.asarray(pred_cls, np.int16),
+            pred_conf=np.asarray(pred_conf, np.float32), pred_xyxy=np.asarray(pred_xyxy, np.float32).reshape(-1, 4),
+            gt_image=np.asarray(gt_image, np.int32), gt_cls=np.asarray(gt_cls, np.int16),
+            gt_xyxy=np.asarray(gt_xyxy, np.float32).reshape(-1, 4), meta=np.array(json.dumps(meta or {})))
+    os.replace(tmp_path, path)
+    return path
+
+def box_iou_matrix(a, b):
+    """Попарный IoU боксов xyxy: [len(a), len(b)]"""
+    lt = np.maximum(a[:, None, :2], b[None, :, :2])
+    rb = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    inter = np.clip(rb - lt, 0, None).prod(axis=2)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return inter / np.maximum(area_a[:, None] + area_b[None, :] - inter, 1e-9)
+
+def _spans(image_idx, num_images):
+    """Границы [start, end) записей каждого снимка в массиве, отсортированном по снимку"""
+    bounds = np.searchsorted(image_idx, np.arange(num_images + 1))
+    return bounds[:-1], bounds[1:]
+
+class OfflineEvaluator:
+    """Оценка детектора по сохраненным предсказаниям без повторного инференса.
+
+    Сопоставление предсказаний с разметкой (жадно по убыванию уверенности, как в
+    COCO) выполняется один раз при загрузке для всех порогов IoU. Поэтому
+    отсечение по уверенности не меняет сопоставление более уверенных предсказаний,
+    и метрики для любого порога уверенности считаются масками над готовыми массивами.
+    """
+
+    def __init__(self, path, iou_thresholds=IOU_THRESHOLDS):
+        with np.load(path, allow_pickle=False) as data:
+            arrays = {key: data[key] for key in data.files}
+        self.path = path
+        self.names = [str(n) for n in arrays['names']]
+        self.nc = len(self.names)
+        self.image_names = arrays['image_names']
+        self.meta = json.loads(str(arrays['meta']))
+        self.iou_thresholds = np.asarray(iou_thresholds, np.float64)
+
+        # Сортировка по снимку, внутри снимка - по убыванию уверенности
+        order = np.lexsort((-arrays['pred_conf'], arrays['pred_image']))
+        self.pred_image = arrays['pred_image'][order]
+        self.pred_cls = arrays['pred_cls'][order].astype(np.int64)
+        self.pred_conf = arrays['pred_conf'][order]
+        self.pred_xyxy = arrays['pred_xyxy'][order]
+        order = np.argsort(arrays['gt_image'], kind='stable')
+        self.gt_image = arrays['gt_image'][order]
+        self.gt_cls = arrays['gt_cls'][order].astype(np.int64)
+        self.gt_xyxy = arrays['gt_xyxy'][order]
+        self.gt_counts = np.bincount(self.gt_cls, minlength=self.nc)
+
+        self.tp = self._match()
+
+    def _match(self):
+        """Истинно-положительные предсказания для каждого порога IoU: bool [n_pred, n_iou]"""
+        tp = np.zeros((len(self.pred_conf), len(self.iou_thresholds)), bool)
+        num_images = len(self.image_names)
+        pred_spans = zip(*_spans(self.pred_image, num_images))
+        gt_spans = zip(*_spans(self.gt_image, num_images))
+        for (p0, p1), (g0, g1) in zip(pred_spans, gt_spans):
+            if p0 == p1 or g0 == g1:
+                continue
+            iou = box_iou_matrix(self.pred_xyxy[p0:p1], self.gt_xyxy[g0:g1])
+            iou *= self.pred_cls[p0:p1, None] == self.gt_cls[None, g0:g1]
+            # Жадный проход нужен только предсказаниям, пересекающимся с разметкой своего класса
+            candidates = np.flatnonzero(iou.max(axis=1) >= self.iou_thresholds[0])
+            if not candidates.size:
+                continue
+            free = np.ones((len(self.iou_thresholds), g1 - g0), bool)
+            for i in candidates:  # уже по убыванию уверенности
+                ious = np.where(free, iou[i][None, :], -1.0)
+                best = ious.argmax(axis=1)
+                hit = ious[np.arange(len(best)), best] >= self.iou_thresholds
+                tp[p0 + i] = hit
+                free[np.flatnonzero(hit), best[hit]] = False
+        return tp
+
+    def _class_curves(self, class_id, iou_index=None):
+        """Накопленные TP/FP класса по убыванию уверенности: (уверенности, tp [n, k], fp [n, k])"""
+        idx = np.flatnonzero(self.pred_cls == class_id)
+        idx = idx[np.argsort(-self.pred_conf[idx], kind='stable')]
+        tp = self.tp[idx] if iou_index is None else self.tp[idx, iou_index:iou_index + 1]
+        tp_cum = np.cumsum(tp, axis=0)
+        fp_cum = np.arange(1, len(idx) + 1)[:, None] - tp_cum
+        return self.pred_conf[idx], tp_cum, fp_cum
+
+    def average_precision(self):
+        """AP по классам и порогам IoU [nc, n_iou]: 101-точечная интерполяция COCO"""
+        ap = np.zeros((self.nc, len(self.iou_thresholds)))
+        for c in range(self.nc):
+            n_gt = self.gt_counts[c]
+            _, tp_cum, fp_cum = self._class_curves(c)
+            if not n_gt or not len(tp_cum):
+                continue
+            recall = tp_cum / n_gt
+            precision = tp_cum / (tp_cum + fp_cum)
+            # Огибающая: точность не убывает при движении к меньшему recall
+            precision = np.maximum.accumulate(precision[::-1], axis=0)[::-1]
+            for t in range(len(self.iou_thresholds)):
+                idx = np.searchsorted(recall[:, t], RECALL_POINTS, side='left')
+                valid = idx < len(recall)
+                ap[c, t] = np.where(valid, precision[np.minimum(idx, len(recall) - 1), t], 0.0).mean()
+        return ap
+
+    def metrics(self, conf_threshold=0.25):
+        """Сводка: AP50 и AP50-95 по классам, mAP50, mAP50-95 и точка работы при conf_threshold"""
+        ap = self.average_precision()
+        present = self.gt_counts > 0
+        point = self.operating_point(conf_threshold)
+        return {
+            'per_class': {name: {'ap50': float(ap[c, 0]), 'ap50_95': float(ap[c].mean()),
+                                 'instances': int(self.gt_counts[c]), **point['per_class'][name]}
+                          for c, name in enumerate(self.names)},
+            'map50': float(ap[present, 0].mean()) if present.any() else 0.0,
+            'map50_95': float(ap[present].mean()) if present.any() else 0.0,
+            'precision': point['precision'],
+            'recall': point['recall'],
+            'conf_threshold': conf_threshold
+        }
+
+    def operating_point(self, conf_threshold, iou_index=0):
+        """Precision / recall / F1 по классам и в среднем при пороге уверенности"""
+        keep = self.pred_conf >= conf_threshold
+        tp = np.bincount(self.pred_cls[keep], weights=self.tp[keep, iou_index], minlength=self.nc)
+        predicted = np.bincount(self.pred_cls[keep], minlength=self.nc)
+        precision = np.divide(tp, predicted, out=np.zeros(self.nc), where=predicted > 0)
+        recall = np.divide(tp, self.gt_counts, out=np.zeros(self.nc), where=self.gt_counts > 0)
+        f1 = np.divide(2 * precision * recall, precision + recall, out=np.zeros(self.nc),
+                       where=precision + recall > 0)
+        present = self.gt_counts > 0
+        return {
+            'per_class': {name: {'precision': float(precision[c]), 'recall': float(recall[c]), 'f1': float(f1[c]),
+                                 'tp': int(tp[c]), 'fp': int(predicted[c] - tp[c]),
+                                 'fn': int(self.gt_counts[c] - tp[c])}
+                          for c, name in enumerate(self.names)},
+            'precision': float(precision[present].mean()) if present.any() else 0.0,
+            'recall': float(recall[present].mean()) if present.any() else 0.0,
+            'f1': float(f1[present].mean()) if present.any() else 0.0
+        }
+
+    def threshold_curves(self, thresholds=None, iou_index=0):
+        """Precision / recall / F1 по классам на сетке порогов уверенности: {'conf', 'precision', ...} [nc, n]"""
+        thresholds = np.linspace(0, 1, 101) if thresholds is None else np.asarray(thresholds)
+        curves = {key: np.zeros((self.nc, len(thresholds))) for key in ('precision', 'recall', 'f1')}
+        for c in range(self.nc):
+            conf, tp_cum, fp_cum = self._class_curves(c, iou_index)
+            # Число предсказаний с уверенностью >= порога (уверенности отсортированы по убыванию)
+            n = np.searchsorted(-conf, -thresholds, side='right')
+            tp = np.where(n > 0, tp_cum[np.maximum(n - 1, 0), 0], 0) if len(conf) else np.zeros(len(thresholds))
+            precision = np.divide(tp, n, out=np.zeros(len(thresholds)), where=n > 0)
+            recall = tp / self.gt_counts[c] if self.gt_counts[c] else np.zeros(len(thresholds))
+            curves['precision'][c], curves['recall'][c] = precision, recall
+            curves['f1'][c] = np.divide(2 * precision * recall, precision + recall,
+                                        out=np.zeros(len(thresholds)), where=precision + recall > 0)
+        curves['conf'] = thresholds
+        return curves
+
+    def best_f1_threshold(self, iou_index=0):
+        """Порог уверенности с максимальным средним по классам F1"""
+        curves = self.threshold_curves(iou_index=iou_index)
+        present = self.gt_counts > 0
+        mean_f1 = curves['f1'][present].mean(axis=0) if present.any() else curves['f1'].mean(axis=0)
+        best = int(np.argmax(mean_f1))
+        return float(curves['conf'][best]), float(mean_f1[best])
+
+    def confusion_pairs(self, conf_threshold=0.25, iou_threshold=0.5):
+        """Пары (класс разметки, предсказанный класс) для матрицы ошибок; фон - индекс nc.
+
+        Сопоставление без учета класса: жадно по IoU, как в матрице ошибок ultralytics.
+        """
+        keep = self.pred_conf >= conf_threshold
+        pred_image, pred_cls, pred_xyxy = self.pred_image[keep], self.pred_cls[keep], self.pred_xyxy[keep]
+        num_images = len(self.image_names)
+        y_true, y_pred = [], []
+        for (p0, p1), (g0, g1) in zip(zip(*_spans(pred_image, num_images)), zip(*_spans(self.gt_image, num_images))):
+            matched_pred = np.zeros(p1 - p0, bool)
+            matched_gt = np.zeros(g1 - g0, bool)
+            if p0 < p1 and g0 < g1:
+                iou = box_iou_matrix(self.gt_xyxy[g0:g1], pred_xyxy[p0:p1])
+                g, p = np.nonzero(iou >= iou_threshold)
+                order = np.argsort(-iou[g, p], kind='stable')
+                for gi, pi in zip(g[order], p[order]):
+                    if matched_gt[gi] or matched_pred[pi]:
+                        continue
+                    matched_gt[gi] = matched_pred[pi] = True
+                    y_true.append(self.gt_cls[g0 + gi])
+                    y_pred.append(pred_cls[p0 + pi])
+            y_true.extend(self.gt_cls[g0:g1][~matched_gt])
+            y_pred.extend([self.nc] * int((~matched_gt).sum()))
+            y_true.extend([self.nc] * int((~matched_pred).sum()))
+            y_pred.extend(pred_cls[p0:p1][~matched_pred])
+        return np.array(y_true, np.int64), np.array(y_pred, np.int64)
@@ -0,0 +1,177 @@
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from contextlib import contextmanager
+import numpy as np
+
+# Время доступа обновляется, только если записанное старше этого (для LRU точнее не нужно),
+# и пишется в базу пачками, а не коммитом на каждое попадание
+ACCESS_RESOLUTION_S = 60
+ACCESS_FLUSH_EVERY = 256
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    """SHA-256 файла весов; для папки (OpenVINO) - по всем файлам внутри"""
+    digest = hashlib.sha256()
+    if os.path.isdir(path):
+        files = sorted(os.path.join(root, f) for root, _, names in os.walk(path) for f in names)
+    else:
+        files = [path]
+    for file_path in files:
+        digest.update(os.path.relpath(file_path, path).encode() if os.path.isdir(path) else b'')
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+class PredictionCache:
+    """Постоянный кэш предсказаний в SQLite с LRU-вытеснением по размеру.
+
+    Ключ - хэш содержимого снимка + хэш весов модели + порог уверенности + imgsz,
+    поэтому повторно присланный снимок не прогоняется через модель, а смена
+    весов или параметров инференса автоматически дает промах.
+
+    Одну базу могут использовать несколько процессов (--workers): общий размер
+    хранится в самой базе (поддерживается триггерами) и читается внутри пишущей
+    транзакции, так что лимит соблюдается для всех процессов вместе.
+    """
+
+    def __init__(self, db_path, model_path, conf_threshold=0.5, imgsz=640, max_mb=512):
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self.db_path = db_path
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.model_hash = file_sha256(model_path)
+        self.conf_threshold = conf_threshold
+        self.imgsz = imgsz
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._pending_access = {}
+
+        # Транзакции управляются явно (BEGIN IMMEDIATE); timeout/busy_timeout - ожидание
+        # блокировки другим процессом вместо ошибки "database is locked"
+        self._conn = sqlite3.connect(db_path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute('PRAGMA busy_timeout=30000')
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        with self._transaction():
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS predictions ('
+                'key TEXT PRIMARY KEY, detections TEXT NOT NULL, '
+                'size INTEGER NOT NULL, last_access REAL NOT NULL)'
+            )
+            self._conn.execute('CREATE INDEX IF NOT EXISTS idx_last_access ON predictions(last_access)')
+            self._conn.execute('CREATE TABLE IF NOT EXISTS cache_size (id INTEGER PRIMARY KEY CHECK (id = 0), '
+                               'total INTEGER NOT NULL)')
+            # Для базы, созданной до появления счетчика, общий размер считается один раз
+            self._conn.execute('INSERT OR IGNORE INTO cache_size (id, total) '
+                               'SELECT 0, COALESCE(SUM(size), 0) FROM predictions')
+            self._conn.execute('CREATE TRIGGER IF NOT EXISTS cache_size_insert AFTER INSERT ON predictions '
+                               'BEGIN UPDATE cache_size SET total = total + NEW.size WHERE id = 0; END')
+            self._conn.execute('CREATE TRIGGER IF NOT EXISTS cache_size_delete AFTER DELETE ON predictions '
+                               'BEGIN UPDATE cache_size SET total = total - OLD.size WHERE id = 0; END')
+            self._conn.execute('CREATE TRIGGER IF NOT EXISTS cache_size_update AFTER UPDATE OF size ON predictions '
+                               'BEGIN UPDATE cache_size SET total = total + NEW.size - OLD.size WHERE id = 0; END')
+
+    @contextmanager
+    def _transaction(self):
+        """Пишущая транзакция: блокировка берется сразу, а не при первой записи"""
+        self._conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield
+        except BaseException:
+            self._conn.execute('ROLLBACK')
+            raise
+        self._conn.execute('COMMIT')
+
+    def _total_bytes(self):
+        return self._conn.execute('SELECT total FROM cache_size WHERE id = 0').fetchone()[0]
+
+    def key(self, image_bytes, conf_threshold=None):
+        """Ключ кэша для содержимого снимка при текущей модели и параметрах"""
+        conf = self.conf_threshold if conf_threshold is None else conf_threshold
+        digest = hashlib.sha256(image_bytes).hexdigest()
+        return f"{digest}:{self.model_hash}:{conf:.6f}:{self.imgsz}"
+
+    def get(self, key):
+        """Детекции из кэша или None при промахе"""
+        with self._lock:
+            row = self._conn.execute('SELECT detections, last_access FROM predictions WHERE key = ?',
+                                     (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            now = time.time()
+            if now - row[1] > ACCESS_RESOLUTION_S:
+                self._pending_access[key] = now
+                if len(self._pending_access) >= ACCESS_FLUSH_EVERY:
+                    with self._transaction():
+                        self._flush_access()
+
+        return [{
+            'class': det['class'],
+            'confidence': det['confidence'],
+            'bbox': None if det['bbox'] is None else np.array(det['bbox'], dtype=np.float32)
+        } for det in json.loads(row[0])]
+
+    def put(self, key, detections):
+        """Сохранить детекции и вытеснить давно не использованные записи сверх лимита"""
+        payload = json.dumps([{
+            'class': det['class'],
+            'confidence': det['confidence'],
+            'bbox': None if det['bbox'] is None else [float(v) for v in det['bbox']]
+        } for det in detections], ensure_ascii=False)
+        size = len(payload.encode('utf-8')) + len(key)
+
+        with self._lock, self._transaction():
+            self._flush_access()
+            # INSERT OR REPLACE удаляет старую строку - триггеры учитывают обе операции
+            self._conn.execute(
+                'INSERT OR REPLACE INTO predictions (key, detections, size, last_access) VALUES (?, ?, ?, ?)',
+                (key, payload, size, time.time())
+            )
+            total = self._total_bytes()
+            if total > self.max_bytes:
+                self._evict(total)
+
+    def _flush_access(self):
+        """Запись накопленных времен доступа (внутри транзакции)"""
+        if self._pending_access:
+            self._conn.executemany('UPDATE predictions SET last_access = ? WHERE key = ?',
+                                   [(t, key) for key, t in self._pending_access.items()])
+            self._pending_access.clear()
+
+    def _evict(self, total):
+        # Освобождаем с запасом 10%, чтобы не вытеснять на каждой вставке
+        target = self.max_bytes * 0.9
+        freed, victims = 0, []
+        for key, size in self._conn.execute('SELECT key, size FROM predictions ORDER BY last_access'):
+            if total - freed <= target:
+                break
+            victims.append((key,))
+            freed += size
+        self._conn.executemany('DELETE FROM predictions WHERE key = ?', victims)
+
+    def stats(self):
+        with self._lock:
+            entries = self._conn.execute('SELECT COUNT(*) FROM predictions').fetchone()[0]
+            total_bytes = self._total_bytes()
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+            'entries': entries,
+            'size_mb': total_bytes / (1024 * 1024)
+        }
+
+    def close(self):
+        with self._lock:
+            if self._pending_access:
+                with self._transaction():
+                    self._flush_access()
+            self._conn.close()
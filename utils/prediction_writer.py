@@ -0,0 +1,173 @@
+
+import os
+import csv
+import json
+import glob
+from collections import Counter
+
+COLUMNS = ['image', 'class', 'confidence', 'x1', 'y1', 'x2', 'y2']
+FORMATS = {'jsonl': '.jsonl', 'csv': '.csv', 'parquet': '.parquet'}
+
+def detection_rows(image, detections):
+    """Строки результата для одного снимка с числовыми координатами бокса"""
+    rows = []
+    for det in detections:
+        bbox = det['bbox']
+        x1, y1, x2, y2 = (None,) * 4 if bbox is None else (float(v) for v in bbox)
+        rows.append({
+            'image': image,
+            'class': det['class'],
+            'confidence': float(det['confidence']),
+            'x1': x1, 'y1': y1, 'x2': x2, 'y2': y2
+        })
+    return rows
+
+class PredictionWriter:
+    """Потоковая запись результатов на диск с периодическим сбросом и возобновлением.
+
+    В памяти держится только буфер до flush_every снимков и множество уже
+    обработанных имен. Снимок попадает в файл целиком: при возобновлении
+    недописанный хвост последнего снимка отбрасывается.
+    """
+
+    def __init__(self, output_dir, fmt='csv', flush_every=100, resume=False, name='predictions'):
+        if fmt not in FORMATS:
+            raise ValueError(f"Неизвестный формат: {fmt}. Доступны: {', '.join(FORMATS)}")
+        os.makedirs(output_dir, exist_ok=True)
+        self.fmt = fmt
+        self.path = os.path.join(output_dir, name + FORMATS[fmt])
+        self.flush_every = flush_every
+        self.buffer = []
+        self.buffered_images = 0
+        self.images_written = 0
+        self.class_counts = Counter()
+        self.completed = set()
+
+        if resume:
+            self.completed = self._load_completed()
+            if self.completed:
+                print(f"↩️ Возобновление: {len(self.completed)} снимков уже в {self.path}")
+        else:
+            self._reset()
+
+        self._file = None
+        self._csv = None
+        self._part = len(self._parts()) if fmt == 'parquet' else 0
+
+    def _reset(self):
+        if self.fmt == 'parquet':
+            for part in self._parts():
+                os.remove(part)
+        elif os.path.exists(self.path):
+            os.remove(self.path)
+
+    def _parts(self):
+        return sorted(glob.glob(os.path.join(self.path, 'part-*.parquet')))
+
+    def _load_completed(self):
+        """Имена снимков, уже записанных в выходной файл"""
+        if self.fmt == 'parquet':
+            import pyarrow.parquet as pq
+            completed = set()
+            for part in self._parts():
+                completed.update(pq.read_table(part, columns=['image']).column('image').to_pylist())
+            return completed
+
+        if not os.path.exists(self.path):
+            return set()
+
+        completed = set()
+        last_image, last_image_start, offset = None, 0, 0
+        header = self.fmt == 'csv'
+        with open(self.path, 'rb') as f:
+            for raw in f:
+                if not raw.endswith(b'\n'):
+                    break  # оборванная строка после падения
+                if header:
+                    header = False
+                    offset += len(raw)
+                    continue
+                try:
+                    if self.fmt == 'jsonl':
+                        image = json.loads(raw)['image']
+                    else:
+                        image = next(csv.reader([raw.decode('utf-8')]))[0]
+                except (ValueError, IndexError, StopIteration):
+                    break
+                if image != last_image:
+                    if last_image is not None:
+                        completed.add(last_image)
+                    last_image, last_image_start = image, offset
+                offset += len(raw)
+
+        # Последний снимок мог быть записан не полностью - отрезаем его строки
+        with open(self.path, 'r+b') as f:
+            f.truncate(last_image_start if last_image is not None else offset)
+        return completed
+
+    def is_done(self, image):
+        return image in self.completed
+
+    def write(self, image, detections):
+        """Добавить результаты снимка; сброс на диск каждые flush_every снимков"""
+        rows = detection_rows(image, detections)
+        self.buffer.extend(rows)
+        self.buffered_images += 1
+        self.completed.add(image)
+        self.class_counts.update(row['class'] for row in rows)
+        if self.buffered_images >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        if not self.buffer:
+            return
+        if self.fmt == 'parquet':
+            self._write_parquet_part()
+        else:
+            self._write_text()
+        self.images_written += self.buffered_images
+        self.buffer = []
+        self.buffered_images = 0
+
+    def _write_text(self):
+        if self._file is None:
+            new_file = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+            self._file = open(self.path, 'a', newline='', encoding='utf-8')
+            if self.fmt == 'csv':
+                self._csv = csv.DictWriter(self._file, fieldnames=COLUMNS)
+                if new_file:
+                    self._csv.writeheader()
+
+        if self.fmt == 'csv':
+            self._csv.writerows(self.buffer)
+        else:
+            self._file.write(''.join(json.dumps(row, ensure_ascii=False) + '\n' for row in self.buffer))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def _write_parquet_part(self):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        os.makedirs(self.path, exist_ok=True)
+        table = pa.Table.from_pylist(self.buffer, schema=pa.schema([
+            ('image', pa.string()), ('class', pa.string()), ('confidence', pa.float64()),
+            ('x1', pa.float64()), ('y1', pa.float64()), ('x2', pa.float64()), ('y2', pa.float64())
+        ]))
+        part = os.path.join(self.path, f"part-{self._part:05d}.parquet")
+        # Часть пишется во временный файл и переименовывается - после падения не остается битых частей
+        pq.write_table(table, part + '.tmp')
+        os.replace(part + '.tmp', part)
+        self._part += 1
+
+    def close(self):
+        self.flush()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
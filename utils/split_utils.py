@@ -0,0 +1,92 @@
+
+import os
+import numpy as np
+import yaml
+
+SPLIT_NAMES = ('train', 'val', 'test')
+
+def group_class_counts(presence, groups):
+    """Сводка по группам (пациентам): число снимков каждого класса и размер группы.
+
+    Дополнительный последний столбец - снимки без объектов (норма), чтобы
+    их доля тоже сохранялась в каждом сплите.
+    """
+    _, inverse = np.unique(groups, return_inverse=True)
+    columns = np.concatenate([presence, ~presence.any(axis=1, keepdims=True)], axis=1).astype(np.float64)
+    counts = np.zeros((inverse.max() + 1 if len(inverse) else 0, columns.shape[1]))
+    np.add.at(counts, inverse, columns)
+    return inverse, counts, np.bincount(inverse).astype(np.float64)
+
+def stratified_group_split(presence, groups=None, ratios=(0.7, 0.15, 0.15), seed=0):
+    """Мультилейбл-стратифицированное разбиение с группировкой (iterative stratification).
+
+    presence - матрица [снимки x классы], groups - id группы снимка (Patient ID):
+    все снимки группы попадают в один сплит. Группы раскладываются, начиная с
+    содержащих самый редкий класс, в сплит с наибольшей недостачей этого класса.
+    Возвращает номер сплита для каждого снимка.
+    """
+    presence = np.asarray(presence, bool)
+    groups = np.arange(len(presence)) if groups is None else np.asarray(groups)
+    inverse, counts, sizes = group_class_counts(presence, groups)
+    if len(sizes) == 0:
+        return np.empty(0, np.int64)
+
+    ratios = np.asarray(ratios, np.float64)
+    ratios = ratios / ratios.sum()
+    class_totals = counts.sum(axis=0)
+    need_class = ratios[:, None] * class_totals[None, :]
+    need_size = ratios * sizes.sum()
+
+    rng = np.random.default_rng(seed)
+    rare_class = np.where(counts > 0, class_totals[None, :], np.inf).argmin(axis=1)
+    order = np.lexsort((rng.random(len(sizes)), -sizes, class_totals[rare_class]))
+    jitter = rng.random((len(sizes), len(ratios))) * 1e-6
+
+    assignment = np.empty(len(sizes), np.int64)
+    for g in order:
+        # Сплит с наибольшей недостачей самого редкого класса группы, при равенстве - по размеру
+        need = need_class[:, rare_class[g]]
+        candidates = np.isclose(need, need.max())
+        split = int(np.argmax(np.where(candidates, need_size + jitter[g], -np.inf)))
+        assignment[g] = split
+        need_class[split] -= counts[g]
+        need_size[split] -= sizes[g]
+    return assignment[inverse]
+
+def stratified_group_kfold(presence, groups=None, k=5, seed=0):
+    """Номер фолда (0..k-1) для каждого снимка с той же стратификацией и группировкой"""
+    return stratified_group_split(presence, groups, ratios=[1.0] * k, seed=seed)
+
+def split_class_distribution(presence, assignment, split_names, class_names):
+    """Число снимков каждого класса по сплитам - для контроля стратификации"""
+    import pandas as pd
+
+    presence = np.asarray(presence, bool)
+    columns = np.concatenate([presence, ~presence.any(axis=1, keepdims=True)], axis=1)
+    table = pd.DataFrame(columns.astype(np.int64), columns=list(class_names) + ['no_findings'])
+    table['images'] = 1
+    table = table.groupby(assignment).sum()
+    table.index = [split_names[i] for i in table.index]
+    return table
+
+def write_image_list(paths, output_path):
+    """YOLO-список снимков (абсолютные пути, по одному на строку)"""
+    os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+    tmp_path = output_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write(''.join(os.path.abspath(p) + '\n' for p in paths))
+    os.replace(tmp_path, output_path)
+    return output_path
+
+def write_split_data_yaml(data_yaml, lists, output_path):
+    """Копия data.yaml, где train/val/test указывают на списки снимков"""
+    config = {}
+    if os.path.exists(data_yaml):
+        with open(data_yaml, 'r') as f:
+            config = yaml.safe_load(f) or {}
+    config.pop('path', None)
+    for split, image_list in lists.items():
+        config[split] = os.path.abspath(image_list)
+    with open(output_path, 'w') as f:
+        yaml.dump(config, f, default_flow_style=False)
+    return output_path
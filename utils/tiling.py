@@ -0,0 +1,78 @@
+
+import numpy as np
+
+MERGE_METHODS = ('nms', 'wbf')
+
+def tile_grid(height, width, tile_size=640, overlap=0.2):
+    """Координаты тайлов (x0, y0, x1, y1) с перекрытием overlap (доля тайла).
+
+    Последний тайл в ряду прижимается к краю снимка, поэтому все тайлы одного
+    размера и идут в модель одним батчем; снимок меньше тайла - один тайл.
+    """
+    if not 0 <= overlap < 1:
+        raise ValueError(f"overlap должен быть в [0, 1): {overlap}")
+
+    def starts(length):
+        if length <= tile_size:
+            return [0]
+        stride = max(1, int(round(tile_size * (1 - overlap))))
+        positions = list(range(0, length - tile_size, stride))
+        return positions + [length - tile_size]
+
+    tile_h, tile_w = min(tile_size, height), min(tile_size, width)
+    return [(x, y, x + tile_w, y + tile_h) for y in starts(height) for x in starts(width)]
+
+def box_iou(box, boxes):
+    """IoU одного бокса xyxy с массивом боксов [n, 4]"""
+    x0 = np.maximum(box[0], boxes[:, 0])
+    y0 = np.maximum(box[1], boxes[:, 1])
+    x1 = np.minimum(box[2], boxes[:, 2])
+    y1 = np.minimum(box[3], boxes[:, 3])
+    inter = np.clip(x1 - x0, 0, None) * np.clip(y1 - y0, 0, None)
+    area = (box[2] - box[0]) * (box[3] - box[1])
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    return inter / np.maximum(area + areas - inter, 1e-9)
+
+def _clusters(boxes, scores, classes, iou_threshold):
+    """Жадная группировка по убыванию уверенности внутри каждого класса: списки индексов"""
+    clusters = []
+    for class_id in np.unique(classes):
+        idx = np.flatnonzero(classes == class_id)
+        idx = idx[np.argsort(-scores[idx], kind='stable')]
+        while idx.size:
+            overlaps = box_iou(boxes[idx[0]], boxes[idx]) >= iou_threshold
+            clusters.append(idx[overlaps])
+            idx = idx[~overlaps]
+    return clusters
+
+def nms(boxes, scores, classes, iou_threshold=0.5):
+    """NMS по классам: остается самый уверенный бокс каждой группы перекрывающихся"""
+    keep = [cluster[0] for cluster in _clusters(boxes, scores, classes, iou_threshold)]
+    keep = np.array(sorted(keep, key=lambda i: -scores[i]), np.int64)
+    return boxes[keep], scores[keep], classes[keep]
+
+def weighted_boxes_fusion(boxes, scores, classes, iou_threshold=0.5):
+    """WBF по классам: бокс группы - среднее координат с весами-уверенностями,
+    уверенность - средняя по группе. В отличие от NMS не теряет точность
+    рамок, когда объект целиком виден только в части перекрывающихся тайлов."""
+    fused_boxes, fused_scores, fused_classes = [], [], []
+    for cluster in _clusters(boxes, scores, classes, iou_threshold):
+        weights = scores[cluster]
+        fused_boxes.append((boxes[cluster] * weights[:, None]).sum(axis=0) / weights.sum())
+        fused_scores.append(weights.mean())
+        fused_classes.append(classes[cluster[0]])
+    if not fused_boxes:
+        return boxes[:0], scores[:0], classes[:0]
+    order = np.argsort(-np.array(fused_scores), kind='stable')
+    return (np.array(fused_boxes, np.float32)[order], np.array(fused_scores, np.float32)[order],
+            np.array(fused_classes, classes.dtype)[order])
+
+def merge_detections(boxes, scores, classes, method='nms', iou_threshold=0.5):
+    """Объединение детекций со всех тайлов (координаты уже в системе полного снимка)"""
+    if method not in MERGE_METHODS:
+        raise ValueError(f"Неизвестный метод объединения: {method}. Доступны: {', '.join(MERGE_METHODS)}")
+    if len(boxes) == 0:
+        return boxes, scores, classes
+    merge = nms if method == 'nms' else weighted_boxes_fusion
+    return merge(np.asarray(boxes, np.float32), np.asarray(scores, np.float32), np.asarray(classes),
+                 iou_threshold)
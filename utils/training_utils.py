@@ -1,8 +1,18 @@
 
+import os
+import json
 import psutil
 import torch
 import time
-from ultralytics import YOLO
+import yaml
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+# Ключи конфига, которые описывают датасет и модель, а не аргументы model.train()
+DATASET_KEYS = {'path', 'train', 'val', 'test', 'nc', 'names', 'imbalance_strategy'}
+MODEL_KEYS = {'model', 'weights'}
+# Не аргументы ultralytics: число потоков torch и результаты автотюнинга
+EXTRA_KEYS = {'threads', 'autotune'}
 
 def check_system_resources():
     """Проверка доступных системных ресурсов"""
@@ -36,16 +46,333 @@ def get_optimal_config(ram_gb, has_gpu):
         print("🔥 Используем продвинутую конфигурацию")
         return "configs/clavicle_config.yaml"
 
-def monitor_training_progress():
-    """Мониторинг прогресса обучения"""
-    start_time = time.time()
-    
-    def callback(trainer):
-        elapsed = time.time() - start_time
-        epoch = trainer.epoch
-        total_epochs = trainer.epochs
-        
-        if epoch % 5 == 0:
-            print(f"⏱️ Эпоха {epoch}/{total_epochs} | Прошло времени: {elapsed/60:.1f} мин")
-    
-    return callback
+def load_training_config(config_path, has_gpu=None):
+    """Чтение конфига обучения: (модель, аргументы model.train(), число потоков torch).
+
+    Все гиперпараметры берутся из конфига; неизвестные ultralytics ключи
+    пропускаются с предупреждением, device 0 на машине без GPU заменяется на cpu.
+    """
+    from ultralytics.cfg import DEFAULT_CFG_DICT
+
+    with open(config_path, 'r') as f:
+        config = yaml.safe_load(f) or {}
+
+    model_name = config.get('model') or config.get('weights') or 'yolov8s.pt'
+    train_args, ignored = {}, []
+    for key, value in config.items():
+        if key in DATASET_KEYS or key in MODEL_KEYS or key in EXTRA_KEYS:
+            continue
+        if key in DEFAULT_CFG_DICT:
+            train_args[key] = value
+        else:
+            ignored.append(key)
+    if ignored:
+        print(f"⚠️ Ключи конфига не поддерживаются ultralytics и пропущены: {', '.join(ignored)}")
+
+    has_gpu = torch.cuda.is_available() if has_gpu is None else has_gpu
+    device = train_args.get('device')
+    if not has_gpu and device is not None and str(device).lower() not in ('cpu', 'mps'):
+        print(f"⚠️ device={device} в конфиге, но GPU нет - обучаем на CPU")
+        train_args['device'] = 'cpu'
+
+    return model_name, train_args, config.get('threads')
+
+def process_rss_gb():
+    """RSS процесса вместе с воркерами даталоадера, ГБ"""
+    process = psutil.Process()
+    total = process.memory_info().rss
+    for child in process.children(recursive=True):
+        try:
+            total += child.memory_info().rss
+        except psutil.NoSuchProcess:
+            continue
+    return total / 1024 ** 3
+
+class _ProbeFinished(Exception):
+    """Прерывание замера: иначе после trainer.stop ultralytics еще валидирует и сохраняет модель"""
+
+def probe_training_throughput(model_name, data_path, train_args, batch, workers, threads,
+                              probe_batches=8, warmup_batches=2):
+    """Короткий замер обучения: снимков/с и пиковая память (лучше запускать в отдельном процессе)"""
+    from ultralytics import YOLO
+
+    torch.set_num_threads(threads)
+    model = YOLO(model_name)
+    stamps, peak = [], [0.0]
+
+    def on_train_batch_end(trainer):
+        stamps.append(time.perf_counter())
+        peak[0] = max(peak[0], process_rss_gb())
+        if len(stamps) >= warmup_batches + probe_batches:
+            raise _ProbeFinished
+
+    model.add_callback('on_train_batch_end', on_train_batch_end)
+    args = {**train_args, 'batch': batch, 'workers': workers, 'epochs': 1, 'val': False, 'save': False,
+            'plots': False, 'exist_ok': True, 'name': 'autotune', 'verbose': False}
+    try:
+        model.train(data=data_path, **args)
+    except _ProbeFinished:
+        pass
+
+    measured = stamps[warmup_batches:] if len(stamps) > warmup_batches + 1 else stamps
+    if len(measured) < 2:
+        return 0.0, peak[0]
+    return batch * (len(measured) - 1) / (measured[-1] - measured[0]), peak[0]
+
+def autotune_training(config_path, data_path, ram_gb, has_gpu=None, batch_sizes=(4, 8, 16, 32),
+                      probe_batches=8, output_path=None):
+    """Подбор batch, workers и числа потоков torch по снимкам/с в пределах RAM.
+
+    Координатный поиск вместо полного перебора: сначала потоки, затем воркеры
+    даталоадера, затем batch (по возрастанию, пока пиковая память укладывается
+    в 80% RAM из check_system_resources). Каждый замер - в отдельном процессе,
+    чтобы память и потоки прошлых замеров не влияли на следующий. Результат
+    записывается производным конфигом рядом с исходным. Если ни один замер не
+    удался (или ни один не уложился в память), конфиг не пишется - RuntimeError.
+    """
+    has_gpu = torch.cuda.is_available() if has_gpu is None else has_gpu
+    model_name, train_args, _ = load_training_config(config_path, has_gpu)
+    budget_gb = ram_gb * 0.8
+    cpus = os.cpu_count() or 1
+    # Ключ (batch, workers, threads) -> (снимков/с, пик памяти ГБ) или None, если замер не удался
+    results = {}
+
+    def probe(batch, workers, threads):
+        key = (batch, workers, threads)
+        if key not in results:
+            print(f"🔬 Замер: batch={batch}, workers={workers}, threads={threads}")
+            try:
+                with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as pool:
+                    results[key] = pool.submit(probe_training_throughput, model_name, data_path, train_args,
+                                               batch, workers, threads, probe_batches).result()
+            except Exception as e:
+                print(f"   ⚠️ Замер не удался: {e}")
+                results[key] = None
+                return 0.0
+            speed, rss = results[key]
+            print(f"   {speed:.1f} снимков/с, пик памяти {rss:.1f} ГБ")
+        if results[key] is None:
+            return 0.0
+        speed, rss = results[key]
+        return speed if rss <= budget_gb else 0.0
+
+    batch = train_args.get('batch', 8)
+    workers = train_args.get('workers', 2)
+    threads = max(set([cpus, max(1, cpus // 2)]), key=lambda t: probe(batch, workers, t))
+    workers = max(sorted(set([0, 2, min(4, cpus), min(8, cpus)])), key=lambda w: probe(batch, w, threads))
+    best_batch = batch
+    for candidate in sorted(set(batch_sizes) | {batch}):
+        if probe(candidate, workers, threads) == 0.0:
+            break
+        if probe(candidate, workers, threads) > probe(best_batch, workers, threads):
+            best_batch = candidate
+
+    if probe(best_batch, workers, threads) == 0.0:
+        # Координатный поиск мог остановиться на неудачном замере - берем лучший из удачных
+        usable = [key for key in results if probe(*key) > 0.0]
+        if not usable:
+            raise RuntimeError(f"Автотюнинг не удался: ни один из {len(results)} замеров не дал результата "
+                               f"в пределах {budget_gb:.1f} ГБ - проверьте {data_path} и {config_path}")
+        best_batch, workers, threads = max(usable, key=lambda key: probe(*key))
+
+    speed, rss = results[(best_batch, workers, threads)]
+    print(f"🏁 Лучшее: batch={best_batch}, workers={workers}, threads={threads} - "
+          f"{speed:.1f} снимков/с, {rss:.1f} ГБ из {budget_gb:.1f} ГБ")
+
+    with open(config_path, 'r') as f:
+        config = yaml.safe_load(f) or {}
+    config.update({'batch': best_batch, 'workers': workers, 'threads': threads,
+                   'autotune': {'images_per_sec': round(speed, 2), 'peak_rss_gb': round(rss, 2),
+                                'source_config': config_path}})
+    if not has_gpu:
+        config['device'] = 'cpu'
+    output_path = output_path or os.path.splitext(config_path)[0] + '_autotuned.yaml'
+    with open(output_path, 'w') as f:
+        yaml.dump(config, f, default_flow_style=False, sort_keys=False)
+    print(f"✅ Производный конфиг: {output_path}")
+    return output_path
+
+class TrainingTelemetry:
+    """Телеметрия производительности обучения через колбэки тренера YOLO.
+
+    За каждую эпоху: ожидание даталоадера, подготовка батча, forward,
+    backward (вместе с шагом оптимизатора), валидация, снимков/с, пиковая RSS
+    (процесс + воркеры даталоадера) и загрузка CPU. Forward отделяется от
+    backward хуками на модели тренера; на GPU перед отметками времени
+    выполняется синхронизация, иначе асинхронные ядра попали бы не в ту фазу.
+    Записи дописываются в JSONL, последняя эпоха - в текстовый файл Prometheus
+    (для textfile collector node_exporter), который перезаписывается атомарно.
+    """
+
+    PROMETHEUS_METRICS = {
+        'epoch': ('Последняя завершенная эпоха', 'epoch'),
+        'epoch_s': ('Длительность эпохи, с', 'epoch_seconds'),
+        'dataloader_wait_s': ('Ожидание даталоадера за эпоху, с', 'dataloader_wait_seconds'),
+        'preprocess_s': ('Подготовка батчей за эпоху, с', 'preprocess_seconds'),
+        'forward_s': ('Forward за эпоху, с', 'forward_seconds'),
+        'backward_s': ('Backward и шаг оптимизатора за эпоху, с', 'backward_seconds'),
+        'val_s': ('Валидация за эпоху, с', 'validation_seconds'),
+        'images_per_sec': ('Снимков в секунду на обучении', 'images_per_second'),
+        'peak_rss_gb': ('Пиковая RSS процесса и воркеров, ГБ', 'peak_rss_gigabytes'),
+        'cpu_percent': ('Загрузка CPU процессом и воркерами, % от всех ядер', 'cpu_percent'),
+    }
+
+    def __init__(self, output_dir=None, prometheus_path=None, run_name=None, rss_every=10, print_every=5):
+        self.output_dir = output_dir
+        self.prometheus_path = prometheus_path
+        self.run_name = run_name
+        self.rss_every = max(1, rss_every)
+        self.print_every = print_every
+        self.jsonl_path = None
+        self.records = []
+        self._process = psutil.Process()
+        self._hooks = []
+        self._sync = False
+        self._epoch_start = None
+        self._train_start = time.perf_counter()
+
+    def attach(self, model):
+        for event in ('on_train_start', 'on_train_epoch_start', 'on_train_batch_start', 'on_train_batch_end',
+                      'on_val_start', 'on_val_end', 'on_fit_epoch_end', 'on_train_end'):
+            model.add_callback(event, getattr(self, event))
+        return self
+
+    def _now(self):
+        if self._sync:
+            torch.cuda.synchronize()
+        return time.perf_counter()
+
+    def _cpu_seconds(self):
+        """Процессорное время процесса и живых воркеров; у воркеров - накопленное по pid"""
+        times = self._process.cpu_times()
+        total = times.user + times.system
+        for child in self._process.children(recursive=True):
+            try:
+                times = child.cpu_times()
+            except psutil.NoSuchProcess:
+                continue
+            self._children_cpu[child.pid] = times.user + times.system
+        return total + sum(self._children_cpu.values())
+
+    def on_train_start(self, trainer):
+        self._sync = trainer.device.type == 'cuda'
+        self.run_name = self.run_name or trainer.args.name or os.path.basename(str(trainer.save_dir))
+        output_dir = self.output_dir or str(trainer.save_dir)
+        os.makedirs(output_dir, exist_ok=True)
+        self.jsonl_path = os.path.join(output_dir, 'telemetry.jsonl')
+        self.prometheus_path = self.prometheus_path or os.path.join(output_dir, 'telemetry.prom')
+        self._children_cpu = {}
+        self._train_start = time.perf_counter()
+        self._hooks = [trainer.model.register_forward_pre_hook(self._forward_start),
+                       trainer.model.register_forward_hook(self._forward_end)]
+
+    def _forward_start(self, module, args):
+        if self._epoch_start is None:
+            return
+        now = self._now()
+        self._epoch['preprocess_s'] += now - self._batch_start
+        self._forward_at = now
+        inputs = args[0] if args else None
+        images = inputs.get('img') if isinstance(inputs, dict) else inputs
+        if images is not None and hasattr(images, 'shape'):
+            self._epoch['images'] += images.shape[0]
+
+    def _forward_end(self, module, args, output):
+        if self._epoch_start is None:
+            return
+        now = self._now()
+        self._epoch['forward_s'] += now - self._forward_at
+        self._forward_done = now
+
+    def on_train_epoch_start(self, trainer):
+        self._epoch = dict.fromkeys(('dataloader_wait_s', 'preprocess_s', 'forward_s', 'backward_s', 'val_s'), 0.0)
+        self._epoch.update(images=0, batches=0, peak_rss_gb=process_rss_gb())
+        self._epoch_start = self._last_batch_end = self._now()
+        self._cpu_start = self._cpu_seconds()
+        psutil.cpu_percent(interval=None)
+
+    def on_train_batch_start(self, trainer):
+        self._batch_start = self._now()
+        self._forward_done = None
+        self._epoch['dataloader_wait_s'] += self._batch_start - self._last_batch_end
+
+    def on_train_batch_end(self, trainer):
+        now = self._now()
+        if self._forward_done is not None:
+            self._epoch['backward_s'] += now - self._forward_done
+        self._epoch['batches'] += 1
+        if self._epoch['batches'] % self.rss_every == 0:
+            self._epoch['peak_rss_gb'] = max(self._epoch['peak_rss_gb'], process_rss_gb())
+        self._last_batch_end = now
+
+    def on_val_start(self, validator):
+        self._val_start = self._now()
+
+    def on_val_end(self, validator):
+        val_s = self._now() - self._val_start
+        if self._epoch_start is not None:
+            self._epoch['val_s'] += val_s
+        else:
+            self._final_val_s = val_s
+
+    def on_fit_epoch_end(self, trainer):
+        if self._epoch_start is None:
+            # Повторный вызов после финальной валидации best.pt
+            self._write({'event': 'final_val', 'val_s': round(getattr(self, '_final_val_s', 0.0), 3)})
+            return
+        epoch_s = self._now() - self._epoch_start
+        record = {'event': 'epoch', 'epoch': trainer.epoch + 1, 'epochs': trainer.epochs, 'epoch_s': epoch_s,
+                  **self._epoch}
+        train_s = record['dataloader_wait_s'] + record['preprocess_s'] + record['forward_s'] + record['backward_s']
+        cpu_s = self._cpu_seconds() - self._cpu_start
+        record.update(
+            images_per_sec=record['images'] / train_s if train_s else 0.0,
+            peak_rss_gb=max(record['peak_rss_gb'], process_rss_gb()),
+            cpu_percent=100 * cpu_s / (epoch_s * (os.cpu_count() or 1)) if epoch_s else 0.0,
+            system_cpu_percent=psutil.cpu_percent(interval=None),
+        )
+        if self._sync:
+            record['gpu_peak_gb'] = torch.cuda.max_memory_allocated() / 1024 ** 3
+        record = {k: round(v, 3) if isinstance(v, float) else v for k, v in record.items()}
+        self._epoch_start = None
+        self._write(record)
+        self._write_prometheus(record)
+
+        if self.print_every and (record['epoch'] % self.print_every == 0 or record['epoch'] == record['epochs']):
+            elapsed = time.perf_counter() - self._train_start
+            print(f"⏱️ Эпоха {record['epoch']}/{record['epochs']} | Прошло времени: {elapsed / 60:.1f} мин | "
+                  f"{record['images_per_sec']:.1f} снимков/с | даталоадер {record['dataloader_wait_s']:.1f} с, "
+                  f"forward {record['forward_s']:.1f} с, backward {record['backward_s']:.1f} с, "
+                  f"валидация {record['val_s']:.1f} с | RSS {record['peak_rss_gb']:.1f} ГБ, "
+                  f"CPU {record['cpu_percent']:.0f}%")
+
+    def on_train_end(self, trainer):
+        for hook in self._hooks:
+            hook.remove()
+        self._hooks = []
+
+    def _write(self, record):
+        record = {'run': self.run_name, 'time': time.time(), **record}
+        self.records.append(record)
+        with open(self.jsonl_path, 'a') as f:
+            f.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+    def _write_prometheus(self, record):
+        run = str(self.run_name).replace('\\', '\\\\').replace('"', '\\"')
+        lines = []
+        for key, (help_text, name) in self.PROMETHEUS_METRICS.items():
+            metric = f"chestxray_train_{name}"
+            lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} gauge",
+                      f'{metric}{{run="{run}"}} {record[key]}']
+        tmp_path = self.prometheus_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        os.replace(tmp_path, self.prometheus_path)
+
+def monitor_training_progress(model, output_dir=None, prometheus_path=None, print_every=5):
+    """Мониторинг прогресса обучения: подключает TrainingTelemetry к колбэкам модели.
+
+    По умолчанию telemetry.jsonl и telemetry.prom пишутся в папку запуска
+    (runs/detect/<name>); сводка печатается раз в print_every эпох.
+    """
+    return TrainingTelemetry(output_dir, prometheus_path, print_every=print_every).attach(model)